@@ -0,0 +1,182 @@
+"""
+Stand-ins for the kernel manager and sidecar client, so benchmarks measure JupyChat itself.
+
+Classes:
+- FakeMultiKernelManager: Hands out kernel IDs without starting any processes.
+- FakeSidecarClient: Replays scripted output messages to the handlers of each execute request.
+
+Functions:
+- stream_message, display_message, execute_result_message, error_message: Build the messages
+  a script returns.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Callable
+
+from kernel_sidecar import actions
+from kernel_sidecar.handlers.base import Handler
+from kernel_sidecar.models import messages
+
+
+def _envelope(msg_type: str) -> dict:
+    header = {
+        "date": datetime.now(timezone.utc),
+        "msg_id": uuid.uuid4().hex,
+        "msg_type": msg_type,
+        "session": "benchmark",
+        "username": "benchmark",
+        "version": "5.3",
+    }
+    return {
+        "header": header,
+        "parent_header": header,
+        "msg_id": header["msg_id"],
+        "msg_type": msg_type,
+    }
+
+
+def stream_message(text: str, name: str = "stdout") -> messages.Stream:
+    return messages.Stream(**_envelope("stream"), content={"name": name, "text": text})
+
+
+def display_message(data: dict) -> messages.DisplayData:
+    return messages.DisplayData(**_envelope("display_data"), content={"data": data})
+
+
+def execute_result_message(data: dict) -> messages.ExecuteResult:
+    return messages.ExecuteResult(
+        **_envelope("execute_result"), content={"data": data, "execution_count": 1}
+    )
+
+
+def error_message(ename: str, evalue: str) -> messages.Error:
+    return messages.Error(
+        **_envelope("error"), content={"ename": ename, "evalue": evalue, "traceback": []}
+    )
+
+
+def _execute_reply_message(status: messages.CellStatus) -> messages.ExecuteReply:
+    return messages.ExecuteReply(
+        **_envelope("execute_reply"), content={"status": status, "execution_count": 1}
+    )
+
+
+def echo_script(code: str) -> list[messages.Message]:
+    return [stream_message(code)]
+
+
+class FakeMultiKernelManager:
+    """Implements the parts of `AsyncMultiKernelManager` that `JupyChatKernelClient` uses."""
+
+    def __init__(self, start_latency: float = 0) -> None:
+        self.start_latency = start_latency
+        self.kernel_ids: set[str] = set()
+
+    def __contains__(self, kernel_id: str) -> bool:
+        return kernel_id in self.kernel_ids
+
+    async def start_kernel(self, kernel_name: str | None = None, **kwargs) -> str:
+        await asyncio.sleep(self.start_latency)
+        kernel_id = kwargs.get("kernel_id") or str(uuid.uuid4())
+        self.kernel_ids.add(kernel_id)
+        return kernel_id
+
+    def get_connection_info(self, kernel_id: str) -> dict:
+        return {"kernel_id": kernel_id, "transport": "fake", "key": b""}
+
+    async def shutdown_kernel(self, kernel_id: str, now: bool = False) -> None:
+        self.kernel_ids.discard(kernel_id)
+
+    async def interrupt_kernel(self, kernel_id: str) -> None:
+        pass
+
+    async def restart_kernel(self, kernel_id: str, now: bool = False) -> None:
+        pass
+
+    async def is_alive(self, kernel_id: str) -> bool:
+        return kernel_id in self.kernel_ids
+
+    def list_kernel_ids(self) -> list[str]:
+        return list(self.kernel_ids)
+
+    async def signal_kernel(self, kernel_id: str, signum: int) -> None:
+        pass
+
+    async def cleanup_resources(self, kernel_id: str, restart: bool = False) -> None:
+        pass
+
+    def remove_kernel(self, kernel_id: str) -> None:
+        self.kernel_ids.discard(kernel_id)
+
+
+class FakeSidecarClient:
+    """Implements the parts of `KernelSidecarClient` that `JupyChatKernelClient` uses.
+
+    Executing code calls `script` with the code and sends the messages it returns to the
+    handlers, followed by an `execute_reply`. The reply is an error if the script returned an
+    error message. Set `script` on the class to change what all kernels output.
+    """
+
+    script: Callable[[str], list[messages.Message]] = staticmethod(echo_script)
+
+    def __init__(self, connection_info: dict) -> None:
+        self.connection_info = connection_info
+        self._lock = asyncio.Lock()
+        self._pending = 0
+        self._aborting = False
+
+    async def __aenter__(self) -> "FakeSidecarClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        pass
+
+    async def kernel_info_request(self, handlers: list[Handler] | None = None) -> None:
+        pass
+
+    async def interrupt_request(self, handlers: list[Handler] | None = None) -> None:
+        pass
+
+    async def shutdown_request(
+        self, restart: bool = True, handlers: list[Handler] | None = None
+    ) -> None:
+        pass
+
+    def execute_request(
+        self, code: str, silent: bool = False, handlers: list[Handler] | None = None
+    ):
+        return self._schedule(code, handlers or [], stop_on_error=True)
+
+    def send(self, action: actions.KernelAction) -> asyncio.Task:
+        """Runs an execute request, scheduled right away like the real client sends it."""
+        content = action.request.content
+        return self._schedule(content.code, action.handlers, content.stop_on_error)
+
+    def _schedule(self, code: str, handlers: list[Handler], stop_on_error: bool) -> asyncio.Task:
+        self._pending += 1
+        return asyncio.ensure_future(self._execute(code, handlers, stop_on_error))
+
+    async def _execute(self, code: str, handlers: list[Handler], stop_on_error: bool) -> None:
+        # Like a kernel, run requests one at a time and, after a failed request that asked for
+        # it, abort the requests already queued
+        async with self._lock:
+            self._pending -= 1
+            status = messages.CellStatus.aborted if self._aborting else messages.CellStatus.ok
+            if status == messages.CellStatus.ok:
+                for msg in self.script(code):
+                    if isinstance(msg, messages.Error):
+                        status = messages.CellStatus.error
+                    for handler in handlers:
+                        await handler(msg)
+                    # Outputs arrive one socket read at a time, let other requests run in between
+                    await asyncio.sleep(0)
+            if status == messages.CellStatus.error and stop_on_error:
+                self._aborting = True
+            if not self._pending:
+                self._aborting = False
+
+            reply = _execute_reply_message(status)
+            for handler in handlers:
+                await handler(reply)
+                await handler.action_complete()
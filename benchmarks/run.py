@@ -0,0 +1,401 @@
+"""
+Benchmarks for the JupyChat API, run in-process against the ASGI app.
+
+By default kernels are faked (see `benchmarks.fake_kernel`), so the numbers show the cost of
+JupyChat itself: routing, auth, queueing, output collection and formatting, image storage.
+With `--real`, cells run on local ipykernels instead.
+
+Usage:
+
+    python -m benchmarks.run [--real] [--requests 500] [--concurrency 16] [--json results.json]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import AsyncIterator, Awaitable, Callable
+
+import jwt
+import structlog
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+AUDIENCE = "https://example.com/jupychat"
+KEY_ID = "benchmark"
+
+
+@dataclass
+class Scenario:
+    """What a benchmarked cell outputs, either scripted for the fake kernel or as real code."""
+
+    name: str
+    stdout_bytes: int = 0
+    chunk_bytes: int = 64 * 1024
+    html_displays: int = 0
+    html_bytes: int = 10_000
+    table_rows: int = 0
+    images: int = 0
+    image_bytes: int = 100_000
+    result: bool = False
+
+    def _table(self) -> str:
+        rows = "".join(
+            "<tr><td>%d</td><td>%d</td></tr>" % (i, i * 2) for i in range(self.table_rows)
+        )
+        return f"<table><tbody>{rows}</tbody></table>"
+
+    def _image(self, index: int) -> bytes:
+        return bytes((index + i) % 256 for i in range(256)) * (self.image_bytes // 256)
+
+    @property
+    def code(self) -> str:
+        lines = ["import sys", "from IPython.display import HTML, Image, display"]
+        if self.stdout_bytes:
+            lines += [
+                f"for size in [{self.chunk_bytes}] * {self.stdout_bytes // self.chunk_bytes}:",
+                "    sys.stdout.write('x' * size)",
+            ]
+        if self.html_displays:
+            lines += [
+                f"for _ in range({self.html_displays}):",
+                f"    display(HTML('<p>' + 'x' * {self.html_bytes} + '</p>'))",
+            ]
+        if self.table_rows:
+            lines += [
+                "rows = ''.join('<tr><td>%d</td><td>%d</td></tr>' % (i, i * 2)"
+                f" for i in range({self.table_rows}))",
+                "display(HTML('<table><tbody>' + rows + '</tbody></table>'))",
+            ]
+        if self.images:
+            lines += [
+                f"for index in range({self.images}):",
+                "    data = bytes((index + i) % 256 for i in range(256))"
+                f" * ({self.image_bytes} // 256)",
+                "    display(Image(data=data, format='png'))",
+            ]
+        if self.result:
+            lines.append("42")
+        return f"# scenario: {self.name}\n" + "\n".join(lines)
+
+    def messages(self) -> list:
+        from benchmarks.fake_kernel import display_message, execute_result_message, stream_message
+
+        outputs = [
+            stream_message("x" * self.chunk_bytes)
+            for _ in range(self.stdout_bytes // self.chunk_bytes)
+        ]
+        outputs += [
+            display_message({"text/html": f"<p>{'x' * self.html_bytes}</p>", "text/plain": "HTML"})
+            for _ in range(self.html_displays)
+        ]
+        if self.table_rows:
+            outputs.append(
+                display_message(
+                    {"text/html": self._table(), "text/plain": "<IPython.core.display.HTML object>"}
+                )
+            )
+        outputs += [
+            display_message(
+                {
+                    "image/png": base64.b64encode(self._image(index)).decode(),
+                    "text/plain": "<IPython.core.display.Image object>",
+                }
+            )
+            for index in range(self.images)
+        ]
+        if self.result:
+            outputs.append(execute_result_message({"text/plain": "42"}))
+        return outputs
+
+
+SCENARIOS = [
+    Scenario("small", stdout_bytes=100, chunk_bytes=100, result=True),
+    Scenario("stdout_1mb", stdout_bytes=1024 * 1024),
+    Scenario("html_displays", html_displays=20),
+    Scenario("html_table", table_rows=10_000),
+    Scenario("images", images=4),
+]
+
+
+@dataclass
+class Result:
+    name: str
+    requests: int
+    errors: int
+    throughput: float
+    p50_ms: float
+    p99_ms: float
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def measure(
+    name: str,
+    send: Callable[[int], Awaitable[int]],
+    requests: int,
+    concurrency: int,
+    warmup: int,
+) -> Result:
+    """Calls `send(i)` `requests` times, `concurrency` at a time, and times each call.
+
+    `send` returns the response status code, anything but 2xx or 304 counts as an error.
+    """
+    for i in range(warmup):
+        await send(i)
+
+    latencies: list[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index, errors
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            started_at = time.perf_counter()
+            status_code = await send(i)
+            latencies.append(time.perf_counter() - started_at)
+            if not (200 <= status_code < 300 or status_code == 304):
+                errors += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+    return Result(
+        name=name,
+        requests=requests,
+        errors=errors,
+        throughput=requests / elapsed,
+        p50_ms=percentile(latencies, 0.5) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+    )
+
+
+def serve_jwks(jwks: dict) -> str:
+    """Serves the JWKS from a local HTTP server in a background thread, returns its URL."""
+    body = json.dumps(jwks).encode()
+
+    class JWKSHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), JWKSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/.well-known/jwks.json"
+
+
+def configure_environment(real: bool) -> rsa.RSAPrivateKey:
+    """Points the settings at a local JWKS, before anything imports the settings.
+
+    Returns the private key to sign tokens with.
+    """
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwks = {"keys": [{**jwk, "kid": KEY_ID, "use": "sig", "alg": "RS256"}]}
+
+    os.environ["jwks_url"] = serve_jwks(jwks)
+    os.environ["oauth_audience"] = AUDIENCE
+    os.environ.setdefault("auth0_domain", "https://example.invalid")
+    os.environ.setdefault(
+        "jupyter_connection_dir", tempfile.mkdtemp(prefix="jupychat-bench-connections-")
+    )
+    os.environ.setdefault("kernel_working_dir", tempfile.mkdtemp(prefix="jupychat-bench-kernels-"))
+    if not real:
+        # The app's own kernel client stays unused, don't let it pre-start real kernels
+        os.environ["kernel_pool_size"] = "0"
+    return private_key
+
+
+def make_token(private_key: rsa.RSAPrivateKey) -> str:
+    claims = {
+        "sub": "benchmark",
+        "aud": AUDIENCE,
+        "exp": time.time() + 3600,
+        "jti": uuid.uuid4().hex,
+    }
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": KEY_ID})
+
+
+async def run_benchmarks(args: argparse.Namespace) -> list[Result]:
+    private_key = configure_environment(args.real)
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    import httpx
+
+    from benchmarks.fake_kernel import FakeMultiKernelManager, FakeSidecarClient
+    from jupychat.kernels import build_nb_gpt_kernel_client, get_nb_gpt_kernel_client
+    from jupychat.main import app
+    from jupychat.settings import get_settings
+
+    scenarios = {scenario.code: scenario.messages() for scenario in SCENARIOS}
+    FakeSidecarClient.script = staticmethod(lambda code: scenarios[code])
+
+    kernel_client = get_nb_gpt_kernel_client()
+    if not args.real:
+        kernel_client = build_nb_gpt_kernel_client(
+            get_settings(), FakeMultiKernelManager(), sidecar_client_class=FakeSidecarClient
+        )
+        app.dependency_overrides[get_nb_gpt_kernel_client] = lambda: kernel_client
+
+    token = make_token(private_key)
+    headers = {"Authorization": f"Bearer {token}"}
+    results = []
+
+    async with app.router.lifespan_context(app):
+        if not args.real:
+            kernel_client.start()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", headers=headers, timeout=None
+        ) as client:
+
+            async def create_kernel(i: int) -> int:
+                return (await client.post("/api/kernels", json={})).status_code
+
+            kernel_requests = args.kernels if args.real else args.requests
+            results.append(
+                await measure(
+                    "create_kernel", create_kernel, kernel_requests, args.concurrency, warmup=0
+                )
+            )
+
+            kernel_ids = []
+            for _ in range(args.kernels):
+                kernel_ids.append((await client.post("/api/kernels", json={})).json()["kernel_id"])
+
+            image_path = None
+            for scenario in SCENARIOS:
+
+                async def run_cell(i: int, code: str = scenario.code) -> int:
+                    body = {"kernel_id": kernel_ids[i % len(kernel_ids)], "code": code}
+                    return (await client.post("/api/run-cell", json=body)).status_code
+
+                results.append(
+                    await measure(
+                        f"run_cell[{scenario.name}]",
+                        run_cell,
+                        args.requests,
+                        args.concurrency,
+                        args.warmup,
+                    )
+                )
+                if scenario.images and image_path is None:
+                    body = {"kernel_id": kernel_ids[0], "code": scenario.code}
+                    response = (await client.post("/api/run-cell", json=body)).json()
+                    image_url = response["displays"][0]["data"]["image/png"]
+                    image_path = "/images/" + image_url.rsplit("/images/", 1)[-1]
+
+            small = SCENARIOS[0]
+
+            async def run_cells(i: int) -> int:
+                body = {"kernel_id": kernel_ids[i % len(kernel_ids)], "cells": [small.code] * 5}
+                return (await client.post("/api/run-cells", json=body)).status_code
+
+            results.append(
+                await measure(
+                    "run_cells[small x5]", run_cells, args.requests, args.concurrency, args.warmup
+                )
+            )
+
+            upload_chunk = b"x" * 64 * 1024
+
+            async def upload_body() -> AsyncIterator[bytes]:
+                for _ in range(16):
+                    yield upload_chunk
+
+            async def upload_file(i: int) -> int:
+                url = f"/api/kernels/{kernel_ids[i % len(kernel_ids)]}/files"
+                params = {"path": f"uploads/{i % 10}.bin"}
+                return (await client.put(url, params=params, content=upload_body())).status_code
+
+            results.append(
+                await measure(
+                    "upload_file[1mb]", upload_file, args.requests, args.concurrency, args.warmup
+                )
+            )
+
+            if image_path:
+
+                async def fetch_image(i: int) -> int:
+                    return (await client.get(image_path)).status_code
+
+                etag = (await client.get(image_path)).headers["ETag"]
+
+                async def revalidate_image(i: int) -> int:
+                    return (
+                        await client.get(image_path, headers={"If-None-Match": etag})
+                    ).status_code
+
+                for name, send in [("image_fetch", fetch_image), ("image_304", revalidate_image)]:
+                    results.append(
+                        await measure(name, send, args.requests, args.concurrency, args.warmup)
+                    )
+
+            async def auth_cached(i: int) -> int:
+                return (await client.get("/.well-known/ai-plugin.json")).status_code
+
+            fresh_tokens = [make_token(private_key) for _ in range(args.requests + args.warmup)]
+
+            async def auth_uncached(i: int) -> int:
+                auth = {"Authorization": f"Bearer {fresh_tokens[i]}"}
+                return (await client.get("/.well-known/ai-plugin.json", headers=auth)).status_code
+
+            for name, send in [("auth_cached", auth_cached), ("auth_uncached", auth_uncached)]:
+                results.append(await measure(name, send, args.requests, args.concurrency, 0))
+
+        if not args.real:
+            await kernel_client.shutdown_all()
+
+    return results
+
+
+def print_results(results: list[Result]) -> None:
+    print(
+        f"{'benchmark':<24} {'requests':>8} {'errors':>6} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}"
+    )
+    for r in results:
+        print(
+            f"{r.name:<24} {r.requests:>8} {r.errors:>6} {r.throughput:>10.1f}"
+            f" {r.p50_ms:>9.2f} {r.p99_ms:>9.2f}"
+        )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--real", action="store_true", help="run cells on local ipykernels")
+    parser.add_argument("--requests", type=int, default=500, help="requests per benchmark")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight")
+    parser.add_argument("--kernels", type=int, default=4, help="kernels to spread cells over")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests first")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_benchmarks(args))
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+    if any(r.errors for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
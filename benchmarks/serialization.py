@@ -0,0 +1,136 @@
+"""
+Micro-benchmarks for rendering run-cell responses to JSON and compressing them.
+
+The responses are built from the outputs of the `benchmarks.run` scenarios, before any MIME
+bundle reduction. Each is rendered the way FastAPI renders a route's result (validating it
+against the response model, `jsonable_encoder`, `JSONResponse`) and with `FastJSONResponse`,
+then compressed with gzip and zstd.
+
+Usage:
+
+    python -m benchmarks.serialization [--repeat 50] [--json serialization.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+os.environ.setdefault("auth0_domain", "https://example.invalid")
+os.environ.setdefault("jwks_url", "https://example.invalid/.well-known/jwks.json")
+
+
+@dataclass
+class SerializationResult:
+    name: str
+    json_bytes: int
+    fastapi_us: float
+    fast_json_us: float
+    gzip_bytes: int
+    gzip_us: float
+    zstd_bytes: int | None
+    zstd_us: float | None
+
+
+def best_time(func: Callable[[], object], repeat: int) -> float:
+    """The fastest of `repeat` calls, in microseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started_at)
+    return best * 1_000_000
+
+
+def build_response(scenario):
+    """The run-cell response for the scenario's outputs, built like the kernel client does."""
+    from kernel_sidecar.models import messages
+
+    from jupychat.kernels import JupyChatOutputHandler, StatusHandler
+
+    handler = JupyChatOutputHandler(None, "benchmark")
+    for message in scenario.messages():
+        asyncio.run(handler.add_cell_content(message.content))
+    status = StatusHandler()
+    status.execute_reply_status = messages.CellStatus.ok
+    return handler.build_response(status, "benchmark")
+
+
+def run_benchmarks(args: argparse.Namespace) -> list[SerializationResult]:
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    from benchmarks.run import SCENARIOS
+    from jupychat.models import RunCellResponse
+    from jupychat.responses import CompressionMiddleware, FastJSONResponse, zstandard
+
+    field = create_response_field(name="response", type_=RunCellResponse)
+    compression = CompressionMiddleware(None)
+    loop = asyncio.new_event_loop()
+    results = []
+    for scenario in SCENARIOS:
+        response = build_response(scenario)
+
+        def render_fastapi() -> bytes:
+            content = loop.run_until_complete(
+                serialize_response(field=field, response_content=response, is_coroutine=True)
+            )
+            return JSONResponse(content).body
+
+        body = FastJSONResponse(response).body
+        gzipped = compression.compress(body, "gzip")
+        zstd_compressed = compression.compress(body, "zstd") if zstandard else None
+        results.append(
+            SerializationResult(
+                name=scenario.name,
+                json_bytes=len(body),
+                fastapi_us=best_time(render_fastapi, args.repeat),
+                fast_json_us=best_time(lambda: FastJSONResponse(response), args.repeat),
+                gzip_bytes=len(gzipped),
+                gzip_us=best_time(lambda: compression.compress(body, "gzip"), args.repeat),
+                zstd_bytes=len(zstd_compressed) if zstandard else None,
+                zstd_us=(
+                    best_time(lambda: compression.compress(body, "zstd"), args.repeat)
+                    if zstandard
+                    else None
+                ),
+            )
+        )
+    loop.close()
+    return results
+
+
+def print_results(results: list[SerializationResult]) -> None:
+    from jupychat.responses import orjson
+
+    print(f"FastJSONResponse renders with {'orjson' if orjson else 'the standard library'}")
+    print(
+        f"{'scenario':<16} {'json bytes':>10} {'fastapi us':>11} {'fast us':>9}"
+        f" {'gzip bytes':>10} {'gzip us':>9} {'zstd bytes':>10} {'zstd us':>9}"
+    )
+    for r in results:
+        zstd = f"{r.zstd_bytes:>10} {r.zstd_us:>9.1f}" if r.zstd_bytes is not None else "-"
+        print(
+            f"{r.name:<16} {r.json_bytes:>10} {r.fastapi_us:>11.1f} {r.fast_json_us:>9.1f}"
+            f" {r.gzip_bytes:>10} {r.gzip_us:>9.1f} {zstd}"
+        )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--repeat", type=int, default=50, help="timed renders per scenario")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
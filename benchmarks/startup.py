@@ -0,0 +1,169 @@
+"""
+Benchmarks for how long a JupyChat process takes to start serving.
+
+Each run starts a fresh interpreter and times importing `jupychat.main` and running the app's
+startup. The JWKS is served locally with a delay, since the keys are fetched on startup.
+Kernel pre-warming is turned off, it happens in the background either way.
+
+Usage:
+
+    python -m benchmarks.startup [--runs 5] [--jwks-delay 0.5] [--importtime] [--json startup.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class StartupResult:
+    name: str
+    runs: int
+    median_ms: float
+    max_ms: float
+
+
+def serve_slow_jwks(delay: float) -> str:
+    """Serves a JWKS after `delay` seconds, from a background thread. Returns its URL."""
+    import jwt
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    body = json.dumps({"keys": [{**jwk, "kid": "startup", "use": "sig", "alg": "RS256"}]}).encode()
+
+    class SlowJWKSHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowJWKSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/.well-known/jwks.json"
+
+
+def measure_startup() -> dict[str, float]:
+    """Times importing the app and running its startup, in this process. Returns seconds."""
+    started_at = time.perf_counter()
+    from jupychat.main import app
+
+    imported_at = time.perf_counter()
+
+    async def start() -> float:
+        lifespan_started_at = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            return time.perf_counter() - lifespan_started_at
+
+    startup = asyncio.run(start())
+    return {"import": imported_at - started_at, "startup": startup}
+
+
+def run_child(args: argparse.Namespace, importtime: bool = False) -> tuple[dict, str]:
+    """Measures one fresh process. Returns its timings and, with `importtime`, its stderr."""
+    env = {
+        **os.environ,
+        "jwks_url": args.jwks_url,
+        "kernel_pool_size": "0",
+        "jupyter_connection_dir": args.connection_dir,
+    }
+    env.setdefault("auth0_domain", "https://example.invalid")
+    command = [sys.executable, "-m", "benchmarks.startup", "--child"]
+    if importtime:
+        command[1:1] = ["-X", "importtime"]
+
+    started_at = time.perf_counter()
+    process = subprocess.run(
+        command, env=env, stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True
+    )
+    timings = json.loads(process.stdout.strip().splitlines()[-1])
+    timings["process"] = time.perf_counter() - started_at
+    return timings, process.stderr
+
+
+def slowest_imports(importtime_output: str, count: int = 15) -> list[tuple[str, float]]:
+    """The top-level packages with the highest cumulative import time, in milliseconds."""
+    packages = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if not cumulative.strip().isdigit() or "." in name.strip():
+            continue
+        packages[name.strip()] = max(packages.get(name.strip(), 0), int(cumulative) / 1000)
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def run_benchmarks(args: argparse.Namespace) -> list[StartupResult]:
+    args.jwks_url = serve_slow_jwks(args.jwks_delay)
+    args.connection_dir = tempfile.mkdtemp(prefix="jupychat-bench-connections-")
+
+    timings = [run_child(args)[0] for _ in range(args.runs)]
+    results = []
+    for name, key in [
+        ("import jupychat.main", "import"),
+        ("app startup", "startup"),
+        ("process total", "process"),
+    ]:
+        values = [t[key] * 1000 for t in timings]
+        results.append(
+            StartupResult(
+                name=name, runs=args.runs, median_ms=statistics.median(values), max_ms=max(values)
+            )
+        )
+
+    if args.importtime:
+        _, stderr = run_child(args, importtime=True)
+        print(f"{'package':<32} {'import ms':>10}")
+        for name, ms in slowest_imports(stderr):
+            print(f"{name:<32} {ms:>10.1f}")
+        print()
+    return results
+
+
+def print_results(results: list[StartupResult]) -> None:
+    print(f"{'benchmark':<24} {'runs':>6} {'median ms':>10} {'max ms':>10}")
+    for r in results:
+        print(f"{r.name:<24} {r.runs:>6} {r.median_ms:>10.1f} {r.max_ms:>10.1f}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to time")
+    parser.add_argument(
+        "--jwks-delay", type=float, default=0.5, help="seconds the JWKS takes to respond"
+    )
+    parser.add_argument(
+        "--importtime", action="store_true", help="also list the slowest packages to import"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure_startup()))
+        return
+
+    results = run_benchmarks(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,24 @@ import pathlib
 from contextlib import asynccontextmanager
 
 import aiofiles.os
-from fastapi import FastAPI
+import structlog
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
-from jupychat.auth import jwks_client
+from jupychat.auth import jwks_cache
+from jupychat.exceptions import JupyChatError
+from jupychat.http_client import build_http_client
+from jupychat.jobs import close_job_managers
 from jupychat.kernels import get_nb_gpt_kernel_client
+from jupychat.responses import CompressionMiddleware
 from jupychat.routes import api, auth, root
+from jupychat.routes.root import render_ai_plugin_json
 from jupychat.settings import get_settings
 
+logger = structlog.get_logger(__name__)
+
 static_directory = pathlib.Path(__file__).parent / "static"
 
 
@@ -19,13 +28,32 @@ async def lifespan(app: FastAPI):
     # Startup
     settings = get_settings()
 
-    jwks_client.fetch_data()
+    if settings.kernel_registry == "sqlite" and not settings.image_spool_dir:
+        logger.warning(
+            "Images are kept in each worker's memory, other workers will 404 on their URLs. "
+            "Set image_spool_dir to a directory the workers share."
+        )
+    jwks_cache.start()
+    app.state.http_client = build_http_client(settings)
+    render_ai_plugin_json(user_is_authenticated=False)
+    render_ai_plugin_json(user_is_authenticated=True)
     await aiofiles.os.makedirs(settings.jupyter_connection_dir, exist_ok=True)
+    await get_nb_gpt_kernel_client().reattach_kernels()
+    get_nb_gpt_kernel_client().start()
 
     yield  # FastAPI running...
 
     # Shutdown
-    await get_nb_gpt_kernel_client().shutdown_all()
+    kernel_client = get_nb_gpt_kernel_client()
+    await kernel_client.drain(settings.shutdown_drain_timeout_sec)
+    await jwks_cache.stop()
+    await app.state.http_client.aclose()
+    await close_job_managers()
+    await kernel_client.shutdown_all(timeout=settings.shutdown_timeout_sec)
+
+
+async def jupychat_error_handler(request: Request, exc: JupyChatError) -> JSONResponse:
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)})
 
 
 def build_app():
@@ -44,6 +72,10 @@ def build_app():
         allow_headers=["*"],
         allow_credentials=True,
     )
+    if settings.compression_min_bytes is not None:
+        app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_bytes)
+
+    app.add_exception_handler(JupyChatError, jupychat_error_handler)
 
     app.mount("/static", StaticFiles(directory=str(static_directory)), name="static")
 
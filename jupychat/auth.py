@@ -1,12 +1,149 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
 import jwt
+import structlog
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jwt import PyJWKClient
+from jwt import PyJWK, PyJWKClient, PyJWKClientError, PyJWKSet
 from starlette import status
 
+from jupychat import metrics
 from jupychat.settings import get_settings
 
-jwks_client = PyJWKClient(get_settings().jwks_url, cache_keys=True)
+logger = structlog.get_logger(__name__)
+
+
+class JWKSCache:
+    """The signing keys published at the JWKS URL, refreshed in the background.
+
+    Keys are served from memory. Once they're older than `refresh_interval`, they keep being
+    served while a refresh runs in the background. Only a key ID that isn't known at all waits
+    for a refresh, in case the keys were rotated, and at most once every `min_refetch_interval`
+    seconds so tokens with made-up key IDs can't trigger a fetch each.
+    """
+
+    min_refetch_interval: float = 10
+    retry_initial_delay: float = 1
+
+    def __init__(self, jwks_url: str, refresh_interval: float):
+        self._jwks_url = jwks_url
+        self._jwks_client: PyJWKClient | None = None
+        self._refresh_interval = refresh_interval
+        self._keys: dict[str, PyJWK] = {}
+        self._fetched_at: float | None = None
+        self._refreshing: asyncio.Task | None = None
+        self._refresh_loop: asyncio.Task | None = None
+
+    async def refresh(self) -> None:
+        """Fetches the keys, sharing a fetch that's already in progress."""
+        await asyncio.shield(self._refresh_in_background())
+
+    def _refresh_in_background(self) -> asyncio.Task:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._fetch())
+            self._refreshing.add_done_callback(self._log_refresh_error)
+        return self._refreshing
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task) -> None:
+        if not task.cancelled() and (exc := task.exception()):
+            logger.warning("Failed to fetch JWKS", error=str(exc))
+
+    def _fetch_data(self) -> dict:
+        if self._jwks_client is None:
+            self._jwks_client = PyJWKClient(self._jwks_url, cache_keys=False)
+        return self._jwks_client.fetch_data()
+
+    async def _fetch(self) -> None:
+        data = await asyncio.to_thread(self._fetch_data)
+        jwk_set = PyJWKSet.from_dict(data)
+        self._keys = {key.key_id: key for key in jwk_set.keys if key.key_id}
+        self._fetched_at = time.monotonic()
+        logger.info("Fetched JWKS", key_ids=list(self._keys))
+
+    def _is_stale(self) -> bool:
+        return (
+            self._fetched_at is None or time.monotonic() - self._fetched_at > self._refresh_interval
+        )
+
+    async def get_signing_key(self, kid: str) -> PyJWK:
+        if self._is_stale():
+            self._refresh_in_background()
+
+        recently_fetched = (
+            self._fetched_at is not None
+            and time.monotonic() - self._fetched_at < self.min_refetch_interval
+        )
+        if kid not in self._keys and not recently_fetched:
+            await self.refresh()
+        if key := self._keys.get(kid):
+            return key
+        raise PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+
+    def start(self) -> None:
+        """Starts fetching the keys in the background, then every `refresh_interval` seconds.
+
+        Failed fetches are retried with exponential backoff, up to `refresh_interval` apart.
+        Until the first fetch succeeds, requests wait for a fetch of their own.
+        """
+        if self._refresh_loop is None:
+            self._refresh_loop = asyncio.create_task(self._refresh_periodically())
+
+    async def _refresh_periodically(self) -> None:
+        retry_delay = self.retry_initial_delay
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                # Already logged by the refresh, keep the previous keys until a retry succeeds
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, self._refresh_interval)
+                continue
+            retry_delay = self.retry_initial_delay
+            await asyncio.sleep(self._refresh_interval)
+
+    async def stop(self) -> None:
+        if self._refresh_loop:
+            self._refresh_loop.cancel()
+            self._refresh_loop = None
+
+
+class VerifiedTokenCache:
+    """Payloads of already verified tokens, keyed by a hash of the token, until they expire."""
+
+    def __init__(self, max_entries: int = 10_000):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> dict | None:
+        key = self._key(token)
+        payload = self._entries.get(key)
+        if payload is None:
+            return None
+        if payload["exp"] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def put(self, token: str, payload: dict) -> None:
+        # Tokens without an expiry are verified every time, there's nothing to bound them by
+        if not isinstance(payload.get("exp"), (int, float)):
+            return
+        self._entries[self._key(token)] = payload
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+
+jwks_cache = JWKSCache(get_settings().jwks_url, get_settings().jwks_cache_time_sec)
+verified_tokens = VerifiedTokenCache(get_settings().jwt_cache_max_entries)
 bearer_scheme = HTTPBearer(auto_error=False)
 
 
@@ -16,10 +153,12 @@ async def optional_bearer_token(
     return auth_cred.credentials if auth_cred else None
 
 
-def verify_jwt(token: str | None = Depends(optional_bearer_token)) -> dict:
+async def verify_jwt(token: str | None = Depends(optional_bearer_token)) -> dict:
     """
     Verifies the given JWT token and returns the decoded payload.
 
+    Tokens that were verified before are looked up in a cache until they expire.
+
     Parameters
     ----------
     token : str or None, optional
@@ -40,20 +179,37 @@ def verify_jwt(token: str | None = Depends(optional_bearer_token)) -> dict:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing Authorization bearer token"
         )
-    signing_key = jwks_client.get_signing_key_from_jwt(token)
-    return jwt.decode(
+    started_at = time.perf_counter()
+    if payload := verified_tokens.get(token):
+        metrics.JWT_VERIFY_SECONDS.labels("hit").observe(time.perf_counter() - started_at)
+        return payload
+
+    signing_key = await jwks_cache.get_signing_key(jwt.get_unverified_header(token).get("kid"))
+    payload = jwt.decode(
         token,
         signing_key.key,
         algorithms=["RS256"],
         audience=get_settings().oauth_audience,
     )
+    verified_tokens.put(token, payload)
+    metrics.JWT_VERIFY_SECONDS.labels("miss").observe(time.perf_counter() - started_at)
+    return payload
+
+
+async def get_user_id(payload: dict = Depends(verify_jwt)) -> str:
+    """The caller's user ID, the `sub` claim of their token."""
+    if not (user_id := payload.get("sub")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="The bearer token has no subject"
+        )
+    return user_id
 
 
-def optional_verify_jwt(token: str | None = Depends(optional_bearer_token)) -> dict | None:
+async def optional_verify_jwt(token: str | None = Depends(optional_bearer_token)) -> dict | None:
     if not token:
         return None
-    return verify_jwt(token)
+    return await verify_jwt(token)
 
 
-def get_user_is_authenticated(token: dict | None = Depends(optional_verify_jwt)) -> bool:
+async def get_user_is_authenticated(token: dict | None = Depends(optional_verify_jwt)) -> bool:
     return token is not None
@@ -0,0 +1,140 @@
+"""Errors raised by JupyChat that map to a specific HTTP status code."""
+from starlette import status
+
+
+class JupyChatError(Exception):
+    """Base class for errors that are returned to the caller as-is, with `status_code`."""
+
+    status_code: int = status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+class KernelNotFoundError(JupyChatError):
+    status_code = status.HTTP_404_NOT_FOUND
+
+    def __init__(self, kernel_id: str):
+        super().__init__(f"Kernel {kernel_id} not found. Create a new kernel and try again.")
+        self.kernel_id = kernel_id
+
+
+class KernelCulledError(KernelNotFoundError):
+    """The kernel existed, but was shut down because it was idle or to make room."""
+
+    status_code = status.HTTP_410_GONE
+
+    def __init__(self, kernel_id: str):
+        JupyChatError.__init__(
+            self,
+            f"Kernel {kernel_id} was shut down after being idle and its state is gone. "
+            "Create a new kernel and re-run any setup code.",
+        )
+        self.kernel_id = kernel_id
+
+
+class KernelDiedError(KernelCulledError):
+    """The kernel process died, e.g. it ran out of memory, and its state is gone.
+
+    While the kernel is being restarted this is a 503, the kernel can be used again shortly.
+    """
+
+    def __init__(self, kernel_id: str, restarting: bool = False):
+        if restarting:
+            message = (
+                f"Kernel {kernel_id} died, probably from running out of memory, and is being "
+                "restarted. Its variables and imports are gone: retry in a moment and re-run any "
+                "setup code."
+            )
+        else:
+            message = (
+                f"Kernel {kernel_id} died, probably from running out of memory, and its state is "
+                "gone. Create a new kernel and re-run any setup code."
+            )
+        JupyChatError.__init__(self, message)
+        self.kernel_id = kernel_id
+        self.restarting = restarting
+        if restarting:
+            self.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+class KernelLimitError(JupyChatError):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    def __init__(self, max_kernels: int):
+        super().__init__(
+            f"All {max_kernels} kernels are busy, try again once a running cell finishes."
+        )
+
+
+class JobNotFoundError(JupyChatError):
+    status_code = status.HTTP_404_NOT_FOUND
+
+    def __init__(self, job_id: str):
+        super().__init__(f"Job {job_id} not found, its result may have expired.")
+        self.job_id = job_id
+
+
+class KernelBusyError(JupyChatError):
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+
+    def __init__(self, kernel_id: str, queued: int):
+        super().__init__(
+            f"Kernel {kernel_id} already has {queued} cells waiting to run, "
+            "try again once they finish."
+        )
+        self.kernel_id = kernel_id
+
+
+class IdempotencyKeyReusedError(JupyChatError):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def __init__(self, key: str):
+        super().__init__(
+            f"Idempotency key {key} was already used for a different request, "
+            "use a new key for new code."
+        )
+        self.key = key
+
+
+class ServerDrainingError(JupyChatError):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    def __init__(self):
+        super().__init__("The server is shutting down, try again in a moment.")
+
+
+class KernelAccessError(JupyChatError):
+    status_code = status.HTTP_403_FORBIDDEN
+
+    def __init__(self, kernel_id: str):
+        super().__init__(
+            f"Kernel {kernel_id} belongs to another user. Create a new kernel and try again."
+        )
+        self.kernel_id = kernel_id
+
+
+class KernelQuotaError(JupyChatError):
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+
+    def __init__(self, max_kernels: int):
+        super().__init__(
+            f"All {max_kernels} of your kernels are running cells, "
+            "try again once one of them finishes."
+        )
+
+
+class FileTooLargeError(JupyChatError):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Files can be at most {max_bytes} bytes, upload a smaller file.")
+        self.max_bytes = max_bytes
+
+
+class InvalidFilePathError(JupyChatError):
+    status_code = status.HTTP_400_BAD_REQUEST
+
+    def __init__(self, path: str):
+        super().__init__(
+            f"Invalid file path {path!r}, use a relative path inside the kernel's working "
+            "directory, like data/input.csv."
+        )
+        self.path = path
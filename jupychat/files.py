@@ -0,0 +1,163 @@
+"""
+Write uploaded files into kernels' working directories.
+
+Functions:
+- resolve_upload_path: The absolute path of a file inside a kernel's working directory.
+- write_file: Streams a request body to a file in a kernel's working directory.
+"""
+import asyncio
+import errno
+import os
+import uuid
+from typing import AsyncIterable
+
+import aiofiles
+
+from jupychat import metrics
+from jupychat.exceptions import FileTooLargeError, InvalidFilePathError
+
+# Chunks are gathered up to this size before writing, so a body sent in small chunks doesn't
+# cost a thread hop per chunk. Bounds the memory used per upload.
+_WRITE_BUFFER_BYTES = 1024 * 1024
+
+_DIRECTORY_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+_TEMP_FILE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW
+_INVALID_PATH_ERRORS = (IsADirectoryError, NotADirectoryError, FileExistsError)
+
+
+def resolve_upload_path(working_dir: str, path: str) -> str:
+    """
+    The absolute path of `path` inside the kernel's working directory.
+
+    Parameters
+    ----------
+    working_dir : str
+        The kernel's working directory.
+    path : str
+        The path the caller asked for, relative to the working directory.
+
+    Returns
+    -------
+    str
+        The absolute path, with symlinks resolved.
+
+    Raises
+    ------
+    InvalidFilePathError
+        If the path is absolute, or leads out of the working directory, e.g. with `..` or a
+        symlink.
+
+    """
+    if not path or os.path.isabs(path) or "\0" in path:
+        raise InvalidFilePathError(path)
+    working_dir = os.path.realpath(working_dir)
+    resolved = os.path.realpath(os.path.join(working_dir, path))
+    if resolved == working_dir or os.path.commonpath([working_dir, resolved]) != working_dir:
+        raise InvalidFilePathError(path)
+    return resolved
+
+
+def _open_directory(working_dir: str, parts: list[str]) -> int:
+    """Opens the directory inside the working directory that `parts` lead to, creating missing
+    ones, and returns its file descriptor.
+
+    Each part is opened relative to the previous one without following symlinks, so a cell
+    swapping one in after `resolve_upload_path` checked the path can't redirect the write out
+    of the working directory.
+    """
+    fd = os.open(working_dir, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        for part in parts:
+            try:
+                os.mkdir(part, dir_fd=fd)
+            except FileExistsError:
+                pass
+            parent_fd, fd = fd, os.open(part, _DIRECTORY_FLAGS, dir_fd=fd)
+            os.close(parent_fd)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _remove(name: str, dir_fd: int) -> None:
+    try:
+        os.remove(name, dir_fd=dir_fd)
+    except OSError:
+        pass
+
+
+def _is_invalid_path(error: OSError) -> bool:
+    # ELOOP is what opening a symlink with O_NOFOLLOW raises
+    return isinstance(error, _INVALID_PATH_ERRORS) or error.errno == errno.ELOOP
+
+
+async def write_file(
+    working_dir: str, path: str, chunks: AsyncIterable[bytes], max_bytes: int | None
+) -> int:
+    """
+    Writes the chunks to the file as they arrive, and returns its size.
+
+    The file is written next to its destination under a temporary name and only moved into
+    place once complete, so cells never see a partly uploaded file. Missing parent directories
+    are created, but not the working directory itself. Symlinks are never followed, even ones
+    created while the file is written.
+
+    Parameters
+    ----------
+    working_dir : str
+        The kernel's working directory.
+    path : str
+        Where to write the file, relative to the working directory.
+    chunks : AsyncIterable[bytes]
+        The file's content, like a request's body stream.
+    max_bytes : int, optional
+        The largest file allowed.
+
+    Returns
+    -------
+    int
+        The size of the file, in bytes.
+
+    Raises
+    ------
+    FileTooLargeError
+        If the file is larger than `max_bytes`. Nothing is written.
+    InvalidFilePathError
+        If the path leads out of the working directory, is a directory, or one of its parents
+        is a file or a symlink.
+
+    """
+    destination = resolve_upload_path(working_dir, path)
+    *parents, name = os.path.relpath(destination, os.path.realpath(working_dir)).split(os.sep)
+    temp_name = f".{name}.{uuid.uuid4().hex}.part"
+    size = 0
+    buffer = bytearray()
+    dir_fd = None
+    try:
+        dir_fd = await asyncio.to_thread(_open_directory, working_dir, parents)
+        fd = await asyncio.to_thread(os.open, temp_name, _TEMP_FILE_FLAGS, 0o644, dir_fd=dir_fd)
+        async with aiofiles.open(fd, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise FileTooLargeError(max_bytes)
+                buffer += chunk
+                if len(buffer) >= _WRITE_BUFFER_BYTES:
+                    await f.write(buffer)
+                    buffer.clear()
+            await f.write(buffer)
+        # Renaming replaces a symlink at the destination rather than writing through it
+        await asyncio.to_thread(os.replace, temp_name, name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+    except BaseException as e:
+        if dir_fd is not None:
+            await asyncio.to_thread(_remove, temp_name, dir_fd)
+        if isinstance(e, OSError) and _is_invalid_path(e):
+            raise InvalidFilePathError(path) from e
+        raise
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+
+    metrics.UPLOADED_BYTES.inc(size)
+    return size
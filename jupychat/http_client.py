@@ -0,0 +1,88 @@
+"""
+The HTTP client used to talk to Auth0, shared for the lifetime of the app.
+
+Functions:
+- build_http_client: Creates the pooled client, configured from the settings.
+- get_http_client: FastAPI dependency returning the app's client.
+- post_with_retries: Sends a POST, retrying with jittered backoff on transient failures.
+"""
+import asyncio
+import random
+
+import httpx
+import structlog
+from fastapi import Request
+
+from jupychat.settings import Settings
+
+logger = structlog.get_logger(__name__)
+
+# Failures where the request can't have reached the upstream server, or a gateway in front of
+# it answered. Authorization codes are single-use, so anything else isn't safe to retry.
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+
+def build_http_client(settings: Settings) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry_sec,
+        ),
+        timeout=httpx.Timeout(settings.http_timeout_sec, connect=settings.http_connect_timeout_sec),
+    )
+
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http_client
+
+
+async def post_with_retries(
+    client: httpx.AsyncClient,
+    url: str,
+    retries: int = 2,
+    backoff: float = 0.2,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Sends a POST request, retrying connection failures and gateway errors.
+
+    Parameters
+    ----------
+    client : httpx.AsyncClient
+        The client to send the request with.
+    url : str
+        The URL to send the request to.
+    retries : int, optional
+        How many times to retry after the first attempt, by default 2
+    backoff : float, optional
+        Base delay between attempts in seconds, doubled each attempt and jittered, by default 0.2
+    **kwargs
+        Passed on to `client.post`.
+
+    Returns
+    -------
+    httpx.Response
+        The last response received.
+
+    Raises
+    ------
+    httpx.HTTPError
+        If the last attempt failed without a response.
+
+    """
+    for attempt in range(retries + 1):
+        is_last_attempt = attempt == retries
+        try:
+            resp = await client.post(url, **kwargs)
+            if resp.status_code not in RETRYABLE_STATUS_CODES or is_last_attempt:
+                return resp
+            logger.warning("Retrying upstream request", url=url, status_code=resp.status_code)
+        except RETRYABLE_ERRORS as e:
+            if is_last_attempt:
+                raise
+            logger.warning("Retrying upstream request", url=url, error=str(e))
+
+        # Full jitter, so clients retrying at the same time spread out
+        await asyncio.sleep(random.uniform(0, backoff * 2**attempt))
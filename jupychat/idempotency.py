@@ -0,0 +1,124 @@
+"""
+Deduplicate retried requests, so a retry of a cell that already ran doesn't run it again.
+
+Classes:
+- IdempotencyCache: Runs each idempotency key's request once and replays its result.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Awaitable, Callable, Generic, TypeVar
+
+import structlog
+
+from jupychat import metrics
+from jupychat.exceptions import IdempotencyKeyReusedError
+from jupychat.settings import get_settings
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Entry(Generic[T]):
+    fingerprint: str
+    task: asyncio.Task[T]
+    finished_at: float | None = None
+
+
+class IdempotencyCache:
+    """Runs the request for each key once, and gives its result to every request with the key.
+
+    Keys are scoped by user and kernel ID. A request whose key is in flight waits for the running
+    one instead of starting another. Results are kept for `ttl` seconds, and at most
+    `max_entries` of them. Requests that raise, like a kernel that was busy or gone, aren't kept,
+    so retrying them runs them again.
+    """
+
+    def __init__(self, ttl: float = 900, max_entries: int = 1000) -> None:
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries: dict[tuple[str | None, str | None, str], _Entry] = {}
+        self._finished: OrderedDict[tuple[str | None, str | None, str], None] = OrderedDict()
+
+    async def run(
+        self,
+        kernel_id: str | None,
+        key: str,
+        fingerprint: str,
+        run: Callable[[], Awaitable[T]],
+        user: str | None = None,
+    ) -> tuple[T, bool]:
+        """
+        Runs `run` unless a request with the same key ran or is running, and returns its result.
+
+        Parameters
+        ----------
+        kernel_id : str or None
+            The kernel the request runs on, None when it creates its own.
+        key : str
+            The idempotency key the caller sent.
+        fingerprint : str
+            Identifies what the request does, like its code. A key can't be reused for a
+            different request.
+        run : Callable[[], Awaitable[T]]
+            Makes the request.
+        user : str, optional
+            The user making the request, other users' keys never match.
+
+        Returns
+        -------
+        tuple[T, bool]
+            The result, and whether it came from an earlier request with the same key.
+
+        Raises
+        ------
+        IdempotencyKeyReusedError
+            If the key was used for a request with a different fingerprint.
+
+        """
+        self._purge()
+        cache_key = (user, kernel_id, key)
+        if entry := self._entries.get(cache_key):
+            if entry.fingerprint != fingerprint:
+                raise IdempotencyKeyReusedError(key)
+            replay = "cached" if entry.task.done() else "joined"
+            logger.info("Replaying idempotent request", kernel_id=kernel_id, replay=replay)
+            metrics.IDEMPOTENT_REPLAYS.labels(replay).inc()
+            # Shielded, so a caller that goes away doesn't cancel the request for the others
+            return await asyncio.shield(entry.task), True
+
+        # Run in a task of its own, so a retry after the first caller timed out still joins it
+        entry = _Entry(fingerprint=fingerprint, task=asyncio.ensure_future(run()))
+        self._entries[cache_key] = entry
+        entry.task.add_done_callback(lambda task: self._on_done(cache_key, entry))
+        return await asyncio.shield(entry.task), False
+
+    def _on_done(self, cache_key: tuple[str | None, str | None, str], entry: _Entry) -> None:
+        if entry.task.cancelled() or entry.task.exception() is not None:
+            if self._entries.get(cache_key) is entry:
+                del self._entries[cache_key]
+            return
+        entry.finished_at = time.monotonic()
+        self._finished[cache_key] = None
+
+    def _purge(self) -> None:
+        cutoff = time.monotonic() - self._ttl
+        while self._finished:
+            cache_key = next(iter(self._finished))
+            entry = self._entries[cache_key]
+            if entry.finished_at >= cutoff and len(self._finished) <= self._max_entries:
+                break
+            del self._finished[cache_key]
+            del self._entries[cache_key]
+
+
+@lru_cache(maxsize=1)
+def get_idempotency_cache() -> IdempotencyCache:
+    settings = get_settings()
+    return IdempotencyCache(
+        ttl=settings.idempotency_ttl_sec, max_entries=settings.idempotency_max_entries
+    )
@@ -1,36 +1,234 @@
 import base64
-import uuid
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 
-from jupychat.models import DisplayData, ImageData
+from jupychat import metrics
+from jupychat.models import DisplayData, ImageData, ImageStoreStats
 from jupychat.settings import get_settings
 
+_IMAGE_NAME = re.compile(r"image-(?P<content_hash>[0-9a-f]{32})\.png")
+# Temporary files older than this are left over from writes that never finished
+_STALE_TMP_SEC = 60
+
 
 class ImageStore:
-    """An in-memory store for images that have been displayed in the notebook."""
+    """An in-memory store for images that have been displayed in the notebook.
+
+    Images are keyed by a hash of their content, so identical images are only stored once.
+    When the stored images exceed `max_bytes`, the least recently used ones are evicted, and
+    images older than `ttl` seconds are dropped when they're next looked up.
+
+    With a `spool_dir`, image bytes are written there once and only their paths are kept in
+    memory, so images can be served straight from disk. Images spooled before a restart are
+    indexed again on startup, so they're served and evicted like any other.
+
+    Several worker processes can share a `spool_dir`. Since file names are content hashes, a
+    worker serves images other workers spooled straight from the file. Each use of a file bumps
+    its mtime, and evicting an image only deletes the file if no other worker used it since.
+
+    Images are stored from the output formatting threads, so the store is guarded by a lock.
+    """
+
+    def __init__(
+        self, max_bytes: int | None = None, ttl: float | None = None, spool_dir: str | None = None
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spool_dir = spool_dir
+        self.image_store: OrderedDict[str, ImageData] = OrderedDict()
+        self.stats = ImageStoreStats()
+        self._lock = threading.Lock()
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+            self._load_spool_dir()
+
+    def _load_spool_dir(self) -> None:
+        """Indexes the images spooled by earlier runs, oldest first, and evicts any over budget."""
+        spooled = []
+        now = time.time()
+        with os.scandir(self.spool_dir) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                if entry.name.endswith(".tmp") and now - stat.st_mtime > _STALE_TMP_SEC:
+                    _unlink(entry.path)
+                elif match := _IMAGE_NAME.fullmatch(entry.name):
+                    spooled.append((stat.st_mtime, entry.name, match["content_hash"], stat))
 
-    def __init__(self):
-        self.image_store: dict[str, ImageData] = {}
+        for mtime, image_name, content_hash, stat in sorted(spooled):
+            if self.ttl and now - mtime >= self.ttl:
+                _unlink(os.path.join(self.spool_dir, image_name))
+                continue
+            self._add(image_name, self._spooled_image(image_name, content_hash, stat))
+        self._evict()
+
+    def _spooled_image(self, image_name: str, content_hash: str, stat: os.stat_result) -> ImageData:
+        """An image already in the spool dir, last used when its file was last modified."""
+        age = time.time() - stat.st_mtime
+        return ImageData(
+            url=self._url(image_name),
+            etag=content_hash,
+            size=stat.st_size,
+            path=os.path.join(self.spool_dir, image_name),
+            expires_at=time.monotonic() + self.ttl - age if self.ttl else None,
+            used_at_ns=stat.st_mtime_ns,
+        )
+
+    def _load_spooled_image(self, image_name: str) -> ImageData | None:
+        """Indexes an image another worker spooled, if its file is there."""
+        if not self.spool_dir or not (match := _IMAGE_NAME.fullmatch(image_name)):
+            return None
+        try:
+            stat = os.stat(os.path.join(self.spool_dir, image_name))
+        except FileNotFoundError:
+            return None
+        image = self._spooled_image(image_name, match["content_hash"], stat)
+        self._add(image_name, image)
+        self._evict()
+        return image
+
+    def _touch(self, image: ImageData) -> None:
+        """Records that this worker used the image's file, so other workers keep it."""
+        used_at_ns = time.time_ns()
+        try:
+            os.utime(image.path, ns=(used_at_ns, used_at_ns))
+        except FileNotFoundError:
+            return
+        image.used_at_ns = used_at_ns
 
     def store_images(self, dd: DisplayData) -> DisplayData:
         """Convert all image/png data to URLs that the frontend can fetch"""
 
         if dd.data and "image/png" in dd.data:
-            image_name = f"image-{uuid.uuid4().hex}.png"
             image_data = base64.b64decode(dd.data["image/png"])
-
-            self.image_store[image_name] = ImageData(
-                data=image_data, url=f"{get_settings().domain}/images/{image_name}"
-            )
-            dd.data["image/png"] = self.image_store[image_name].url
+            content_hash = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+            # A new dict, the mimebundle may still be referenced by the kernel message
+            dd.data = {**dd.data, "image/png": self.put(content_hash, image_data).url}
 
         return dd
 
-    def get_image(self, image_name: str) -> bytes:
-        return self.image_store[image_name].data
+    def put(self, content_hash: str, image_data: bytes) -> ImageData:
+        with self._lock:
+            return self._put(content_hash, image_data)
+
+    def _put(self, content_hash: str, image_data: bytes) -> ImageData:
+        image_name = f"image-{content_hash}.png"
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+
+        if image := self.image_store.get(image_name):
+            # Same content was stored before, just refresh it
+            self.image_store.move_to_end(image_name)
+            image.expires_at = expires_at
+            if image.path:
+                self._touch(image)
+            return image
+
+        image = ImageData(
+            url=self._url(image_name),
+            etag=content_hash,
+            size=len(image_data),
+            expires_at=expires_at,
+        )
+        if self.spool_dir:
+            image.path = self._write_spool_file(image_name, image_data)
+            self._touch(image)
+        else:
+            image.data = image_data
+        self._add(image_name, image)
+        self._evict()
+        return image
+
+    def _url(self, image_name: str) -> str:
+        return f"{get_settings().domain}/images/{image_name}"
+
+    def _add(self, image_name: str, image: ImageData) -> None:
+        self.image_store[image_name] = image
+        self.stats.images += 1
+        self.stats.resident_bytes += image.size
+
+    def _write_spool_file(self, image_name: str, image_data: bytes) -> str:
+        path = os.path.join(self.spool_dir, image_name)
+        if not os.path.exists(path):
+            # Write to a temporary file first so a concurrent reader never sees a partial image
+            fd, tmp_path = tempfile.mkstemp(dir=self.spool_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(image_data)
+            os.replace(tmp_path, path)
+        return path
+
+    def get_image(self, image_name: str) -> ImageData:
+        with self._lock:
+            return self._get_image(image_name)
+
+    def _get_image(self, image_name: str) -> ImageData:
+        image = self.image_store.get(image_name)
+        if image and image.expires_at is not None and image.expires_at < time.monotonic():
+            self._remove(image_name)
+            image = None
+        elif image is None:
+            image = self._load_spooled_image(image_name)
+
+        if image is None:
+            self.stats.misses += 1
+            raise KeyError(image_name)
+
+        self.stats.hits += 1
+        self.image_store.move_to_end(image_name)
+        if image.path:
+            self._touch(image)
+        return image
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        # Never evict the most recently stored image, even if it's over budget on its own
+        while self.stats.resident_bytes > self.max_bytes and len(self.image_store) > 1:
+            self._remove(next(iter(self.image_store)))
+            self.stats.evictions += 1
+
+    def _remove(self, image_name: str) -> None:
+        image = self.image_store.pop(image_name)
+        self.stats.images -= 1
+        self.stats.resident_bytes -= image.size
+        if image.path:
+            self._remove_spool_file(image)
+
+    def _remove_spool_file(self, image: ImageData) -> None:
+        try:
+            if os.stat(image.path).st_mtime_ns > (image.used_at_ns or 0):
+                return  # another worker used it since, and may still serve it
+        except FileNotFoundError:
+            return
+        _unlink(image.path)
 
     def clear(self):
-        self.image_store = {}
+        with self._lock:
+            for image_name in list(self.image_store):
+                self._remove(image_name)
+        self.stats.images = 0
+        self.stats.resident_bytes = 0
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
 
 
 # Initialize the image store as a global instance
-image_store = ImageStore()
+image_store = ImageStore(
+    max_bytes=get_settings().image_store_max_bytes,
+    ttl=get_settings().image_store_ttl_sec,
+    spool_dir=get_settings().image_spool_dir,
+)
+
+metrics.IMAGE_STORE_BYTES.set_function(lambda: image_store.stats.resident_bytes)
+metrics.IMAGE_STORE_IMAGES.set_function(lambda: image_store.stats.images)
+metrics.IMAGE_STORE_LOOKUPS.labels("hit").set_function(lambda: image_store.stats.hits)
+metrics.IMAGE_STORE_LOOKUPS.labels("miss").set_function(lambda: image_store.stats.misses)
+metrics.IMAGE_STORE_EVICTIONS.set_function(lambda: image_store.stats.evictions)
@@ -0,0 +1,227 @@
+"""
+Run cells in the background, for cells that take longer than an HTTP request should stay open.
+
+Classes:
+- Job: A cell submitted to run in the background.
+- JobManager: Starts jobs, enforces their deadlines and keeps their results for a while.
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import structlog
+from fastapi import Depends
+
+from jupychat.exceptions import JobNotFoundError
+from jupychat.kernels import JupyChatKernelClient, get_nb_gpt_kernel_client
+from jupychat.models import JobResponse, JobStatus, RunCellRequest, RunCellResponse
+from jupychat.settings import get_settings
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class Job:
+    job_id: str
+    request: RunCellRequest
+    timeout: float
+    user: str | None = None
+    task: asyncio.Task | None = None
+    result: RunCellResponse | None = None
+    error: str | None = None
+    timed_out: bool = False
+    interrupted: bool = False
+    created_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+
+class JobManager:
+    """Runs cells as background jobs.
+
+    Every job has an execution deadline. When it passes, the kernel is interrupted, or the job
+    is cancelled if its cell hasn't started yet. Finished jobs are kept for `result_ttl`
+    seconds, and at most `max_finished_jobs` of them.
+    """
+
+    def __init__(
+        self,
+        kernel_client: JupyChatKernelClient,
+        default_timeout: float = 600,
+        max_timeout: float = 3600,
+        result_ttl: float = 900,
+        max_finished_jobs: int = 1000,
+        interrupt_grace: float = 10,
+    ) -> None:
+        self._kernel_client = kernel_client
+        self._default_timeout = default_timeout
+        self._max_timeout = max_timeout
+        self._result_ttl = result_ttl
+        self._max_finished_jobs = max_finished_jobs
+        self._interrupt_grace = interrupt_grace
+        self._jobs: dict[str, Job] = {}
+        self._finished: OrderedDict[str, None] = OrderedDict()
+
+    def submit(
+        self, request: RunCellRequest, timeout: float | None = None, user: str | None = None
+    ) -> Job:
+        """
+        Starts running the given cell in the background.
+
+        Parameters
+        ----------
+        request : RunCellRequest
+            The code to execute and the ID of the kernel to use. The kernel must exist.
+        timeout : float, optional
+            Seconds the cell may run before the kernel is interrupted, capped at `max_timeout`.
+        user : str, optional
+            The user submitting the job. Only they can see it, and it runs as them.
+
+        Returns
+        -------
+        Job
+            The submitted job.
+
+        Raises
+        ------
+        ServerDrainingError
+            If the server is shutting down.
+
+        """
+        self._kernel_client.check_accepting()
+        self._purge()
+        timeout = min(timeout or self._default_timeout, self._max_timeout)
+        job = Job(job_id=uuid.uuid4().hex, request=request, timeout=timeout, user=user)
+        job.task = asyncio.create_task(self._run(job))
+        self._jobs[job.job_id] = job
+        logger.info("Submitted job", job_id=job.job_id, kernel_id=request.kernel_id)
+        return job
+
+    def get(self, job_id: str, user: str | None = None) -> Job:
+        """The job with the given ID, other users' jobs are not found."""
+        self._purge()
+        job = self._jobs.get(job_id)
+        if job and (user is None or job.user in (None, user)):
+            return job
+        raise JobNotFoundError(job_id)
+
+    async def wait(self, job_id: str, timeout: float, user: str | None = None) -> Job:
+        """Waits up to `timeout` seconds for the job to finish and returns it, done or not."""
+        job = self.get(job_id, user)
+        if not job.done and timeout > 0:
+            await asyncio.wait({job.task}, timeout=timeout)
+        return job
+
+    async def interrupt(self, job_id: str, user: str | None = None) -> Job:
+        """Interrupts the job's cell if it's running, or cancels it if it hasn't started, and
+        returns it once it has stopped or `interrupt_grace` seconds passed."""
+        job = self.get(job_id, user)
+        if not job.done:
+            job.interrupted = True
+            await self._stop(job, job.task)
+        return job
+
+    def status(self, job: Job) -> JobStatus:
+        if not job.done:
+            if self._kernel_client.is_cell_running(job.request.kernel_id, job.job_id):
+                return JobStatus.running
+            return JobStatus.queued
+        if job.timed_out:
+            return JobStatus.timed_out
+        if job.interrupted:
+            return JobStatus.interrupted
+        if job.error is not None:
+            return JobStatus.failed
+        return JobStatus.done
+
+    def to_response(self, job: Job) -> JobResponse:
+        return JobResponse(
+            job_id=job.job_id,
+            kernel_id=job.request.kernel_id,
+            status=self.status(job),
+            result=job.result,
+            error=job.error,
+        )
+
+    async def _run(self, job: Job) -> None:
+        execution = asyncio.create_task(
+            self._kernel_client.run_cell(job.request, cell_id=job.job_id, user=job.user)
+        )
+        try:
+            done, _ = await asyncio.wait({execution}, timeout=job.timeout)
+            if not done:
+                logger.info("Job passed its deadline", job_id=job.job_id, timeout=job.timeout)
+                job.timed_out = True
+                await self._stop(job, execution)
+            job.result = await execution
+        except asyncio.CancelledError:
+            execution.cancel()
+            job.error = job.error or "The job was cancelled before it finished."
+        except Exception as e:
+            job.error = f"Error executing code: {e}"
+        finally:
+            job.finished_at = time.monotonic()
+            self._finished[job.job_id] = None
+
+    async def _stop(self, job: Job, task: asyncio.Task) -> None:
+        """Interrupts the job's cell, or cancels `task` if the cell hasn't started, and waits up
+        to `interrupt_grace` seconds for `task` to finish."""
+        kernel_id = job.request.kernel_id
+        if await self._kernel_client.interrupt_cell(kernel_id, job.job_id):
+            # Give the kernel a moment to report the interrupted cell's outputs
+            await asyncio.wait({task}, timeout=self._interrupt_grace)
+            if not task.done():
+                job.error = "The kernel did not respond to the interrupt."
+                task.cancel()
+        elif not self._kernel_client.is_cell_running(kernel_id, job.job_id):
+            # Still waiting behind another cell, so nothing is running on the kernel yet
+            job.error = "The job was stopped before its cell started running."
+            task.cancel()
+        # Let the cancelled task wrap up, so the job's status is final once this returns
+        await asyncio.wait({task}, timeout=self._interrupt_grace)
+
+    def _purge(self) -> None:
+        cutoff = time.monotonic() - self._result_ttl
+        while self._finished:
+            job_id = next(iter(self._finished))
+            job = self._jobs[job_id]
+            if job.finished_at >= cutoff and len(self._finished) <= self._max_finished_jobs:
+                break
+            del self._finished[job_id]
+            del self._jobs[job_id]
+
+    async def close(self) -> None:
+        """Cancels all unfinished jobs."""
+        tasks = [job.task for job in self._jobs.values() if not job.done]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# One per kernel client, so jobs run on the client the routes get, even when it's overridden
+_job_managers: dict[JupyChatKernelClient, JobManager] = {}
+
+
+def get_job_manager(
+    kernel_client: JupyChatKernelClient = Depends(get_nb_gpt_kernel_client),
+) -> JobManager:
+    if kernel_client not in _job_managers:
+        settings = get_settings()
+        _job_managers[kernel_client] = JobManager(
+            kernel_client,
+            default_timeout=settings.job_default_timeout_sec,
+            max_timeout=settings.job_max_timeout_sec,
+            result_ttl=settings.job_result_ttl_sec,
+            max_finished_jobs=settings.job_max_finished,
+        )
+    return _job_managers[kernel_client]
+
+
+async def close_job_managers() -> None:
+    """Cancels the unfinished jobs of every job manager."""
+    await asyncio.gather(*(job_manager.close() for job_manager in _job_managers.values()))
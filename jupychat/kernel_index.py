@@ -0,0 +1,100 @@
+"""
+An on-disk index of handed-out kernels, so a restarted server can reconnect to them.
+
+Classes:
+- KernelIndexEntry: A kernel and the connection file to reach it.
+- KernelIndex: The entries, one JSON file per kernel in a directory.
+"""
+import asyncio
+import json
+import os
+
+from pydantic import BaseModel
+
+from jupychat.registry import worker_id
+
+
+class KernelIndexEntry(BaseModel):
+    kernel_id: str
+    kernel_name: str
+    connection_file: str
+    user: str | None = None
+
+    def read_connection_info(self) -> dict:
+        with open(self.connection_file) as f:
+            return json.load(f)
+
+
+class KernelIndex:
+    """Maps kernel IDs to their connection files, kept in `directory`.
+
+    Every kernel has its own file, so worker processes never rewrite each other's entries.
+    Entries are claimed by renaming them, so when several workers start at once, each kernel
+    is reattached by exactly one of them.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kernel_id: str) -> str:
+        return os.path.join(self.directory, f"{kernel_id}.json")
+
+    def _claimed_path(self, kernel_id: str) -> str:
+        return f"{self._path(kernel_id)}.{worker_id()}"
+
+    def _write(self, entry: KernelIndexEntry) -> None:
+        path = self._path(entry.kernel_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(entry.json())
+        os.replace(tmp_path, path)
+
+    def _remove(self, kernel_id: str) -> None:
+        paths = [self._path(kernel_id), self._claimed_path(kernel_id)]
+        for path in paths[:]:
+            try:
+                with open(path) as f:
+                    # Kernels reattached after a restart leave their connection file behind
+                    paths.append(KernelIndexEntry.parse_raw(f.read()).connection_file)
+            except (OSError, ValueError):
+                pass
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _claim_all(self) -> list[KernelIndexEntry]:
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            kernel_id = filename.removesuffix(".json")
+            try:
+                os.rename(self._path(kernel_id), self._claimed_path(kernel_id))
+                with open(self._claimed_path(kernel_id)) as f:
+                    entries.append(KernelIndexEntry.parse_raw(f.read()))
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            except ValueError:
+                self._remove(kernel_id)
+        return entries
+
+    def _release(self, kernel_id: str) -> None:
+        os.rename(self._claimed_path(kernel_id), self._path(kernel_id))
+
+    async def add(self, entry: KernelIndexEntry) -> None:
+        await asyncio.to_thread(self._write, entry)
+
+    async def remove(self, kernel_id: str) -> None:
+        """Removes the kernel's entry and its connection file."""
+        await asyncio.to_thread(self._remove, kernel_id)
+
+    async def claim_all(self) -> list[KernelIndexEntry]:
+        """Takes every entry out of the index, for this worker to reattach to."""
+        return await asyncio.to_thread(self._claim_all)
+
+    async def release(self, kernel_id: str) -> None:
+        """Puts a claimed entry back, once its kernel was reattached."""
+        await asyncio.to_thread(self._release, kernel_id)
@@ -0,0 +1,112 @@
+"""
+A pool of pre-started kernels so new conversations don't pay the kernel cold start.
+
+Classes:
+- KernelPool: Keeps a number of started, sidecar-connected kernels ready per kernel spec name.
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable
+
+import structlog
+from kernel_sidecar.client import KernelSidecarClient
+
+logger = structlog.get_logger(__name__)
+
+StartedKernel = tuple[str, KernelSidecarClient]
+
+
+class KernelPool:
+    """Keeps already-started kernels ready to be handed out, refilled in the background.
+
+    The pool doesn't know how to start or stop kernels itself. ``launch`` starts a kernel for
+    a kernel spec name and returns its ID along with a connected sidecar client, ``discard``
+    shuts down a kernel that was never handed out.
+    """
+
+    def __init__(
+        self,
+        launch: Callable[[str], Awaitable[StartedKernel]],
+        discard: Callable[[str, KernelSidecarClient], Awaitable[None]],
+        targets: dict[str, int],
+        max_concurrent_starts: int = 2,
+    ) -> None:
+        self._launch = launch
+        self._discard = discard
+        self._targets = {name: size for name, size in targets.items() if size > 0}
+        self._ready: dict[str, deque[StartedKernel]] = {name: deque() for name in self._targets}
+        self._starting: dict[str, int] = {name: 0 for name in self._targets}
+        self._start_semaphore = asyncio.Semaphore(max(1, max_concurrent_starts))
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+
+    @property
+    def ready_count(self) -> int:
+        """How many kernels are started and waiting to be handed out, across all specs."""
+        return sum(len(ready) for ready in self._ready.values())
+
+    def acquire(self, kernel_name: str) -> StartedKernel | None:
+        """
+        Hands out a pre-started kernel for the given spec, if one is ready.
+
+        A refill is scheduled either way, so the pool gets back to its target size.
+
+        Parameters
+        ----------
+        kernel_name : str
+            The kernel spec name the caller wants a kernel for.
+
+        Returns
+        -------
+        StartedKernel or None
+            The kernel ID and its connected sidecar client, or `None` if the pool has nothing
+            ready for this kernel spec and the caller has to start a kernel itself.
+
+        """
+        ready = self._ready.get(kernel_name)
+        kernel = ready.popleft() if ready else None
+        self.replenish(kernel_name)
+        return kernel
+
+    def replenish(self, kernel_name: str | None = None) -> None:
+        """Schedules background starts until the pool (or one spec of it) is at its target."""
+        if self._closed:
+            return
+
+        names = [kernel_name] if kernel_name else list(self._targets)
+        for name in names:
+            if name not in self._targets:
+                continue
+            missing = self._targets[name] - len(self._ready[name]) - self._starting[name]
+            for _ in range(missing):
+                self._starting[name] += 1
+                task = asyncio.create_task(self._fill_one(name))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _fill_one(self, kernel_name: str) -> None:
+        try:
+            async with self._start_semaphore:
+                if self._closed:
+                    return
+                kernel = await self._launch(kernel_name)
+
+            if self._closed:
+                await self._discard(*kernel)
+            else:
+                self._ready[kernel_name].append(kernel)
+                logger.info("Pre-warmed kernel", kernel_id=kernel[0], kernel_name=kernel_name)
+        except Exception:
+            logger.exception("Failed to pre-warm kernel", kernel_name=kernel_name)
+        finally:
+            self._starting[kernel_name] -= 1
+
+    async def close(self) -> None:
+        """Stops refilling, waits for in-progress starts and shuts down every unused kernel."""
+        self._closed = True
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        kernels = [kernel for ready in self._ready.values() for kernel in ready]
+        for ready in self._ready.values():
+            ready.clear()
+        await asyncio.gather(*(self._discard(*kernel) for kernel in kernels))
@@ -4,39 +4,163 @@ This module contains the client classes for managing Jupyter kernels.
 Classes:
 - JupyChatKernelClient: A client class for managing Jupyter kernels.
 - JupyChatOutputHandler: A custom output handler for Jupyter kernels that formats the output for use in JupyChat.
+- JupyChatStreamingOutputHandler: An output handler that forwards outputs as they arrive.
 - StatusHandler: A custom status handler for Jupyter kernels that tracks the status of cell execution.
 """
+import asyncio
+import inspect
+import os
+import shutil
+import signal
+import time
 import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from functools import lru_cache
+from typing import AsyncIterator, Callable, TypeVar
 
+import aiofiles.os
 import structlog
-from IPython import get_ipython
-from IPython.terminal.embed import InteractiveShellEmbed
 from jupyter_client import AsyncMultiKernelManager
+from kernel_sidecar import actions
 from kernel_sidecar.client import KernelSidecarClient
 from kernel_sidecar.handlers.base import Handler
 from kernel_sidecar.handlers.output import ContentType, OutputHandler
-from kernel_sidecar.models import messages
+from kernel_sidecar.models import messages, requests
 from kernel_sidecar.models.messages import CellStatus, StreamChannel
+from traitlets.config import Config
 
+from jupychat import metrics
+from jupychat.exceptions import (
+    JupyChatError,
+    KernelAccessError,
+    KernelBusyError,
+    KernelCulledError,
+    KernelDiedError,
+    KernelLimitError,
+    KernelNotFoundError,
+    KernelQuotaError,
+    ServerDrainingError,
+)
 from jupychat.images import image_store
+from jupychat.kernel_index import KernelIndex, KernelIndexEntry
+from jupychat.kernel_pool import KernelPool
 from jupychat.models import (
     CreateKernelRequest,
     CreateKernelResponse,
     DisplayData,
+    OutputReduction,
+    OutputTruncation,
+    RunCellEvent,
     RunCellRequest,
     RunCellResponse,
+    RunCellsRequest,
+    RunCellsResponse,
+)
+from jupychat.output_limits import (
+    BoundedTextBuffer,
+    MimeBundlePolicy,
+    OutputLimits,
+    mimebundle_size,
 )
-from jupychat.settings import get_settings
+from jupychat.registry import (
+    InMemoryKernelRegistry,
+    KernelRecord,
+    KernelRegistry,
+    build_kernel_registry,
+)
+from jupychat.scheduler import FairScheduler
+from jupychat.settings import Settings, get_settings
 
 logger = structlog.get_logger(__name__)
 
+T = TypeVar("T")
+
+ABORTED_CELL_ERROR = "The cell was not run because an earlier cell failed."
+
+
+@lru_cache(maxsize=1)
+def get_output_executor() -> ThreadPoolExecutor:
+    """The threads that format outputs and decode images, off the event loop."""
+    return ThreadPoolExecutor(
+        max_workers=get_settings().output_format_workers, thread_name_prefix="jupychat-output"
+    )
+
 
-def safe_get_ipython():
-    """Get an ipython shell instance for use with formatting."""
-    if ip := get_ipython():
-        return ip
-    return InteractiveShellEmbed()
+async def run_in_output_executor(func: Callable[..., T], *args) -> T:
+    return await asyncio.get_running_loop().run_in_executor(get_output_executor(), func, *args)
+
+
+def format_execute_result(data: dict) -> DisplayData:
+    """Build an execute_result output and replace its images with URLs.
+
+    The kernel already formatted the result, `data` is its mimebundle.
+    """
+    return image_store.store_images(DisplayData(data=data, metadata={}))
+
+
+def format_display(data: dict, metadata: dict) -> DisplayData:
+    """Build a display_data output and replace its images with URLs."""
+    return image_store.store_images(DisplayData(data=data, metadata=metadata))
+
+
+def execute_request_action(
+    code: str, handlers: list[Handler], stop_on_error: bool = True
+) -> actions.KernelAction:
+    """An execute request like `KernelSidecarClient.execute_request` makes, to send with `send`.
+
+    With `stop_on_error`, the kernel aborts the execute requests queued behind this one if it
+    fails.
+    """
+    request = requests.ExecuteRequest(content={"code": code, "stop_on_error": stop_on_error})
+    return actions.KernelAction(request=request, handlers=handlers)
+
+
+@dataclass
+class ManagedKernel:
+    """A kernel handed out to a conversation, along with its connected sidecar client.
+
+    Cells run one at a time per kernel, in the order they were submitted, by holding `lock`.
+    Kernels started by another worker process are `owned` by that worker, this one only
+    attached a sidecar client to them. Only the `user` who created the kernel can run cells on
+    it.
+
+    `dead` is set once the kernel process is found dead, until it's `restarting` and back up.
+    """
+
+    kernel_id: str
+    sidecar_client: KernelSidecarClient
+    kernel_name: str
+    owned: bool = True
+    user: str | None = None
+    last_activity: float = field(default_factory=time.monotonic)
+    pending: int = 0  # cells running or waiting for their turn
+    uploads: int = 0  # files being written into the kernel's working directory
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    running_cell_id: str | None = None
+    dead: asyncio.Event = field(default_factory=asyncio.Event)
+    restarting: bool = False
+    restarts: int = 0  # restarts since the kernel last finished a cell
+    state_lost: bool = False  # restarted since the last cell
+
+    @property
+    def is_idle(self) -> bool:
+        return self.pending == 0 and self.uploads == 0
+
+    @property
+    def queued(self) -> int:
+        """Number of cells waiting for the running cell to finish."""
+        return self.pending - 1 if self.lock.locked() else self.pending
+
+    def touch(self) -> None:
+        self.last_activity = time.monotonic()
+
+    def take_state_lost(self) -> bool:
+        """Whether the kernel was restarted since the last cell, only true for the next cell."""
+        state_lost, self.state_lost = self.state_lost, False
+        return state_lost
 
 
 class JupyChatKernelClient:
@@ -44,20 +168,117 @@ class JupyChatKernelClient:
 
     This wraps the jupyter multi kernel manager and provides a simple
     interface for managing kernels.
+
+    With a `kernel_index`, handed-out kernels are left running on shutdown and
+    `reattach_kernels` reconnects to them after a restart.
+
+    Before shutting down, `drain` stops new kernels and cells while the submitted cells finish.
+
+    With a `heartbeat_interval`, the kernels this process started are checked for being alive.
+    The cells of a dead kernel fail right away, and with `auto_restart` the kernel is restarted
+    in place, backing off between restarts.
+
+    Kernels belong to the user who created them. `max_kernels_per_user` bounds the kernels of
+    each user, and the `scheduler` decides when cells may run, so users share the execution
+    capacity fairly.
+
+    Each kernel runs in its own working directory under `working_dir_root`, named after the
+    kernel ID so every worker finds it. The directory is removed along with the kernel.
     """
 
-    def __init__(self, mkm: AsyncMultiKernelManager) -> None:
+    def __init__(
+        self,
+        mkm: AsyncMultiKernelManager,
+        pool_targets: dict[str, int] | None = None,
+        pool_max_concurrent_starts: int = 2,
+        kernel_ready_timeout: float = 60,
+        max_kernels: int | None = None,
+        idle_timeout: float | None = None,
+        cull_interval: float = 60,
+        output_limits: OutputLimits | None = None,
+        max_queued_cells: int | None = None,
+        registry: KernelRegistry | None = None,
+        sidecar_client_class: type[KernelSidecarClient] = KernelSidecarClient,
+        kernel_index: KernelIndex | None = None,
+        reattach_timeout: float = 5,
+        max_kernels_per_user: int | None = None,
+        scheduler: FairScheduler | None = None,
+        heartbeat_interval: float | None = None,
+        auto_restart: bool = False,
+        restart_backoff: float = 1,
+        max_restarts: int = 3,
+        working_dir_root: str = "/tmp/jupychat_kernels",
+    ) -> None:
         self._mkm = mkm
-        self._sidecar_clients: dict[str, KernelSidecarClient] = {}
+        self._working_dir_root = working_dir_root
+        self._max_kernels_per_user = max_kernels_per_user
+        self._scheduler = scheduler or FairScheduler()
+        self._kernel_index = kernel_index
+        self._reattach_timeout = reattach_timeout
+        self._sidecar_client_class = sidecar_client_class
+        self._kernels: dict[str, ManagedKernel] = {}
+        self._registry = registry or InMemoryKernelRegistry()
+        self._kernel_ready_timeout = kernel_ready_timeout
+        self._output_limits = output_limits or OutputLimits()
+        self._max_queued_cells = max_queued_cells
+        self._max_kernels = max_kernels
+        self._idle_timeout = idle_timeout
+        self._cull_interval = cull_interval
+        self._culler_task: asyncio.Task | None = None
+        self._heartbeat_interval = heartbeat_interval
+        self._auto_restart = auto_restart
+        self._restart_backoff = restart_backoff
+        self._max_restarts = max_restarts
+        self._monitor_task: asyncio.Task | None = None
+        self._restart_tasks: set[asyncio.Task] = set()
+        # Remember recently culled and dead kernels and the error to raise for them, so callers
+        # get a clear error instead of "not found"
+        self._gone_kernel_ids: OrderedDict[str, type[JupyChatError]] = OrderedDict()
+        self._draining = False
+        self._in_flight = 0  # cells running or waiting for their turn, across all kernels
+        # Checking for room and reserving it for a new kernel happen under this lock, and
+        # reservations count as kernels until the kernel is registered
+        self._kernel_slots = asyncio.Lock()
+        self._launching: defaultdict[str | None, int] = defaultdict(int)  # by user
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._pool = KernelPool(
+            launch=lambda kernel_name: self._launch_kernel(
+                CreateKernelRequest(kernel_name=kernel_name), wait_ready=True
+            ),
+            discard=self._shutdown_kernel,
+            targets=pool_targets or {},
+            max_concurrent_starts=pool_max_concurrent_starts,
+        )
+
+    def start(self) -> None:
+        """Starts filling the pre-warmed kernel pool and culling idle kernels in the background."""
+        metrics.LIVE_KERNELS.set_function(lambda: len(self._kernels))
+        metrics.POOLED_KERNELS.set_function(lambda: self._pool.ready_count)
+        metrics.CELLS_WAITING_FOR_CAPACITY.set_function(lambda: self._scheduler.waiting)
+        self._pool.replenish()
+        if self._idle_timeout and self._culler_task is None:
+            self._culler_task = asyncio.create_task(self._cull_idle_kernels())
+        if self._heartbeat_interval and self._monitor_task is None:
+            self._monitor_task = asyncio.create_task(self._monitor_kernels())
 
-    async def start_kernel(self, request: CreateKernelRequest) -> CreateKernelResponse:
+    async def start_kernel(
+        self, request: CreateKernelRequest, user: str | None = None
+    ) -> CreateKernelResponse:
         """
         Starts a new kernel with the given arguments and returns its ID.
 
+        A pre-warmed kernel from the pool is handed out when one is ready for the requested
+        kernel spec, otherwise a kernel is started on demand. When `max_kernels` kernels are
+        already running, the least recently used idle kernel is shut down to make room. The
+        same goes for the user's own kernels at `max_kernels_per_user`.
+
         Parameters
         ----------
         request : CreateKernelRequest
             A `CreateKernelRequest` object containing the arguments for starting the kernel.
+        user : str, optional
+            The user the kernel is for, only they can run cells on it.
 
         Returns
         -------
@@ -66,24 +287,535 @@ class JupyChatKernelClient:
 
         Raises
         ------
+        ServerDrainingError
+            If the server is shutting down.
+        KernelLimitError
+            If `max_kernels` kernels are running and none of them is idle.
+        KernelQuotaError
+            If the user has `max_kernels_per_user` kernels and none of them is idle.
         Any exceptions raised by the `start_kernel` method of the `MultiKernelManager` object.
 
         """
-        kernel_id = await self._mkm.start_kernel(**request.start_kernel_kwargs)
+        self.check_accepting()
+        async with self._kernel_slots:
+            # Concurrent requests would otherwise all see room for one more kernel while the
+            # kernels before them are still starting
+            if user is not None and self._max_kernels_per_user:
+                await self._make_room_for_user(user)
+            owned_kernels = sum(kernel.owned for kernel in self._kernels.values())
+            launching = sum(self._launching.values())
+            if self._max_kernels and owned_kernels + launching >= self._max_kernels:
+                await self._evict_lru_kernel()
+            self._launching[user] += 1
+
+        started_at = time.perf_counter()
+        try:
+            if pooled := self._pool.acquire(request.kernel_name):
+                kernel_id, sidecar_client = pooled
+                logger.info("Using pre-warmed kernel", kernel_id=kernel_id)
+            else:
+                kernel_id, sidecar_client = await self._launch_kernel(request)
+        finally:
+            self._launching[user] -= 1
+            if not self._launching[user]:
+                del self._launching[user]
+        metrics.KERNEL_START_SECONDS.labels("pool" if pooled else "launch").observe(
+            time.perf_counter() - started_at
+        )
+
+        self._kernels[kernel_id] = ManagedKernel(
+            kernel_id, sidecar_client, kernel_name=request.kernel_name, user=user
+        )
+        await self._registry.register(
+            KernelRecord.from_connection_info(
+                kernel_id, request.kernel_name, self._mkm.get_connection_info(kernel_id), user
+            )
+        )
+        if self._kernel_index:
+            await self._kernel_index.add(
+                KernelIndexEntry(
+                    kernel_id=kernel_id,
+                    kernel_name=request.kernel_name,
+                    connection_file=self._mkm.get_kernel(kernel_id).connection_file,
+                    user=user,
+                )
+            )
+        return CreateKernelResponse(kernel_id=kernel_id)
+
+    async def reattach_kernels(self) -> None:
+        """Reconnects to the kernels that were left running when the server last stopped.
+
+        Kernels that don't answer a `kernel_info_request` within the reattach timeout are
+        forgotten. Does nothing without a kernel index.
+        """
+        if not self._kernel_index:
+            return
+        entries = await self._kernel_index.claim_all()
+        reattached = await asyncio.gather(*(self._reattach_kernel(entry) for entry in entries))
+        logger.info(
+            "Reattached kernels", reattached=sum(reattached), gone=len(entries) - sum(reattached)
+        )
+
+    async def _reattach_kernel(self, entry: KernelIndexEntry) -> bool:
+        try:
+            connection_info = await asyncio.to_thread(entry.read_connection_info)
+            sidecar_client = self._sidecar_client_class(connection_info=connection_info)
+        except (OSError, ValueError):
+            await self._kernel_index.remove(entry.kernel_id)
+            return False
+
+        await sidecar_client.__aenter__()
+        try:
+            await asyncio.wait_for(sidecar_client.kernel_info_request(), self._reattach_timeout)
+        except Exception:
+            logger.info("Kernel is gone, not reattaching", kernel_id=entry.kernel_id)
+            await sidecar_client.__aexit__(None, None, None)
+            await self._kernel_index.remove(entry.kernel_id)
+            return False
+
+        self._kernels[entry.kernel_id] = ManagedKernel(
+            entry.kernel_id, sidecar_client, kernel_name=entry.kernel_name, user=entry.user
+        )
+        await self._registry.register(
+            KernelRecord.from_connection_info(
+                entry.kernel_id, entry.kernel_name, connection_info, entry.user
+            )
+        )
+        await self._kernel_index.release(entry.kernel_id)
+        return True
+
+    async def _get_kernel(self, kernel_id: str, user: str | None = None) -> ManagedKernel:
+        """The kernel with the given ID, raises `KernelAccessError` if it's another user's."""
+        kernel = await self._find_kernel(kernel_id)
+        if user is not None and kernel.user is not None and kernel.user != user:
+            raise KernelAccessError(kernel_id)
+        return kernel
+
+    async def _find_kernel(self, kernel_id: str) -> ManagedKernel:
+        kernel = self._kernels.get(kernel_id)
+        if kernel and kernel.owned:
+            return kernel
+        if error := self._gone_kernel_ids.get(kernel_id):
+            raise error(kernel_id)
+
+        # Kernels owned by another worker are checked against the registry every time, in case
+        # their owner has shut them down since
+        record = await self._registry.get(kernel_id)
+        if record is None:
+            if kernel:
+                await self._detach_kernel(kernel)
+                raise KernelCulledError(kernel_id)
+            raise KernelNotFoundError(kernel_id)
+        return kernel or await self._attach_kernel(record)
+
+    async def _attach_kernel(self, record: KernelRecord) -> ManagedKernel:
+        """Connects a sidecar client to a kernel that another worker started."""
+        sidecar_client = self._sidecar_client_class(connection_info=record.connection_info)
+        await sidecar_client.__aenter__()
+
+        if kernel := self._kernels.get(record.kernel_id):
+            # Another request attached to it while we were connecting
+            await sidecar_client.__aexit__(None, None, None)
+            return kernel
+
+        kernel = ManagedKernel(
+            record.kernel_id,
+            sidecar_client,
+            kernel_name=record.kernel_name,
+            owned=False,
+            user=record.user,
+        )
+        self._kernels[record.kernel_id] = kernel
+        logger.info("Attached to kernel", kernel_id=record.kernel_id, owner=record.owner)
+        return kernel
+
+    async def _detach_kernel(self, kernel: ManagedKernel) -> None:
+        if self._kernels.get(kernel.kernel_id) is kernel:
+            del self._kernels[kernel.kernel_id]
+        await kernel.sidecar_client.__aexit__(None, None, None)
+        logger.info("Detached from kernel", kernel_id=kernel.kernel_id)
+
+    @property
+    def draining(self) -> bool:
+        return self._draining
+
+    def check_accepting(self) -> None:
+        """Raises `ServerDrainingError` once the server stopped taking new kernels and cells."""
+        if self._draining:
+            raise ServerDrainingError()
+
+    def _check_can_queue(self, kernel: ManagedKernel) -> None:
+        self.check_accepting()
+        if (
+            self._max_queued_cells is not None
+            and kernel.lock.locked()
+            and kernel.queued >= self._max_queued_cells
+        ):
+            raise KernelBusyError(kernel.kernel_id, kernel.queued)
+
+    @asynccontextmanager
+    async def _execution_slot(self, kernel: ManagedKernel, cell_id: str) -> AsyncIterator[float]:
+        """Waits for the kernel's earlier cells to finish and for the scheduler to let the cell
+        run, yields how long that took (seconds).
+
+        Raises `KernelBusyError` right away if too many cells are already waiting, or
+        `ServerDrainingError` if the server is shutting down.
+        """
+        self._check_can_queue(kernel)
+        kernel.pending += 1
+        kernel.touch()
+        self._in_flight += 1
+        self._idle.clear()
+        queued_at = time.monotonic()
+        try:
+            # Take the kernel's turn before a scheduler slot, so slots only go to cells that can
+            # run right away
+            async with kernel.lock, self._scheduler.slot(kernel.user):
+                queue_wait = time.monotonic() - queued_at
+                metrics.QUEUE_WAIT_SECONDS.observe(queue_wait)
+                if queue_wait > 1:
+                    logger.info(
+                        "Cell waited for kernel", kernel_id=kernel.kernel_id, queue_wait=queue_wait
+                    )
+                kernel.running_cell_id = cell_id
+                try:
+                    yield queue_wait
+                finally:
+                    kernel.running_cell_id = None
+        finally:
+            kernel.pending -= 1
+            kernel.touch()
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._idle.set()
+            try:
+                await self._registry.touch(kernel.kernel_id)
+            except Exception:
+                logger.exception("Failed to record kernel activity", kernel_id=kernel.kernel_id)
+
+    async def _make_room_for_user(self, user: str) -> None:
+        """Shuts down the user's least recently used idle kernel if they're at their limit."""
+        records = await self._registry.list()
+        # Kernels this worker added are counted even before they're registered, and kernels
+        # it's still starting count too
+        kernel_ids = {record.kernel_id for record in records if record.user == user}
+        kernel_ids.update(k.kernel_id for k in self._kernels.values() if k.owned and k.user == user)
+        kernel_ids.difference_update(self._gone_kernel_ids)
+        if len(kernel_ids) + self._launching.get(user, 0) < self._max_kernels_per_user:
+            return
+
+        idle_kernels = [
+            k for k in self._kernels.values() if k.owned and k.user == user and k.is_idle
+        ]
+        if not idle_kernels:
+            raise KernelQuotaError(self._max_kernels_per_user)
+
+        kernel = min(idle_kernels, key=lambda k: k.last_activity)
+        logger.info("Evicting user's least recently used kernel", kernel_id=kernel.kernel_id)
+        await self._cull_kernel(kernel)
+
+    async def _evict_lru_kernel(self) -> None:
+        idle_kernels = [k for k in self._kernels.values() if k.owned and k.is_idle]
+        if not idle_kernels:
+            raise KernelLimitError(self._max_kernels)
+
+        kernel = min(idle_kernels, key=lambda k: k.last_activity)
+        logger.info("Evicting least recently used kernel", kernel_id=kernel.kernel_id)
+        await self._cull_kernel(kernel)
+
+    async def _cull_kernel(
+        self, kernel: ManagedKernel, error: type[JupyChatError] = KernelCulledError
+    ) -> None:
+        """Shuts down the kernel, later requests for it raise `error`."""
+        if not kernel.owned:
+            # The owner decides when the kernel goes away, just let go of it here
+            await self._detach_kernel(kernel)
+            return
+
+        # Unregister before awaiting anything, so no new cell can start on this kernel
+        del self._kernels[kernel.kernel_id]
+        self._gone_kernel_ids[kernel.kernel_id] = error
+        if len(self._gone_kernel_ids) > 10_000:
+            self._gone_kernel_ids.popitem(last=False)
+        await self._registry.remove(kernel.kernel_id)
+        await self._shutdown_kernel(kernel.kernel_id, kernel.sidecar_client)
+
+    async def _cull_idle_kernels(self) -> None:
+        while True:
+            await asyncio.sleep(self._cull_interval)
+            cutoff = time.monotonic() - self._idle_timeout
+            for kernel in list(self._kernels.values()):
+                if not (kernel.is_idle and kernel.last_activity < cutoff) or kernel.restarting:
+                    continue
+                try:
+                    if kernel.owned and await self._recently_used_elsewhere(kernel):
+                        continue
+                    logger.info("Culling idle kernel", kernel_id=kernel.kernel_id)
+                    await self._cull_kernel(kernel)
+                except Exception:
+                    logger.exception("Failed to cull kernel", kernel_id=kernel.kernel_id)
+
+    async def _monitor_kernels(self) -> None:
+        while True:
+            await asyncio.sleep(self._heartbeat_interval)
+            for kernel in list(self._kernels.values()):
+                # Only kernels this process started have a process to check, other workers
+                # check their own
+                if not kernel.owned or kernel.dead.is_set() or kernel.kernel_id not in self._mkm:
+                    continue
+                try:
+                    alive = self._mkm.is_alive(kernel.kernel_id)
+                    if inspect.isawaitable(alive):
+                        alive = await alive
+                    # Skip kernels shut down while we were checking
+                    if not alive and self._kernels.get(kernel.kernel_id) is kernel:
+                        await self._on_kernel_died(kernel)
+                except Exception:
+                    logger.exception("Failed to check kernel", kernel_id=kernel.kernel_id)
+
+    async def _on_kernel_died(self, kernel: ManagedKernel) -> None:
+        logger.warning(
+            "Kernel died", kernel_id=kernel.kernel_id, running_cell_id=kernel.running_cell_id
+        )
+        metrics.KERNEL_DEATHS.inc()
+        kernel.restarting = self._auto_restart
+        # Fails the running cell, and the cells waiting for their turn once they get it
+        kernel.dead.set()
+        if self._auto_restart:
+            task = asyncio.create_task(self._restart_kernel(kernel))
+            self._restart_tasks.add(task)
+            task.add_done_callback(self._restart_tasks.discard)
+        else:
+            await self._cull_kernel(kernel, KernelDiedError)
+
+    async def _restart_kernel(self, kernel: ManagedKernel) -> None:
+        """Restarts a dead kernel in place, keeping its ID and ports, retrying with backoff.
+
+        Gives up after `max_restarts` restarts without the kernel finishing a cell in between,
+        so a kernel that dies right away doesn't restart forever.
+        """
+        await kernel.sidecar_client.__aexit__(None, None, None)
+        while kernel.restarts < self._max_restarts:
+            if kernel.restarts:
+                await asyncio.sleep(self._restart_backoff * 2 ** (kernel.restarts - 1))
+            if self._kernels.get(kernel.kernel_id) is not kernel:
+                return  # shut down in the meantime
+
+            kernel.restarts += 1
+            sidecar_client = None
+            try:
+                await self._mkm.restart_kernel(kernel.kernel_id, now=True)
+                sidecar_client = self._sidecar_client_class(
+                    connection_info=self._mkm.get_connection_info(kernel.kernel_id)
+                )
+                await sidecar_client.__aenter__()
+                await asyncio.wait_for(
+                    sidecar_client.kernel_info_request(), self._kernel_ready_timeout
+                )
+            except Exception:
+                logger.exception(
+                    "Failed to restart kernel", kernel_id=kernel.kernel_id, attempt=kernel.restarts
+                )
+                if sidecar_client:
+                    await sidecar_client.__aexit__(None, None, None)
+                continue
+
+            kernel.sidecar_client = sidecar_client
+            kernel.state_lost = True
+            kernel.restarting = False
+            kernel.dead.clear()
+            metrics.KERNEL_RESTARTS.labels("restarted").inc()
+            logger.info(
+                "Restarted dead kernel", kernel_id=kernel.kernel_id, attempt=kernel.restarts
+            )
+            return
+
+        logger.error(
+            "Gave up restarting kernel", kernel_id=kernel.kernel_id, attempts=kernel.restarts
+        )
+        metrics.KERNEL_RESTARTS.labels("gave_up").inc()
+        kernel.restarting = False
+        if self._kernels.get(kernel.kernel_id) is kernel:
+            await self._cull_kernel(kernel, KernelDiedError)
+
+    async def _recently_used_elsewhere(self, kernel: ManagedKernel) -> bool:
+        """Whether other workers ran cells on the kernel within the idle timeout."""
+        record = await self._registry.get(kernel.kernel_id)
+        return record is not None and time.time() - record.last_activity < self._idle_timeout
+
+    async def _launch_kernel(
+        self, request: CreateKernelRequest, wait_ready: bool = False
+    ) -> tuple[str, KernelSidecarClient]:
+        """Starts a kernel and connects a sidecar client to it.
+
+        With `wait_ready`, this also waits for the kernel to answer a `kernel_info_request`,
+        so the kernel is fully booted by the time it's handed out.
+        """
+        # Kernels that outlive the server mustn't exit along with it
+        independent = self._kernel_index is not None
+        # Pick the ID up front, to start the kernel in its working directory
+        kernel_id = str(uuid.uuid4())
+        working_dir = self._working_dir(kernel_id)
+        await aiofiles.os.makedirs(working_dir, exist_ok=True)
+        try:
+            kernel_id = await self._mkm.start_kernel(
+                **request.start_kernel_kwargs,
+                kernel_id=kernel_id,
+                cwd=working_dir,
+                independent=independent,
+            )
+        except BaseException:
+            await self._remove_working_dir(kernel_id)
+            raise
         logger.info("Started kernel", kernel_id=kernel_id)
         connection_info = self._mkm.get_connection_info(kernel_id)
-        self._sidecar_clients[kernel_id] = KernelSidecarClient(connection_info=connection_info)
-        await self._sidecar_clients[kernel_id].__aenter__()
-        return CreateKernelResponse(kernel_id=kernel_id)
+        sidecar_client = self._sidecar_client_class(connection_info=connection_info)
+        await sidecar_client.__aenter__()
+
+        if wait_ready:
+            try:
+                await asyncio.wait_for(
+                    sidecar_client.kernel_info_request(), self._kernel_ready_timeout
+                )
+            except Exception:
+                await self._shutdown_kernel(kernel_id, sidecar_client)
+                raise
+
+        return kernel_id, sidecar_client
+
+    async def _shutdown_kernel(self, kernel_id: str, sidecar_client: KernelSidecarClient) -> None:
+        """Shuts down a kernel this worker started or reattached to."""
+        if kernel_id in self._mkm:
+            await sidecar_client.__aexit__(None, None, None)
+            await self._mkm.shutdown_kernel(kernel_id, now=True)
+        else:
+            # Reattached after a restart, there's no process handle, ask the kernel to exit
+            try:
+                await asyncio.wait_for(
+                    sidecar_client.shutdown_request(restart=False), self._reattach_timeout
+                )
+            except Exception:
+                logger.warning("Kernel did not confirm shutdown", kernel_id=kernel_id)
+            await sidecar_client.__aexit__(None, None, None)
+        if self._kernel_index:
+            await self._kernel_index.remove(kernel_id)
+        await self._remove_working_dir(kernel_id)
+        logger.info("Shut down kernel", kernel_id=kernel_id)
+
+    def _working_dir(self, kernel_id: str) -> str:
+        return os.path.join(self._working_dir_root, kernel_id)
 
-    async def run_cell(self, request: RunCellRequest) -> RunCellResponse:
+    async def _remove_working_dir(self, kernel_id: str) -> None:
+        await asyncio.to_thread(shutil.rmtree, self._working_dir(kernel_id), ignore_errors=True)
+
+    @asynccontextmanager
+    async def working_dir(self, kernel_id: str, user: str | None = None) -> AsyncIterator[str]:
+        """
+        Yields the directory the kernel runs in, to write files into for its cells.
+
+        The kernel isn't culled for being idle until the block exits. If it's shut down
+        meanwhile, e.g. because it died, its working directory is removed again on exit and the
+        kernel's error raised, so a file written for it isn't left behind.
+
+        Parameters
+        ----------
+        kernel_id : str
+            The ID of the kernel.
+        user : str, optional
+            The user asking, the kernel must be theirs.
+
+        Yields
+        ------
+        str
+            The absolute path of the kernel's working directory.
+
+        Raises
+        ------
+        KernelNotFoundError
+            If there is no kernel with the given ID.
+        KernelCulledError
+            If the kernel was shut down for being idle or to make room for another kernel,
+            before or during the block.
+        KernelAccessError
+            If the kernel belongs to another user.
+
+        """
+        kernel = await self._get_kernel(kernel_id, user)
+        kernel.uploads += 1
+        kernel.touch()
+        try:
+            yield self._working_dir(kernel.kernel_id)
+        finally:
+            kernel.uploads -= 1
+            kernel.touch()
+            if error := self._gone_kernel_ids.get(kernel.kernel_id):
+                await self._remove_working_dir(kernel.kernel_id)
+                raise error(kernel.kernel_id)
+
+    async def _execute_cells(
+        self,
+        kernel: ManagedKernel,
+        cells: list[tuple[str, "JupyChatOutputHandler", "StatusHandler"]],
+        stop_on_error: bool = True,
+    ) -> AsyncIterator[int]:
+        """Executes the cells on the kernel in order, yielding each cell's index once it's done.
+
+        All cells are sent right away, so the kernel runs them back to back without waiting for
+        a round trip in between. How long each cell took is recorded by its status.
+
+        Raises `KernelDiedError` as soon as the kernel is found dead.
+        """
+        if kernel.dead.is_set():
+            raise KernelDiedError(kernel.kernel_id, restarting=kernel.restarting)
+
+        executions = [
+            # Tasks, so they can be waited on together with the kernel dying
+            asyncio.ensure_future(
+                kernel.sidecar_client.send(
+                    execute_request_action(code, [output_handler, status_handler], stop_on_error)
+                )
+            )
+            for code, output_handler, status_handler in cells
+        ]
+        died = asyncio.ensure_future(kernel.dead.wait())
+        started_at = time.perf_counter()
+        try:
+            for index, (execution, (_, _, status_handler)) in enumerate(zip(executions, cells)):
+                try:
+                    # A dead kernel never replies, don't wait for it
+                    await asyncio.wait({execution, died}, return_when=asyncio.FIRST_COMPLETED)
+                    if not execution.done():
+                        raise KernelDiedError(kernel.kernel_id, restarting=kernel.restarting)
+                    await execution
+                    kernel.restarts = 0
+                finally:
+                    finished_at = time.perf_counter()
+                    metrics.RUN_CELL_SECONDS.labels(
+                        status_handler.execute_reply_status.value
+                    ).observe(finished_at - started_at)
+                    started_at = finished_at
+                yield index
+        finally:
+            died.cancel()
+            for execution in executions:
+                execution.cancel()
+
+    async def run_cell(
+        self, request: RunCellRequest, cell_id: str | None = None, user: str | None = None
+    ) -> RunCellResponse:
         """
         Executes the given code in the kernel associated with the given ID and returns the output.
 
+        Cells for the same kernel run one at a time, in the order they were submitted.
+
         Parameters
         ----------
         request : RunCellRequest
             A `RunCellRequest` object containing the code to execute and the ID of the kernel to use.
+        cell_id : str, optional
+            An ID for this execution, to refer to it in `interrupt_cell`. Generated if not given.
+        user : str, optional
+            The user running the cell, who must be the one who created the kernel.
 
         Returns
         -------
@@ -92,41 +824,410 @@ class JupyChatKernelClient:
 
         Raises
         ------
+        KernelNotFoundError
+            If there is no kernel with the given ID.
+        KernelCulledError
+            If the kernel was shut down for being idle or to make room for another kernel.
+        KernelDiedError
+            If the kernel died before or while running the cell.
+        KernelAccessError
+            If the kernel belongs to another user.
+        KernelBusyError
+            If too many cells are already waiting to run on the kernel.
+        ServerDrainingError
+            If the server is shutting down.
         Any exceptions raised by the `execute_request` method of the `KernelSidecarClient` object.
 
         """
+        kernel = await self._get_kernel(request.kernel_id, user)
+        cell_id = cell_id or uuid.uuid4().hex
+        async with self._execution_slot(kernel, cell_id) as queue_wait:
+            state_lost = kernel.take_state_lost()
+            output_handler = JupyChatOutputHandler(
+                kernel.sidecar_client, cell_id, self._output_limits
+            )
+            status_handler = StatusHandler()
+            async for _ in self._execute_cells(
+                kernel, [(request.code, output_handler, status_handler)]
+            ):
+                pass
+
+        response = await output_handler.to_response(status_handler, request.kernel_id)
+        response.queue_wait_ms = queue_wait * 1000
+        response.kernel_state_lost = state_lost
+        return response
+
+    async def run_cells(
+        self, request: RunCellsRequest, user: str | None = None
+    ) -> RunCellsResponse:
+        """
+        Executes the given cells one after another on the same kernel and returns their outputs.
 
-        sidecar_client = self._sidecar_clients[request.kernel_id]
-        output_handler = JupyChatOutputHandler(sidecar_client, uuid.uuid4().hex)
-        status_handler = StatusHandler()
-        await sidecar_client.execute_request(
-            request.code, handlers=[output_handler, status_handler]
+        The cells are sent to the kernel together and run as one unit in the kernel's queue, so
+        no other cell runs in between them.
+
+        Parameters
+        ----------
+        request : RunCellsRequest
+            The code of each cell, the ID of the kernel to use and whether to skip the remaining
+            cells once one fails.
+        user : str, optional
+            The user running the cells, who must be the one who created the kernel.
+
+        Returns
+        -------
+        RunCellsResponse
+            The output of each cell, in order. Skipped cells are unsuccessful, with an error
+            saying they were not run.
+
+        Raises
+        ------
+        KernelNotFoundError
+            If there is no kernel with the given ID.
+        KernelCulledError
+            If the kernel was shut down for being idle or to make room for another kernel.
+        KernelDiedError
+            If the kernel died before or while running the cell.
+        KernelAccessError
+            If the kernel belongs to another user.
+        KernelBusyError
+            If too many cells are already waiting to run on the kernel.
+        ServerDrainingError
+            If the server is shutting down.
+
+        """
+        kernel = await self._get_kernel(request.kernel_id, user)
+        batch_id = uuid.uuid4().hex
+        async with self._execution_slot(kernel, batch_id) as queue_wait:
+            state_lost = kernel.take_state_lost()
+            cells = [
+                (
+                    code,
+                    JupyChatOutputHandler(
+                        kernel.sidecar_client, f"{batch_id}-{index}", self._output_limits
+                    ),
+                    StatusHandler(),
+                )
+                for index, code in enumerate(request.cells)
+            ]
+            async for _ in self._execute_cells(kernel, cells, request.stop_on_error):
+                pass
+
+        results = await asyncio.gather(
+            *(
+                output_handler.to_response(status_handler, request.kernel_id)
+                for _, output_handler, status_handler in cells
+            )
+        )
+        return RunCellsResponse(
+            kernel_id=request.kernel_id,
+            results=results,
+            queue_wait_ms=queue_wait * 1000,
+            kernel_state_lost=state_lost,
         )
-        return output_handler.to_response(status_handler, request.kernel_id)
 
-    async def shutdown_all(self) -> None:
+    async def stream_cell(
+        self, request: RunCellRequest, user: str | None = None
+    ) -> AsyncIterator[RunCellEvent]:
         """
-        Shuts down all running kernels and their associated sidecar clients.
+        Executes the given code like `run_cell`, but yields the outputs as they arrive.
+
+        The kernel is looked up right away, so a missing kernel raises before any output is
+        produced. Outputs are not collected, the iterator ends with a `status` event.
+
+        Parameters
+        ----------
+        request : RunCellRequest
+            The code to execute and the ID of the kernel to use.
+        user : str, optional
+            The user running the cell, who must be the one who created the kernel.
+
+        Returns
+        -------
+        AsyncIterator[RunCellEvent]
+            The `stream`, `display_data`, `execute_result` and `error` events of the cell, followed
+            by a final `status` event.
 
         Raises
         ------
-        Any exceptions raised by the `__aexit__` method of the `KernelSidecarClient` object or the `shutdown_kernel` method
-        of the `MultiKernelManager` object.
+        KernelNotFoundError
+            If there is no kernel with the given ID.
+        KernelCulledError
+            If the kernel was shut down for being idle or to make room for another kernel.
+        KernelDiedError
+            If the kernel died before or while running the cell.
+        KernelAccessError
+            If the kernel belongs to another user.
+        KernelBusyError
+            If too many cells are already waiting to run on the kernel.
+        ServerDrainingError
+            If the server is shutting down.
 
         """
-        for kernel_id, sidecar_client in self._sidecar_clients.items():
-            await sidecar_client.__aexit__(None, None, None)
-            await self._mkm.shutdown_kernel(kernel_id, now=True)
-            logger.info("Shut down kernel", kernel_id=kernel_id)
+        kernel = await self._get_kernel(request.kernel_id, user)
+        self._check_can_queue(kernel)
+        return self._stream_cells(kernel, request.kernel_id, [request.code])
+
+    async def stream_cells(
+        self, request: RunCellsRequest, user: str | None = None
+    ) -> AsyncIterator[RunCellEvent]:
+        """
+        Executes the given cells like `run_cells`, but yields the outputs as they arrive.
+
+        Every event has the index of its cell, and each cell's outputs end with a `status` event.
+
+        Parameters
+        ----------
+        request : RunCellsRequest
+            The code of each cell, the ID of the kernel to use and whether to skip the remaining
+            cells once one fails.
+        user : str, optional
+            The user running the cells, who must be the one who created the kernel.
+
+        Returns
+        -------
+        AsyncIterator[RunCellEvent]
+            The events of each cell, in order.
+
+        Raises
+        ------
+        KernelNotFoundError
+            If there is no kernel with the given ID.
+        KernelCulledError
+            If the kernel was shut down for being idle or to make room for another kernel.
+        KernelDiedError
+            If the kernel died before or while running the cell.
+        KernelAccessError
+            If the kernel belongs to another user.
+        KernelBusyError
+            If too many cells are already waiting to run on the kernel.
+        ServerDrainingError
+            If the server is shutting down.
+
+        """
+        kernel = await self._get_kernel(request.kernel_id, user)
+        self._check_can_queue(kernel)
+        return self._stream_cells(
+            kernel, request.kernel_id, request.cells, request.stop_on_error, indexed=True
+        )
+
+    async def _stream_cells(
+        self,
+        kernel: ManagedKernel,
+        kernel_id: str,
+        codes: list[str],
+        stop_on_error: bool = True,
+        indexed: bool = False,
+    ) -> AsyncIterator[RunCellEvent]:
+        # A bounded queue, so a slow reader holds up reading from the kernel instead of
+        # buffering every output in memory
+        events: asyncio.Queue[RunCellEvent | None] = asyncio.Queue(maxsize=64)
+        batch_id = uuid.uuid4().hex
+        cells = [
+            (
+                code,
+                JupyChatStreamingOutputHandler(
+                    kernel.sidecar_client,
+                    f"{batch_id}-{index}",
+                    kernel_id,
+                    events,
+                    cell_index=index if indexed else None,
+                    limits=self._output_limits,
+                ),
+                StatusHandler(),
+            )
+            for index, code in enumerate(codes)
+        ]
+
+        async def execute() -> None:
+            running = 0
+            queue_wait = 0.0
+            try:
+                async with self._execution_slot(kernel, batch_id) as queue_wait:
+                    state_lost = kernel.take_state_lost()
+                    async for index in self._execute_cells(kernel, cells, stop_on_error):
+                        _, output_handler, status_handler = cells[index]
+                        running = index + 1
+                        if output_handler.events:
+                            await events.put(
+                                output_handler.status_event(
+                                    status_handler, queue_wait, state_lost if index == 0 else None
+                                )
+                            )
+            except Exception as e:
+                # The response has already started, end the stream with the running cell's
+                # failure instead of cutting it off
+                if isinstance(e, JupyChatError):
+                    error = str(e)
+                else:
+                    logger.exception("Failed to run cells", kernel_id=kernel_id)
+                    error = f"Error executing code: {e}"
+                output_handler = cells[running][1] if running < len(cells) else None
+                if output_handler and output_handler.events:
+                    await events.put(
+                        output_handler.event(
+                            "status", success=False, error=error, queue_wait_ms=queue_wait * 1000
+                        )
+                    )
+            finally:
+                await events.put(None)
+
+        execution = asyncio.create_task(execute())
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            await execution
+        finally:
+            if not execution.done():
+                # The reader went away, let the cells finish without anyone reading their outputs
+                for _, output_handler, _ in cells:
+                    output_handler.events = None
+                while not events.empty():
+                    events.get_nowait()
+
+    def is_cell_running(self, kernel_id: str, cell_id: str) -> bool:
+        """Whether the given cell is the one currently executing on the kernel."""
+        kernel = self._kernels.get(kernel_id)
+        return kernel is not None and kernel.running_cell_id == cell_id
+
+    async def interrupt_cell(self, kernel_id: str, cell_id: str) -> bool:
+        """
+        Interrupts the kernel if the given cell is the one it's currently executing.
+
+        Parameters
+        ----------
+        kernel_id : str
+            The ID of the kernel running the cell.
+        cell_id : str
+            The ID of the cell to interrupt, as given to `run_cell`.
+
+        Returns
+        -------
+        bool
+            Whether the kernel was interrupted. `False` if the cell is still waiting for its turn
+            or already finished.
+
+        """
+        if not self.is_cell_running(kernel_id, cell_id):
+            return False
+
+        kernel = self._kernels[kernel_id]
+        if kernel_id in self._mkm:
+            result = self._mkm.interrupt_kernel(kernel_id)
+            if inspect.isawaitable(result):
+                await result
+        else:
+            # The kernel process belongs to another worker or a previous run of the server,
+            # interrupt it over its control channel
+            await kernel.sidecar_client.interrupt_request()
+        logger.info("Interrupted kernel", kernel_id=kernel_id, cell_id=cell_id)
+        return True
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Stops accepting new kernels and cells, and waits for the cells already submitted to finish.
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait for the submitted cells.
+
+        Returns
+        -------
+        bool
+            Whether all submitted cells finished in time.
+
+        """
+        self._draining = True
+        if not self._in_flight:
+            return True
+
+        logger.info("Draining, waiting for cells to finish", cells=self._in_flight)
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Cells still running after draining", cells=self._in_flight)
+            return False
+        return True
+
+    async def shutdown_all(self, timeout: float | None = None) -> None:
+        """
+        Shuts down all running kernels, including unused pre-warmed ones, and their associated
+        sidecar clients.
+
+        Kernels are shut down concurrently. Kernels that haven't shut down after `timeout`
+        seconds are killed, along with any kernel process left over from pre-warming.
+
+        With a kernel index, handed-out kernels are left running for `reattach_kernels`, only
+        their sidecar clients are closed.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for kernels to shut down before killing them. Waits as long as it
+            takes by default.
+
+        """
+        for task in [self._culler_task, self._monitor_task, *self._restart_tasks]:
+            if task:
+                task.cancel()
+
+        kernels = list(self._kernels.values())
+        tasks = [asyncio.create_task(self._pool.close())]
+        tasks += [asyncio.create_task(self._release_kernel(kernel)) for kernel in kernels]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in done:
+            if not task.cancelled() and task.exception():
+                logger.error("Failed to shut down kernel", exc_info=task.exception())
+        if pending:
+            logger.warning("Kernels did not shut down in time, killing them", timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        # Whatever the manager still runs, besides kernels left for reattaching, was meant to stop
+        kept = {kernel.kernel_id for kernel in kernels if kernel.owned and self._kernel_index}
+        leftover = [kernel_id for kernel_id in self._mkm.list_kernel_ids() if kernel_id not in kept]
+        await asyncio.gather(*(self._kill_kernel(kernel_id) for kernel_id in leftover))
+
+    async def _release_kernel(self, kernel: ManagedKernel) -> None:
+        if kernel.owned and self._kernel_index:
+            await kernel.sidecar_client.__aexit__(None, None, None)
+            logger.info("Left kernel running", kernel_id=kernel.kernel_id)
+        elif kernel.owned:
+            await self._registry.remove(kernel.kernel_id)
+            await self._shutdown_kernel(kernel.kernel_id, kernel.sidecar_client)
+        else:
+            await self._detach_kernel(kernel)
+
+    async def _kill_kernel(self, kernel_id: str) -> None:
+        """Kills a kernel process with SIGKILL and removes its connection file."""
+        try:
+            await self._mkm.signal_kernel(kernel_id, signal.SIGKILL)
+            await self._mkm.cleanup_resources(kernel_id)
+        except Exception:
+            logger.exception("Failed to kill kernel", kernel_id=kernel_id)
+        self._mkm.remove_kernel(kernel_id)
+        try:
+            await self._registry.remove(kernel_id)
+        except Exception:
+            logger.exception("Failed to unregister kernel", kernel_id=kernel_id)
+        await self._remove_working_dir(kernel_id)
+        logger.info("Killed kernel", kernel_id=kernel_id)
 
 
 class JupyChatOutputHandler(OutputHandler):
-    def __init__(self, client: KernelSidecarClient, cell_id: str):
+    def __init__(
+        self, client: KernelSidecarClient, cell_id: str, limits: OutputLimits | None = None
+    ):
         super().__init__(client, cell_id)
 
-        self.stdout = []
-        self.stderr = []
+        self.limits = limits or OutputLimits()
+        self.stdout = BoundedTextBuffer(self.limits.max_stdout_bytes)
+        self.stderr = BoundedTextBuffer(self.limits.max_stderr_bytes)
         self.displays = []
+        self.display_bytes = 0
+        self.displays_dropped = 0
         self.execute_result_data = None
         self.error_in_exec = None
 
@@ -154,16 +1255,74 @@ class JupyChatOutputHandler(OutputHandler):
             case messages.ExecuteResultContent:
                 self.execute_result_data = content.data
             case messages.DisplayDataContent:
-                self.displays.append((content.data, content.metadata))
+                self.add_display(content.data, content.metadata)
             case messages.ErrorContent:
                 self.error_in_exec = f"{content.ename}: {content.evalue}"
             case _:
                 logger.warning("Unknown content type", content=content)
 
-    def to_response(self, status: "StatusHandler", kernel_id: str) -> RunCellResponse:
+    def add_display(self, data: dict, metadata: dict) -> None:
+        """Keeps the display, unless that would go over the display count or size limits."""
+        size = mimebundle_size(data)
+        max_displays, max_display_bytes = self.limits.max_displays, self.limits.max_display_bytes
+        if (max_displays is not None and len(self.displays) >= max_displays) or (
+            max_display_bytes is not None and self.display_bytes + size > max_display_bytes
+        ):
+            self.displays_dropped += 1
+            return
+
+        self.displays.append((data, metadata))
+        self.display_bytes += size
+
+    def reduce_outputs(self, outputs: list[DisplayData]) -> OutputReduction | None:
+        """Applies the mimebundle policy to the outputs, returns how much smaller they got."""
+        policy = self.limits.mimebundle_policy
+        if policy is None:
+            return None
+
+        original_bytes = reduced_bytes = 0
+        dropped_mime_types = set()
+        for output in outputs:
+            if not output.data:
+                continue
+            data = policy.reduce(output.data)
+            original_bytes += mimebundle_size(output.data)
+            reduced_bytes += mimebundle_size(data)
+            dropped_mime_types.update(output.data.keys() - data.keys())
+            output.data = data
+
+        if reduced_bytes == original_bytes:
+            return None
+        metrics.REDUCED_OUTPUT_BYTES.inc(original_bytes - reduced_bytes)
+        return OutputReduction(
+            original_bytes=original_bytes,
+            reduced_bytes=reduced_bytes,
+            dropped_mime_types=sorted(dropped_mime_types),
+        )
+
+    def cell_error(self, status: "StatusHandler") -> str | None:
+        """The error the cell raised, or why the kernel didn't run it."""
+        if status.execute_reply_status == CellStatus.aborted:
+            return self.error_in_exec or ABORTED_CELL_ERROR
+        return self.error_in_exec
+
+    def truncation(self) -> OutputTruncation | None:
+        """What was left out of the response because of the output limits, if anything."""
+        if not (self.stdout.elided_bytes or self.stderr.elided_bytes or self.displays_dropped):
+            return None
+        return OutputTruncation(
+            stdout_elided_bytes=self.stdout.elided_bytes,
+            stderr_elided_bytes=self.stderr.elided_bytes,
+            displays_dropped=self.displays_dropped,
+        )
+
+    async def to_response(self, status: "StatusHandler", kernel_id: str) -> RunCellResponse:
         """
         Converts the output of the cell to a `RunCellResponse` object.
 
+        Formatting the outputs and decoding their images is CPU bound, so it runs in the output
+        thread pool instead of on the event loop.
+
         Parameters
         ----------
         status : StatusHandler
@@ -177,28 +1336,118 @@ class JupyChatOutputHandler(OutputHandler):
             A `RunCellResponse` object containing the output of the executed cell.
 
         """
-        ip = safe_get_ipython()
+        return await run_in_output_executor(self.build_response, status, kernel_id)
 
+    def build_response(self, status: "StatusHandler", kernel_id: str) -> RunCellResponse:
         execute_result = None
         if self.execute_result_data:
-            formatted = ip.display_formatter.format(self.execute_result_data)
-            execute_result = DisplayData.from_tuple(formatted)
-            execute_result = image_store.store_images(execute_result)
+            execute_result = format_execute_result(self.execute_result_data)
 
-        displays = [DisplayData(data=data, metadata=metadata) for data, metadata in self.displays]
-        displays = [image_store.store_images(d) for d in displays]
+        displays = [format_display(data, metadata) for data, metadata in self.displays]
+        reduced = self.reduce_outputs([execute_result, *displays] if execute_result else displays)
+        stdout, stderr, truncated = (
+            self.stdout.getvalue(),
+            self.stderr.getvalue(),
+            self.truncation(),
+        )
+
+        metrics.CELL_OUTPUT_BYTES.observe(len(stdout) + len(stderr) + self.display_bytes)
+        if truncated:
+            metrics.TRUNCATED_OUTPUTS.inc()
 
         return RunCellResponse(
             success=status.execute_reply_status == CellStatus.ok,
             kernel_id=kernel_id,
-            error=self.error_in_exec,
-            stdout="".join(self.stdout),
-            stderr="".join(self.stderr),
+            error=self.cell_error(status),
+            stdout=stdout,
+            stderr=stderr,
             execute_result=execute_result,
             displays=displays,
+            truncated=truncated,
+            reduced=reduced,
         )
 
 
+class JupyChatStreamingOutputHandler(JupyChatOutputHandler):
+    def __init__(
+        self,
+        client: KernelSidecarClient,
+        cell_id: str,
+        kernel_id: str,
+        events: asyncio.Queue | None,
+        cell_index: int | None = None,
+        limits: OutputLimits | None = None,
+    ):
+        super().__init__(client, cell_id, limits)
+        self.kernel_id = kernel_id
+        self.events = events
+        self.cell_index = cell_index
+
+    def event(self, event: str, **kwargs) -> RunCellEvent:
+        return RunCellEvent(
+            event=event, kernel_id=self.kernel_id, cell_index=self.cell_index, **kwargs
+        )
+
+    def status_event(
+        self, status: "StatusHandler", queue_wait: float, kernel_state_lost: bool | None = None
+    ) -> RunCellEvent:
+        """The final event of the cell, once it finished."""
+        return self.event(
+            "status",
+            success=status.execute_reply_status == CellStatus.ok,
+            error=self.cell_error(status),
+            queue_wait_ms=queue_wait * 1000,
+            kernel_state_lost=kernel_state_lost,
+        )
+
+    def format_output(self, format: Callable[..., DisplayData], *args) -> DisplayData:
+        """Builds an output with `format` and applies the mimebundle policy to it."""
+        output = format(*args)
+        self.reduce_outputs([output])
+        return output
+
+    async def add_cell_content(self, content: ContentType) -> None:
+        """
+        Forwards the given content to the events queue as a `RunCellEvent`.
+
+        Parameters
+        ----------
+        content : ContentType
+            The content to forward.
+
+        Returns
+        -------
+        None
+
+        """
+        event = None
+        match type(content):
+            case messages.StreamContent:
+                event = self.event("stream", name=content.name, text=content.text)
+            case messages.ExecuteResultContent:
+                event = self.event(
+                    "execute_result",
+                    data=await run_in_output_executor(
+                        self.format_output, format_execute_result, content.data
+                    ),
+                )
+            case messages.DisplayDataContent:
+                event = self.event(
+                    "display_data",
+                    data=await run_in_output_executor(
+                        self.format_output, format_display, content.data, content.metadata
+                    ),
+                )
+            case messages.ErrorContent:
+                self.error_in_exec = f"{content.ename}: {content.evalue}"
+                event = self.event("error", error=self.error_in_exec)
+            case _:
+                logger.warning("Unknown content type", content=content)
+
+        if event and self.events:
+            await self.events.put(event)
+
+
 class StatusHandler(Handler):
     def __init__(self):
         super().__init__()
@@ -208,8 +1457,66 @@ class StatusHandler(Handler):
         self.execute_reply_status = msg.content.status
 
 
+def build_nb_gpt_kernel_client(
+    settings: Settings,
+    mkm: AsyncMultiKernelManager,
+    sidecar_client_class: type[KernelSidecarClient] = KernelSidecarClient,
+) -> JupyChatKernelClient:
+    """Creates a kernel client for the given kernel manager, configured from the settings."""
+    return JupyChatKernelClient(
+        mkm,
+        pool_targets=settings.kernel_pool_targets,
+        pool_max_concurrent_starts=settings.kernel_pool_max_concurrent_starts,
+        kernel_ready_timeout=settings.kernel_ready_timeout_sec,
+        max_kernels=settings.max_kernels,
+        idle_timeout=settings.kernel_idle_timeout_sec,
+        cull_interval=settings.kernel_cull_interval_sec,
+        output_limits=OutputLimits(
+            max_stdout_bytes=settings.max_stdout_bytes,
+            max_stderr_bytes=settings.max_stderr_bytes,
+            max_displays=settings.max_displays,
+            max_display_bytes=settings.max_display_bytes,
+            mimebundle_policy=MimeBundlePolicy(
+                mime_priority=settings.output_mime_priority,
+                max_mime_types=settings.output_max_mime_types,
+                max_representation_bytes=settings.output_max_representation_bytes,
+                html_table_head_rows=settings.output_html_table_head_rows,
+                html_table_tail_rows=settings.output_html_table_tail_rows,
+            ),
+        ),
+        max_queued_cells=settings.max_queued_cells_per_kernel,
+        registry=build_kernel_registry(settings),
+        sidecar_client_class=sidecar_client_class,
+        kernel_index=KernelIndex(settings.kernel_index_dir) if settings.reattach_kernels else None,
+        reattach_timeout=settings.kernel_reattach_timeout_sec,
+        max_kernels_per_user=settings.max_kernels_per_user,
+        scheduler=FairScheduler(
+            max_concurrent=settings.max_concurrent_executions,
+            max_per_user=settings.max_concurrent_executions_per_user,
+            weights=settings.user_weights,
+        ),
+        heartbeat_interval=settings.kernel_heartbeat_interval_sec,
+        auto_restart=settings.kernel_auto_restart,
+        restart_backoff=settings.kernel_restart_backoff_sec,
+        max_restarts=settings.kernel_max_restarts,
+        working_dir_root=settings.kernel_working_dir,
+    )
+
+
+def build_kernel_manager(connection_dir: str) -> AsyncMultiKernelManager:
+    """Creates the kernel manager, with jupyter_client's own restarting of dead kernels off.
+
+    Its restarter would quietly replace a dead kernel before the heartbeat notices, leaving the
+    running cell waiting forever and the kernel's state lost even without `kernel_auto_restart`.
+    `JupyChatKernelClient` watches for dead kernels itself.
+    """
+    return AsyncMultiKernelManager(
+        connection_dir=connection_dir, config=Config({"KernelManager": {"autorestart": False}})
+    )
+
+
 @lru_cache(maxsize=1)
 def get_nb_gpt_kernel_client() -> JupyChatKernelClient:
     settings = get_settings()
-    mkm = AsyncMultiKernelManager(connection_dir=settings.jupyter_connection_dir)
-    return JupyChatKernelClient(mkm)
+    mkm = build_kernel_manager(settings.jupyter_connection_dir)
+    return build_nb_gpt_kernel_client(settings, mkm)
@@ -0,0 +1,242 @@
+"""
+Minimal Prometheus metrics, rendered in the text exposition format for `/metrics`.
+
+Classes:
+- Counter: A value that only goes up.
+- Gauge: A value that goes up and down.
+- Histogram: Observations counted into cumulative buckets.
+- MetricsRegistry: Holds the metrics and renders them.
+"""
+import bisect
+import threading
+from typing import Callable, Iterable
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+def _format_labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...], **extra) -> str:
+    pairs = list(zip(labelnames, labelvalues)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], "Metric"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *labelvalues: str) -> "Metric":
+        """The metric for the given label values, created on first use."""
+        labelvalues = tuple(str(v) for v in labelvalues)
+        if child := self._children.get(labelvalues):
+            return child
+        with self._lock:
+            return self._children.setdefault(labelvalues, self._new_child())
+
+    def _new_child(self) -> "Metric":
+        return type(self)(self.name, self.documentation)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        if self.labelnames:
+            for labelvalues, child in list(self._children.items()):
+                lines.extend(child._samples_with(self.labelnames, labelvalues))
+        else:
+            lines.extend(self._samples_with((), ()))
+        return "\n".join(lines)
+
+    def _samples_with(self, labelnames: tuple[str, ...], labelvalues: tuple[str, ...]):
+        raise NotImplementedError
+
+
+class _ValueMetric(Metric):
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        function: Callable[[], float] | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+        self.function = function
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Reads the value from `function` whenever the metrics are rendered."""
+        self.function = function
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _samples_with(self, labelnames, labelvalues):
+        value = self.function() if self.function else self.value
+        return [f"{self.name}{_format_labels(labelnames, labelvalues)} {value}"]
+
+
+class Counter(_ValueMetric):
+    type_name = "counter"
+
+
+class Gauge(_ValueMetric):
+    type_name = "gauge"
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def _samples_with(self, labelnames, labelvalues):
+        samples = []
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets + (float("inf"),), self.bucket_counts):
+            cumulative += count
+            le = "+Inf" if upper_bound == float("inf") else repr(upper_bound)
+            labels = _format_labels(labelnames, labelvalues, le=le)
+            samples.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, labelvalues)
+        samples.append(f"{self.name}_sum{labels} {self.sum}")
+        samples.append(f"{self.name}_count{labels} {self.count}")
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+KERNEL_START_SECONDS = registry.register(
+    Histogram(
+        "jupychat_kernel_start_seconds",
+        "Time to hand out a kernel, by whether it came from the pre-warmed pool.",
+        labelnames=("source",),
+    )
+)
+LIVE_KERNELS = registry.register(
+    Gauge("jupychat_live_kernels", "Kernels this worker has handed out or attached to.")
+)
+POOLED_KERNELS = registry.register(
+    Gauge("jupychat_pooled_kernels", "Pre-warmed kernels ready to be handed out.")
+)
+RUN_CELL_SECONDS = registry.register(
+    Histogram(
+        "jupychat_run_cell_seconds",
+        "Time to execute a cell, excluding the time it waited for its turn.",
+        labelnames=("status",),
+    )
+)
+QUEUE_WAIT_SECONDS = registry.register(
+    Histogram(
+        "jupychat_queue_wait_seconds", "Time cells waited for earlier cells on the same kernel."
+    )
+)
+KERNEL_DEATHS = registry.register(
+    Counter(
+        "jupychat_kernel_deaths_total", "Kernels found dead, e.g. killed for running out of memory."
+    )
+)
+KERNEL_RESTARTS = registry.register(
+    Counter(
+        "jupychat_kernel_restarts_total",
+        "Dead kernels restarted, or given up on after too many restarts in a row.",
+        ("result",),
+    )
+)
+CELL_OUTPUT_BYTES = registry.register(
+    Histogram(
+        "jupychat_cell_output_bytes",
+        "Size of the stdout, stderr and displays collected for a cell.",
+        buckets=BYTES_BUCKETS,
+    )
+)
+TRUNCATED_OUTPUTS = registry.register(
+    Counter("jupychat_truncated_outputs_total", "Cells whose output was over the output limits.")
+)
+REDUCED_OUTPUT_BYTES = registry.register(
+    Counter(
+        "jupychat_reduced_output_bytes_total",
+        "Bytes of output representations dropped or shortened by the MIME bundle policy.",
+    )
+)
+IMAGE_STORE_BYTES = registry.register(
+    Gauge("jupychat_image_store_bytes", "Bytes of images held by the image store.")
+)
+IMAGE_STORE_IMAGES = registry.register(
+    Gauge("jupychat_image_store_images", "Images held by the image store.")
+)
+IMAGE_STORE_LOOKUPS = registry.register(
+    Counter("jupychat_image_store_lookups_total", "Image lookups by result.", ("result",))
+)
+IMAGE_STORE_EVICTIONS = registry.register(
+    Counter("jupychat_image_store_evictions_total", "Images evicted to stay under the limits.")
+)
+JWT_VERIFY_SECONDS = registry.register(
+    Histogram(
+        "jupychat_jwt_verify_seconds",
+        "Time to verify a bearer token, by whether it was already cached.",
+        labelnames=("cache",),
+        buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1, 1),
+    )
+)
+IDEMPOTENT_REPLAYS = registry.register(
+    Counter(
+        "jupychat_idempotent_replays_total",
+        "Retried requests answered without running the cell again, by whether the first request"
+        " was still running (joined) or done (cached).",
+        ("replay",),
+    )
+)
+CELLS_WAITING_FOR_CAPACITY = registry.register(
+    Gauge(
+        "jupychat_cells_waiting_for_capacity",
+        "Cells whose turn on their kernel came, waiting for the concurrent execution limits.",
+    )
+)
+UPLOADED_BYTES = registry.register(
+    Counter("jupychat_uploaded_bytes_total", "Bytes of files uploaded into kernels.")
+)
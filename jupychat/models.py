@@ -1,9 +1,11 @@
 """Taken from https://github.com/rgbkrk/dangermode/blob/main/dangermode/models.py"""
-from typing import List, Optional, Tuple
+from enum import Enum
+from typing import List, Literal, Optional, Tuple
 
-from jupyter_client.kernelspec import NATIVE_KERNEL_NAME
 from pydantic import BaseModel, Field
 
+from jupychat.settings import NATIVE_KERNEL_NAME
+
 
 class RunCellRequest(BaseModel):
     """A request to run a cell in the notebook."""
@@ -14,6 +16,16 @@ class RunCellRequest(BaseModel):
     code: str = Field(description="The code to execute in the cell.")
 
 
+class IdempotentRunCellRequest(RunCellRequest):
+    """A request to run a cell, which retries with the same key don't run again."""
+
+    idempotency_key: str | None = Field(
+        description="A unique key for this cell. Retrying with the same key returns the first "
+        "result instead of running the code again. Can also be sent as an `Idempotency-Key` "
+        "header."
+    )
+
+
 class DisplayData(BaseModel):
     """Both display_data and execute_result messages use this format."""
 
@@ -26,16 +38,50 @@ class DisplayData(BaseModel):
 
 
 class ImageData(BaseModel):
-    """Public URL to the image data."""
+    """Public URL to the image data, kept either in memory or in a file on disk."""
 
-    data: bytes
     url: str
+    etag: str
+    size: int
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+    expires_at: Optional[float] = None
+    used_at_ns: Optional[int] = None  # when this worker last used the file at `path`
+
+
+class ImageStoreStats(BaseModel):
+    """Counters for the image store."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    images: int = 0
+    resident_bytes: int = 0
 
 
 class ErrorData(BaseModel):
     error: str
 
 
+class OutputTruncation(BaseModel):
+    """What was left out of a cell's output because it was too large."""
+
+    stdout_elided_bytes: int = Field(0, description="Bytes dropped from the middle of stdout.")
+    stderr_elided_bytes: int = Field(0, description="Bytes dropped from the middle of stderr.")
+    displays_dropped: int = Field(0, description="Number of displays that were left out.")
+
+
+class OutputReduction(BaseModel):
+    """How much smaller a cell's displays and execute result got by keeping fewer and shorter
+    representations of each."""
+
+    original_bytes: int = Field(description="Approximate size of the representations produced.")
+    reduced_bytes: int = Field(description="Approximate size of the representations returned.")
+    dropped_mime_types: List[str] = Field(
+        [], description="Representations left out, like `text/html` when `text/plain` is kept."
+    )
+
+
 class RunCellResponse(BaseModel):
     """A bundle of outputs, stdout, stderr, and whether we succeeded or failed"""
 
@@ -46,16 +92,99 @@ class RunCellResponse(BaseModel):
     stderr: Optional[str] = ""
     displays: List[DisplayData] = []
     kernel_id: str
+    truncated: Optional[OutputTruncation] = None
+    reduced: Optional[OutputReduction] = None
+    queue_wait_ms: Optional[float] = Field(
+        None, description="How long the cell waited for earlier cells on the same kernel."
+    )
+    kernel_state_lost: bool = Field(
+        False,
+        description="The kernel died and was restarted since its last cell, so the variables and "
+        "imports of earlier cells are gone.",
+    )
+
+
+class RunCellsRequest(BaseModel):
+    """A request to run several cells in a row on the same kernel."""
+
+    kernel_id: str | None = Field(
+        description="The previously created kernel_id. If not set, a new kernel will be created."
+    )
+    cells: List[str] = Field(min_items=1, description="The code of each cell, in order.")
+    stop_on_error: bool = Field(True, description="Skip the remaining cells once a cell fails.")
+
+
+class RunCellsResponse(BaseModel):
+    """The outputs of each cell of a batch, in order."""
+
+    kernel_id: str
+    results: List[RunCellResponse]
+    queue_wait_ms: Optional[float] = Field(
+        None, description="How long the batch waited for earlier cells on the same kernel."
+    )
+    kernel_state_lost: bool = Field(
+        False,
+        description="The kernel died and was restarted since its last cell, so the variables and "
+        "imports of earlier cells are gone.",
+    )
+
+
+class RunCellEvent(BaseModel):
+    """A single output of a running cell, or its final status."""
+
+    event: Literal["stream", "display_data", "execute_result", "error", "status"]
+    kernel_id: str
+    cell_index: Optional[int] = Field(None, description="The cell's position in a batch.")
+    name: Optional[str] = Field(None, description="The stream name, stdout or stderr.")
+    text: Optional[str] = Field(None, description="The text written to the stream.")
+    data: Optional[DisplayData] = None
+    error: Optional[str] = None
+    success: Optional[bool] = Field(None, description="Whether the cell succeeded, on `status`.")
+    queue_wait_ms: Optional[float] = None
+    kernel_state_lost: Optional[bool] = Field(
+        None,
+        description="On the first `status`, whether the kernel was restarted, see `/run-cell`.",
+    )
+
+
+class SubmitJobRequest(IdempotentRunCellRequest):
+    """A request to run a cell in the background."""
+
+    timeout_sec: Optional[float] = Field(
+        None, description="Seconds the cell may run before it is interrupted."
+    )
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+    timed_out = "timed_out"
+    interrupted = "interrupted"
+
+
+class JobResponse(BaseModel):
+    job_id: str = Field(description="The ID of the job, to fetch its result with.")
+    kernel_id: str
+    status: JobStatus
+    result: Optional[RunCellResponse] = Field(
+        None, description="The cell's output, once the job has finished."
+    )
+    error: Optional[str] = None
 
 
 class CreateFileRequest(BaseModel):
-    """A request to create a file in the notebook."""
+    """A request to create a file in the kernel's working directory."""
 
-    path: str
+    path: str = Field(
+        ..., description="Where to write the file, relative to the kernel's working directory."
+    )
 
 
 class CreateFileResponse(BaseModel):
-    path: str
+    path: str = Field(..., description="The path cells can open the file with.")
+    size: int = Field(..., description="The size of the file, in bytes.")
 
 
 class CreateKernelRequest(BaseModel):
@@ -0,0 +1,198 @@
+"""
+Limits on how much output a single cell execution collects.
+
+Classes:
+- OutputLimits: The per-cell caps on stdout, stderr and displays.
+- MimeBundlePolicy: Which representations of an output to keep, and how large they may be.
+- BoundedTextBuffer: A text buffer that keeps the head and tail of its text within a byte budget.
+
+Functions:
+- mimebundle_size: Approximate size of a mimebundle.
+- truncate_html_tables: Keep the first and last rows of the tables in an HTML document.
+"""
+import json
+from collections import deque
+from dataclasses import dataclass, field
+
+# Representations that are still useful with their middle cut out
+_TRUNCATABLE_MIME_TYPES = {"text/plain", "text/markdown"}
+
+
+@dataclass
+class MimeBundlePolicy:
+    """Which representations of a display or execute result to keep, and how large they may be.
+
+    Representations are ranked by `mime_priority`, types it doesn't list coming after the ones
+    it does, in their original order. The first `max_mime_types` of them are kept. A
+    representation over `max_representation_bytes` is shortened: HTML tables keep their first
+    `html_table_head_rows` and last `html_table_tail_rows` rows, plain text and markdown their
+    start and end. Representations that are still too large are dropped, making room for the
+    next one.
+    """
+
+    mime_priority: list[str] = field(default_factory=list)
+    max_mime_types: int | None = None
+    max_representation_bytes: int | None = None
+    html_table_head_rows: int = 5
+    html_table_tail_rows: int = 5
+
+    def _rank(self, mime_type: str) -> int:
+        try:
+            return self.mime_priority.index(mime_type)
+        except ValueError:
+            return len(self.mime_priority)
+
+    def reduce(self, data: dict) -> dict:
+        """The mimebundle with only the representations the policy keeps, shortened if needed."""
+        reduced = {}
+        for mime_type in sorted(data, key=self._rank):
+            if self.max_mime_types is not None and len(reduced) >= self.max_mime_types:
+                break
+            value = self._shorten(mime_type, data[mime_type])
+            if value is not None:
+                reduced[mime_type] = value
+        return reduced
+
+    def _shorten(self, mime_type: str, value):
+        """The value within `max_representation_bytes`, or None if it can't be shortened."""
+        max_bytes = self.max_representation_bytes
+        if max_bytes is None or mimebundle_size({mime_type: value}) <= max_bytes:
+            return value
+        if not isinstance(value, str):
+            return None
+
+        if mime_type == "text/html":
+            value = truncate_html_tables(
+                value, self.html_table_head_rows, self.html_table_tail_rows
+            )
+            return value if len(value) <= max_bytes else None
+        if mime_type in _TRUNCATABLE_MIME_TYPES:
+            buffer = BoundedTextBuffer(max_bytes)
+            buffer.append(value)
+            return buffer.getvalue()
+        return None
+
+
+@dataclass
+class OutputLimits:
+    """Per-cell output caps, `None` means unlimited."""
+
+    max_stdout_bytes: int | None = None
+    max_stderr_bytes: int | None = None
+    max_displays: int | None = None
+    max_display_bytes: int | None = None
+    mimebundle_policy: MimeBundlePolicy | None = None
+
+
+class BoundedTextBuffer:
+    """Collects text, keeping at most `max_bytes` of it.
+
+    Once the budget is used up, the first half of the budget keeps the start of the text and
+    the second half is a ring buffer with the most recent text. Everything in between is
+    dropped and replaced with a marker saying how many bytes were elided.
+    """
+
+    def __init__(self, max_bytes: int | None = None):
+        self.max_bytes = max_bytes
+        self.elided_bytes = 0
+        self._chunks: list[str] = []  # only used without a budget
+
+        self._head_limit = max_bytes // 2 if max_bytes is not None else 0
+        self._tail_limit = max_bytes - self._head_limit if max_bytes is not None else 0
+        self._head: list[bytes] = []
+        self._head_size = 0
+        self._tail: deque[bytes] = deque()
+        self._tail_size = 0
+
+    def append(self, text: str) -> None:
+        if self.max_bytes is None:
+            self._chunks.append(text)
+            return
+
+        data = text.encode()
+        if room := self._head_limit - self._head_size:
+            self._head.append(data[:room])
+            self._head_size += len(self._head[-1])
+            data = data[room:]
+
+        if data:
+            self._tail.append(data)
+            self._tail_size += len(data)
+            self._trim_tail()
+
+    def _trim_tail(self) -> None:
+        while self._tail_size > self._tail_limit:
+            excess = self._tail_size - self._tail_limit
+            oldest = self._tail[0]
+            if len(oldest) <= excess:
+                self._tail.popleft()
+                dropped = len(oldest)
+            else:
+                self._tail[0] = oldest[excess:]
+                dropped = excess
+            self._tail_size -= dropped
+            self.elided_bytes += dropped
+
+    def getvalue(self) -> str:
+        if self.max_bytes is None:
+            return "".join(self._chunks)
+
+        if not self.elided_bytes:
+            # Decoded together, a character split between head and tail stays whole
+            return b"".join([*self._head, *self._tail]).decode(errors="ignore")
+
+        # Cutting at byte boundaries may split a multi-byte character, drop the pieces
+        head = b"".join(self._head).decode(errors="ignore")
+        tail = b"".join(self._tail).decode(errors="ignore")
+        return f"{head}\n... [{self.elided_bytes} bytes elided] ...\n{tail}"
+
+
+def mimebundle_size(data: dict | None) -> int:
+    """Approximate size of a mimebundle, in characters."""
+    if not data:
+        return 0
+    return sum(len(v) if isinstance(v, str) else len(json.dumps(v)) for v in data.values())
+
+
+def truncate_html_tables(html: str, head_rows: int, tail_rows: int) -> str:
+    """Replaces the rows between the first `head_rows` and last `tail_rows` of each table body
+    with a single row saying how many were elided, like pandas does for long DataFrames.
+
+    Tables are found with plain string searches rather than a parser or regex, which is much
+    faster on the large tables this is for. Tags must be lowercase, as pandas writes them.
+    """
+    pieces = []
+    position = 0
+    while (start := html.find("<tbody", position)) != -1:
+        body_start = html.find(">", start) + 1
+        body_end = html.find("</tbody>", body_start)
+        if not body_start or body_end == -1:
+            break
+        pieces += [
+            html[position:body_start],
+            _truncate_rows(html[body_start:body_end], head_rows, tail_rows),
+        ]
+        position = body_end
+    pieces.append(html[position:])
+    return "".join(pieces)
+
+
+def _truncate_rows(body: str, head_rows: int, tail_rows: int) -> str:
+    elided = body.count("<tr") - head_rows - tail_rows
+    if elided <= 1:
+        return body
+
+    head_end = 0
+    for _ in range(head_rows):
+        head_end = body.find("</tr>", head_end)
+        if head_end == -1:
+            return body  # rows without end tags
+        head_end += len("</tr>")
+    tail_start = len(body)
+    for _ in range(tail_rows):
+        tail_start = body.rfind("<tr", head_end, tail_start)
+
+    first_row = body[body.find("<tr") : body.find("</tr>")]
+    columns = max(first_row.count("<td") + first_row.count("<th"), 1)
+    marker = f'\n<tr><td colspan="{columns}">... {elided} rows elided ...</td></tr>\n'
+    return body[:head_end] + marker + body[tail_start:]
@@ -0,0 +1,180 @@
+"""
+A registry of running kernels, so any worker process can find a kernel another one started.
+
+Classes:
+- KernelRecord: What a worker needs to know to connect to a kernel.
+- KernelRegistry: The registry interface.
+- InMemoryKernelRegistry: A registry for a single worker process.
+- SQLiteKernelRegistry: A registry shared by all worker processes on one host.
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+
+from pydantic import BaseModel, Field
+
+from jupychat.settings import Settings
+
+
+def worker_id() -> str:
+    """Identifies this worker process among the processes sharing a registry."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class KernelRecord(BaseModel):
+    kernel_id: str
+    kernel_name: str
+    owner: str = Field(description="The worker that started the kernel and manages its process.")
+    connection_info: dict
+    last_activity: float = Field(default_factory=time.time)
+    user: str | None = Field(None, description="The user who created the kernel.")
+
+    @classmethod
+    def from_connection_info(
+        cls, kernel_id: str, kernel_name: str, connection_info: dict, user: str | None = None
+    ) -> "KernelRecord":
+        # The session key comes back as bytes from the kernel manager
+        connection_info = {
+            k: v.decode() if isinstance(v, bytes) else v for k, v in connection_info.items()
+        }
+        return cls(
+            kernel_id=kernel_id,
+            kernel_name=kernel_name,
+            owner=worker_id(),
+            connection_info=connection_info,
+            user=user,
+        )
+
+
+class KernelRegistry:
+    """Maps kernel IDs to the worker that owns them and how to connect to them."""
+
+    async def register(self, record: KernelRecord) -> None:
+        raise NotImplementedError
+
+    async def get(self, kernel_id: str) -> KernelRecord | None:
+        raise NotImplementedError
+
+    async def touch(self, kernel_id: str) -> None:
+        """Records that a cell just ran on the kernel."""
+        raise NotImplementedError
+
+    async def remove(self, kernel_id: str) -> None:
+        raise NotImplementedError
+
+    async def list(self) -> list[KernelRecord]:
+        raise NotImplementedError
+
+
+class InMemoryKernelRegistry(KernelRegistry):
+    def __init__(self) -> None:
+        self._records: dict[str, KernelRecord] = {}
+
+    async def register(self, record: KernelRecord) -> None:
+        self._records[record.kernel_id] = record
+
+    async def get(self, kernel_id: str) -> KernelRecord | None:
+        return self._records.get(kernel_id)
+
+    async def touch(self, kernel_id: str) -> None:
+        if record := self._records.get(kernel_id):
+            record.last_activity = time.time()
+
+    async def remove(self, kernel_id: str) -> None:
+        self._records.pop(kernel_id, None)
+
+    async def list(self) -> list[KernelRecord]:
+        return list(self._records.values())
+
+
+class SQLiteKernelRegistry(KernelRegistry):
+    """A registry in a SQLite database, shared by the worker processes on one host.
+
+    Queries run in a thread, so they don't block the event loop.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS kernels (
+                    kernel_id TEXT PRIMARY KEY,
+                    kernel_name TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    connection_info TEXT NOT NULL,
+                    last_activity REAL NOT NULL,
+                    user TEXT
+                )
+                """
+            )
+            # Registries created before kernels had users
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(kernels)")]
+            if "user" not in columns:
+                conn.execute("ALTER TABLE kernels ADD COLUMN user TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _execute(self, query: str, params: tuple = ()) -> list[tuple]:
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    async def _run(self, query: str, params: tuple = ()) -> list[tuple]:
+        return await asyncio.to_thread(self._execute, query, params)
+
+    @staticmethod
+    def _to_record(row: tuple) -> KernelRecord:
+        kernel_id, kernel_name, owner, connection_info, last_activity, user = row
+        return KernelRecord(
+            kernel_id=kernel_id,
+            kernel_name=kernel_name,
+            owner=owner,
+            connection_info=json.loads(connection_info),
+            last_activity=last_activity,
+            user=user,
+        )
+
+    async def register(self, record: KernelRecord) -> None:
+        await self._run(
+            "INSERT OR REPLACE INTO kernels VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                record.kernel_id,
+                record.kernel_name,
+                record.owner,
+                json.dumps(record.connection_info),
+                record.last_activity,
+                record.user,
+            ),
+        )
+
+    async def get(self, kernel_id: str) -> KernelRecord | None:
+        rows = await self._run("SELECT * FROM kernels WHERE kernel_id = ?", (kernel_id,))
+        return self._to_record(rows[0]) if rows else None
+
+    async def touch(self, kernel_id: str) -> None:
+        await self._run(
+            "UPDATE kernels SET last_activity = ? WHERE kernel_id = ?", (time.time(), kernel_id)
+        )
+
+    async def remove(self, kernel_id: str) -> None:
+        await self._run("DELETE FROM kernels WHERE kernel_id = ?", (kernel_id,))
+
+    async def list(self) -> list[KernelRecord]:
+        return [self._to_record(row) for row in await self._run("SELECT * FROM kernels")]
+
+
+def build_kernel_registry(settings: Settings) -> KernelRegistry:
+    if settings.kernel_registry == "sqlite":
+        os.makedirs(settings.jupyter_connection_dir, exist_ok=True)
+        return SQLiteKernelRegistry(settings.kernel_registry_path)
+    return InMemoryKernelRegistry()
@@ -0,0 +1,180 @@
+"""
+Faster JSON rendering and compression of API responses.
+
+orjson and zstandard are optional: without orjson, JSON is rendered with the standard library,
+and without zstandard, responses are only compressed with gzip.
+
+Classes:
+- FastJSONResponse: Renders pydantic models and plain data as JSON, with orjson if installed.
+- CompressionMiddleware: Compresses large responses with zstd or gzip, as the client accepts.
+
+Functions:
+- json_response: Returns a route's result as a `FastJSONResponse` when fast JSON is turned on.
+"""
+import asyncio
+import gzip
+from typing import Any
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from jupychat.settings import get_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies larger than this are compressed in a thread, instead of blocking the event loop
+_THREAD_COMPRESS_BYTES = 64 * 1024
+
+
+class FastJSONResponse(JSONResponse):
+    """A JSON response that renders pydantic models without FastAPI's `jsonable_encoder`.
+
+    FastAPI validates a route's return value against its response model again, then walks it
+    with `jsonable_encoder` before rendering it. For run-cell responses with many displays or
+    large outputs, that costs several times more than rendering `model.dict()` directly.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            content = content.dict()
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
+
+
+def json_response(content: BaseModel, response: Response, status_code: int = 200) -> Any:
+    """
+    The route's result, rendered as a `FastJSONResponse` if `fast_json_responses` is on.
+
+    Otherwise the model itself is returned, for FastAPI to validate and render as usual.
+
+    Parameters
+    ----------
+    content : BaseModel
+        The route's result.
+    response : Response
+        The route's `Response` parameter. Headers set on it are kept.
+    status_code : int
+        The status code of the route, used unless one was set on `response`.
+
+    """
+    if not get_settings().fast_json_responses:
+        return content
+    rendered = FastJSONResponse(content, status_code=response.status_code or status_code)
+    rendered.headers.raw.extend(response.headers.raw)
+    return rendered
+
+
+def _accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    """The codings in an Accept-Encoding header and their weights."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        if coding.strip():
+            accepted[coding.strip().lower()] = weight
+    return accepted
+
+
+def _is_compressible(content_type: str) -> bool:
+    content_type = content_type.split(";")[0].strip().lower()
+    # Events must reach the client as they're sent, even if they all fit in one message
+    if content_type == "text/event-stream":
+        return False
+    return content_type.startswith("text/") or content_type.endswith(("json", "yaml", "xml"))
+
+
+class CompressionMiddleware:
+    """Compresses responses of at least `minimum_size` bytes with zstd or gzip.
+
+    zstd is preferred when zstandard is installed and the client accepts it, it compresses
+    about as well as gzip at a fraction of the CPU. Only responses sent in one piece are
+    compressed: streamed responses, like `/run-cell/stream` events and files, are passed
+    through as they are, so their chunks aren't held back by the compressor. Images and other
+    binary content types are never compressed.
+    """
+
+    def __init__(
+        self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, zstd_level: int = 3
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+
+    def negotiate(self, accept_encoding: str) -> str | None:
+        """The coding to compress responses with, given the request's Accept-Encoding."""
+        accepted = _accepted_encodings(accept_encoding)
+        for coding in ("zstd", "gzip") if zstandard is not None else ("gzip",):
+            if accepted.get(coding, accepted.get("*", 0)) > 0:
+                return coding
+        return None
+
+    def compress(self, body: bytes, coding: str) -> bytes:
+        if coding == "zstd":
+            return zstandard.ZstdCompressor(level=self.zstd_level).compress(body)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        coding = self.negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            headers = MutableHeaders(scope=start_message)
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not _is_compressible(headers.get("content-type", ""))
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) > _THREAD_COMPRESS_BYTES:
+                body = await asyncio.to_thread(self.compress, body, coding)
+            else:
+                body = self.compress(body, coding)
+            headers["Content-Encoding"] = coding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,14 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, Security
+from typing import AsyncIterator
 
-from jupychat.auth import verify_jwt
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, Security
+from fastapi.responses import StreamingResponse
+
+from jupychat.auth import get_user_id, verify_jwt
+from jupychat.exceptions import FileTooLargeError, JupyChatError
+from jupychat.files import write_file
+from jupychat.idempotency import IdempotencyCache, get_idempotency_cache
+from jupychat.jobs import Job, JobManager, get_job_manager
 from jupychat.kernels import JupyChatKernelClient, get_nb_gpt_kernel_client
 from jupychat.models import (
+    CreateFileRequest,
+    CreateFileResponse,
     CreateKernelRequest,
     CreateKernelResponse,
+    IdempotentRunCellRequest,
+    JobResponse,
+    RunCellEvent,
     RunCellRequest,
     RunCellResponse,
+    RunCellsRequest,
+    RunCellsResponse,
+    SubmitJobRequest,
 )
-from jupychat.suggestions import RUN_CELL_PARSE_FAIL
+from jupychat.responses import json_response
+from jupychat.settings import Settings, get_settings
+from jupychat.suggestions import RUN_CELL_PARSE_FAIL, STREAM_IDEMPOTENCY_UNSUPPORTED
 
 router = APIRouter(dependencies=[Security(verify_jwt)])
 
@@ -16,16 +33,46 @@ router = APIRouter(dependencies=[Security(verify_jwt)])
 @router.post("/kernels")
 async def create_kernel(
     request: CreateKernelRequest,
+    user: str = Depends(get_user_id),
     kernel_client: JupyChatKernelClient = Depends(get_nb_gpt_kernel_client),
 ) -> CreateKernelResponse:
     """Create and start kernel with the given kernel name."""
-    return await kernel_client.start_kernel(request)
+    return await kernel_client.start_kernel(request, user)
+
+
+@router.put("/kernels/{kernel_id}/files", status_code=201)
+async def upload_file(
+    kernel_id: str,
+    request: Request,
+    file: CreateFileRequest = Depends(),
+    content_length: int | None = Header(None),
+    user: str = Depends(get_user_id),
+    kernel_client: JupyChatKernelClient = Depends(get_nb_gpt_kernel_client),
+    settings: Settings = Depends(get_settings),
+) -> CreateFileResponse:
+    """Upload a file into the kernel's working directory, for its cells to read.
+
+    Send the file's content as the request body, with the destination as the `path` query
+    parameter (e.g. `?path=data/input.csv`). The body is written to disk as it arrives, so large
+    files don't go through `code`. An existing file at `path` is replaced.
+    """
+    max_bytes = settings.max_upload_bytes
+    if max_bytes is not None and content_length is not None and content_length > max_bytes:
+        raise FileTooLargeError(max_bytes)
+
+    async with kernel_client.working_dir(kernel_id, user) as working_dir:
+        size = await write_file(working_dir, file.path, request.stream(), max_bytes)
+    return CreateFileResponse(path=file.path, size=size)
 
 
 @router.post("/run-cell")
 async def run_cell(
-    request: RunCellRequest,
+    request: IdempotentRunCellRequest,
+    response: Response,
+    idempotency_key: str | None = Header(None),
+    user: str = Depends(get_user_id),
     kernel_client: JupyChatKernelClient = Depends(get_nb_gpt_kernel_client),
+    idempotency_cache: IdempotencyCache = Depends(get_idempotency_cache),
 ) -> RunCellResponse:
     """Execute a cell and return the result.
 
@@ -37,15 +84,224 @@ async def run_cell(
         "code": "print('hello world')"
     }
     ```
+
+    Send an `idempotency_key` (or `Idempotency-Key` header) to make retries safe: a retry with
+    the same key waits for the first request, or returns its result, instead of running the
+    code again.
     """
 
     if not request.code:
         raise HTTPException(status_code=400, detail=RUN_CELL_PARSE_FAIL)
 
+    async def execute() -> RunCellResponse:
+        if not request.kernel_id:
+            kernel = await kernel_client.start_kernel(CreateKernelRequest(), user)
+            request.kernel_id = kernel.kernel_id
+
+        try:
+            return await kernel_client.run_cell(request, user=user)
+        except JupyChatError:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error executing code: {e}")
+
+    key = request.idempotency_key or idempotency_key
+    if not key:
+        return json_response(await execute(), response)
+
+    result, replayed = await idempotency_cache.run(
+        request.kernel_id, key, request.code, execute, user=user
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return json_response(result, response)
+
+
+async def encode_events(events: AsyncIterator[RunCellEvent], sse: bool) -> AsyncIterator[str]:
+    """Encode events as server-sent events, or as newline delimited JSON."""
+    async for event in events:
+        if sse:
+            yield f"event: {event.event}\ndata: {event.json(exclude_none=True)}\n\n"
+        else:
+            yield event.json(exclude_none=True) + "\n"
+
+
+@router.post("/run-cell/stream", response_model=RunCellEvent)
+async def stream_cell(
+    request: RunCellRequest,
+    accept: str | None = Header(None),
+    idempotency_key: str | None = Header(None),
+    user: str = Depends(get_user_id),
+    kernel_client: JupyChatKernelClient = Depends(get_nb_gpt_kernel_client),
+) -> StreamingResponse:
+    """Execute a cell and stream its outputs as they are produced.
+
+    Takes the same request as `/run-cell`, without `idempotency_key`. Each output is sent as its
+    own JSON object, one per line (`application/x-ndjson`), or as server-sent events if the
+    request accepts `text/event-stream`. The last event has `"event": "status"` and says whether
+    the cell succeeded.
+    """
+
+    if not request.code:
+        raise HTTPException(status_code=400, detail=RUN_CELL_PARSE_FAIL)
+    if idempotency_key:
+        # A retry couldn't get the outputs that were already streamed, so don't pretend to
+        raise HTTPException(status_code=400, detail=STREAM_IDEMPOTENCY_UNSUPPORTED)
+
     if not request.kernel_id:
-        request.kernel_id = (await kernel_client.start_kernel(CreateKernelRequest())).kernel_id
+        kernel = await kernel_client.start_kernel(CreateKernelRequest(), user)
+        request.kernel_id = kernel.kernel_id
+
+    sse = accept is not None and "text/event-stream" in accept
+    return StreamingResponse(
+        encode_events(await kernel_client.stream_cell(request, user), sse),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+    )
+
+
+def check_batch(request: RunCellsRequest, settings: Settings) -> None:
+    if not all(request.cells):
+        raise HTTPException(status_code=400, detail=RUN_CELL_PARSE_FAIL)
+    if len(request.cells) > settings.max_cells_per_batch:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.max_cells_per_batch} cells can be run at once.",
+        )
+
+
+@router.post("/run-cells")
+async def run_cells(
+    request: RunCellsRequest,
+    response: Response,
+    user: str = Depends(get_user_id),
+    kernel_client: JupyChatKernelClient = Depends(get_nb_gpt_kernel_client),
+    settings: Settings = Depends(get_settings),
+) -> RunCellsResponse:
+    """Execute several cells in order on the same kernel and return the result of each.
+
+    Use this instead of several `/run-cell` calls for steps that belong together, like setup,
+    loading data and plotting. With `stop_on_error` (the default), the cells after a failed
+    cell are skipped.
+
+    ```json
+    {
+        "kernel_id": "<previously created kernel id>",
+        "cells": ["import pandas as pd", "df = pd.read_csv('data.csv')", "df.describe()"]
+    }
+    ```
+    """
+
+    check_batch(request, settings)
+
+    if not request.kernel_id:
+        kernel = await kernel_client.start_kernel(CreateKernelRequest(), user)
+        request.kernel_id = kernel.kernel_id
 
     try:
-        return await kernel_client.run_cell(request)
+        result = await kernel_client.run_cells(request, user)
+    except JupyChatError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error executing code: {e}")
+    return json_response(result, response)
+
+
+@router.post("/run-cells/stream", response_model=RunCellEvent)
+async def stream_cells(
+    request: RunCellsRequest,
+    accept: str | None = Header(None),
+    user: str = Depends(get_user_id),
+    kernel_client: JupyChatKernelClient = Depends(get_nb_gpt_kernel_client),
+    settings: Settings = Depends(get_settings),
+) -> StreamingResponse:
+    """Execute several cells like `/run-cells` and stream their outputs as they are produced.
+
+    Events are encoded like `/run-cell/stream`, with a `cell_index` saying which cell they
+    belong to. Each cell's events end with a `status` event.
+    """
+
+    check_batch(request, settings)
+
+    if not request.kernel_id:
+        kernel = await kernel_client.start_kernel(CreateKernelRequest(), user)
+        request.kernel_id = kernel.kernel_id
+
+    sse = accept is not None and "text/event-stream" in accept
+    return StreamingResponse(
+        encode_events(await kernel_client.stream_cells(request, user), sse),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+    )
+
+
+@router.post("/jobs", status_code=202)
+async def submit_job(
+    request: SubmitJobRequest,
+    response: Response,
+    idempotency_key: str | None = Header(None),
+    user: str = Depends(get_user_id),
+    kernel_client: JupyChatKernelClient = Depends(get_nb_gpt_kernel_client),
+    job_manager: JobManager = Depends(get_job_manager),
+    idempotency_cache: IdempotencyCache = Depends(get_idempotency_cache),
+) -> JobResponse:
+    """Start executing a cell in the background and return a job ID right away.
+
+    Use this instead of `/run-cell` for code that may take a long time. Fetch the result with
+    `GET /jobs/{job_id}`. The cell is interrupted after `timeout_sec` seconds.
+
+    Send an `idempotency_key` (or `Idempotency-Key` header) to make retries safe: a retry with
+    the same key returns the first request's job instead of submitting another.
+    """
+
+    if not request.code:
+        raise HTTPException(status_code=400, detail=RUN_CELL_PARSE_FAIL)
+
+    async def submit() -> Job:
+        if not request.kernel_id:
+            kernel = await kernel_client.start_kernel(CreateKernelRequest(), user)
+            request.kernel_id = kernel.kernel_id
+
+        return job_manager.submit(
+            RunCellRequest(**request.dict()), timeout=request.timeout_sec, user=user
+        )
+
+    key = request.idempotency_key or idempotency_key
+    if not key:
+        job = await submit()
+    else:
+        # Distinct from the run-cell fingerprint, so a key can't be shared with /run-cell
+        fingerprint = f"job:{request.timeout_sec}:{request.code}"
+        job, replayed = await idempotency_cache.run(
+            request.kernel_id, key, fingerprint, submit, user=user
+        )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+    return json_response(job_manager.to_response(job), response, status_code=202)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    response: Response,
+    wait: float = Query(0, ge=0, description="Seconds to wait for the job to finish."),
+    user: str = Depends(get_user_id),
+    job_manager: JobManager = Depends(get_job_manager),
+    settings: Settings = Depends(get_settings),
+) -> JobResponse:
+    """Get the status of a job, and its result once it has finished.
+
+    With `wait`, the request is held open until the job finishes or `wait` seconds pass.
+    """
+    job = await job_manager.wait(job_id, min(wait, settings.job_max_wait_sec), user)
+    return json_response(job_manager.to_response(job), response)
+
+
+@router.post("/jobs/{job_id}/interrupt")
+async def interrupt_job(
+    job_id: str,
+    response: Response,
+    user: str = Depends(get_user_id),
+    job_manager: JobManager = Depends(get_job_manager),
+) -> JobResponse:
+    """Interrupt a running job, or cancel it if its cell hasn't started yet."""
+    job = await job_manager.interrupt(job_id, user)
+    return json_response(job_manager.to_response(job), response)
@@ -3,6 +3,7 @@ from urllib.parse import quote, urlencode
 import httpx
 from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 
+from jupychat.http_client import get_http_client, post_with_retries
 from jupychat.settings import Settings, get_settings
 
 router = APIRouter()
@@ -50,7 +51,11 @@ def authorize(
 
 
 @router.post("/token", include_in_schema=False)
-async def token(request: Request, settings: Settings = Depends(get_settings)):
+async def token(
+    request: Request,
+    settings: Settings = Depends(get_settings),
+    client: httpx.AsyncClient = Depends(get_http_client),
+):
     """
     Retrieves an access token from Auth0 using the provided credentials.
 
@@ -60,6 +65,8 @@ async def token(request: Request, settings: Settings = Depends(get_settings)):
         The incoming HTTP request.
     settings : Settings, optional
         The application settings, by default Depends(get_settings)
+    client : httpx.AsyncClient, optional
+        The app's pooled HTTP client, by default Depends(get_http_client)
 
     Returns
     -------
@@ -71,8 +78,13 @@ async def token(request: Request, settings: Settings = Depends(get_settings)):
     body = await request.json()
     auth0_url = f"{settings.auth0_domain}/oauth/token"
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(auth0_url, json=body)
-        if resp.is_error:
-            raise HTTPException(status_code=resp.status_code, detail=resp.text)
-        return resp.json()
+    resp = await post_with_retries(
+        client,
+        auth0_url,
+        retries=settings.http_retries,
+        backoff=settings.http_retry_backoff_sec,
+        json=body,
+    )
+    if resp.is_error:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    return resp.json()
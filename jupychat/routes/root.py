@@ -1,24 +1,47 @@
 """Root-level routes."""
+import hashlib
+import hmac
+import json
+from functools import lru_cache
+from typing import NamedTuple
 
+import aiofiles.os
 import yaml
-from fastapi import APIRouter, Depends, HTTPException, Response
-from fastapi.responses import PlainTextResponse
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from jinja2 import Template
 
+from jupychat import metrics
 from jupychat.auth import get_user_is_authenticated
 from jupychat.images import image_store
-from jupychat.settings import Settings, get_settings
+from jupychat.settings import get_settings
 
 router = APIRouter()
 templates = Jinja2Templates(directory="jupychat/templates")
 
 
-@router.get("/.well-known/ai-plugin.json", include_in_schema=False)
-def get_ai_plugin_json(
-    settings: Settings = Depends(get_settings),
-    user_is_authenticated: bool = Depends(get_user_is_authenticated),
-):
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """Whether an `If-None-Match` header matches the given (unquoted) ETag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class RenderedManifest(NamedTuple):
+    body: bytes
+    etag: str
+
+
+@lru_cache(maxsize=2)
+def render_ai_plugin_json(user_is_authenticated: bool) -> RenderedManifest:
+    """Render the plugin manifest to JSON once per variant.
+
+    The manifest only depends on the settings and whether the user is authenticated. Call
+    `render_ai_plugin_json.cache_clear()` after changing the settings.
+    """
+    settings = get_settings()
     template: Template = templates.get_template("ai-plugin.yaml")
     template_context = {
         "OPENAPI_URL": settings.openapi_url,
@@ -29,17 +52,58 @@ def get_ai_plugin_json(
         "user_is_authenticated": user_is_authenticated,
     }
     rendered_template = template.render(**template_context)
-    return yaml.safe_load(rendered_template)
+    body = json.dumps(yaml.safe_load(rendered_template)).encode()
+    return RenderedManifest(body=body, etag=hashlib.sha256(body).hexdigest()[:32])
+
+
+@router.get("/.well-known/ai-plugin.json", include_in_schema=False)
+async def get_ai_plugin_json(
+    user_is_authenticated: bool = Depends(get_user_is_authenticated),
+    if_none_match: str | None = Header(None),
+):
+    manifest = render_ai_plugin_json(user_is_authenticated)
+    headers = {"ETag": f'"{manifest.etag}"', "Vary": "Authorization"}
+    if etag_matches(manifest.etag, if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(manifest.body, media_type="application/json", headers=headers)
 
 
 @router.get("/images/{image_name}", include_in_schema=False)
-async def get_image(image_name: str):
+async def get_image(image_name: str, if_none_match: str | None = Header(None)):
     try:
-        image_bytes = image_store.get_image(image_name)
-        return Response(image_bytes, media_type="image/png")
+        image = image_store.get_image(image_name)
     except KeyError:
         raise HTTPException(status_code=404, detail="Image not found")
 
+    # Image names are content hashes, so the bytes behind a URL never change
+    headers = {"ETag": f'"{image.etag}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(image.etag, if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if image.path:
+        try:
+            stat_result = await aiofiles.os.stat(image.path)
+        except FileNotFoundError:
+            # Evicted since the lookup
+            raise HTTPException(status_code=404, detail="Image not found")
+        return FileResponse(
+            image.path, media_type="image/png", headers=headers, stat_result=stat_result
+        )
+    return Response(image.data, media_type="image/png", headers=headers)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: str | None = Header(None)):
+    settings = get_settings()
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.metrics_token and not hmac.compare_digest(
+        authorization or "", f"Bearer {settings.metrics_token}"
+    ):
+        raise HTTPException(
+            status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"}
+        )
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 
 @router.get("/robots.txt", include_in_schema=False, response_class=PlainTextResponse)
 async def robots():
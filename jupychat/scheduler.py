@@ -0,0 +1,129 @@
+"""
+Share execution capacity fairly between users.
+
+Classes:
+- FairScheduler: Admits cells to run within global and per-user limits, taking turns by user.
+"""
+import asyncio
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class FairScheduler:
+    """Admits cells to run, at most `max_concurrent` at once and `max_per_user` per user.
+
+    Cells over the limits wait. When a slot frees up, users with waiting cells take turns in
+    weighted round-robin order: each user gets up to its weight (1 by default) cells admitted
+    before the next user's turn, so a user with many waiting cells can't hold up everyone else.
+    A user's own cells are admitted in the order they arrived.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int | None = None,
+        max_per_user: int | None = None,
+        weights: dict[str, int] | None = None,
+    ) -> None:
+        self._max_concurrent = max_concurrent
+        self._max_per_user = max_per_user
+        self._weights = weights or {}
+        self._running: defaultdict[str | None, int] = defaultdict(int)
+        self._total_running = 0
+        self._waiting: dict[str | None, deque[asyncio.Future]] = {}
+        self._turns: deque[str | None] = deque()  # users with waiting cells, next turn first
+        self._admitted_this_turn = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def running(self, user: str | None) -> int:
+        return self._running.get(user, 0)
+
+    def _is_full(self) -> bool:
+        return self._max_concurrent is not None and self._total_running >= self._max_concurrent
+
+    def _user_is_full(self, user: str | None) -> bool:
+        return self._max_per_user is not None and self._running.get(user, 0) >= self._max_per_user
+
+    def _has_capacity(self, user: str | None) -> bool:
+        return not self._is_full() and not self._user_is_full(user)
+
+    def _admit(self, user: str | None) -> None:
+        self._running[user] += 1
+        self._total_running += 1
+
+    def _release(self, user: str | None) -> None:
+        self._running[user] -= 1
+        if not self._running[user]:
+            del self._running[user]
+        self._total_running -= 1
+        self._dispatch()
+
+    def _end_turn(self) -> None:
+        self._turns.rotate(-1)
+        self._admitted_this_turn = 0
+
+    def _dispatch(self) -> None:
+        """Admits waiting cells, in turn order, until no waiting cell can be admitted."""
+        while self._turns and not self._is_full():
+            # Users at their own limit miss their turn
+            for _ in range(len(self._turns)):
+                if not self._user_is_full(self._turns[0]):
+                    break
+                self._end_turn()
+            else:
+                return
+
+            user = self._turns[0]
+            waiters = self._waiting[user]
+            waiter = waiters.popleft()
+            if not waiter.done():  # skip cells cancelled while waiting
+                self._admit(user)
+                waiter.set_result(None)
+                self._admitted_this_turn += 1
+
+            if not waiters:
+                del self._waiting[user]
+                self._turns.popleft()
+                self._admitted_this_turn = 0
+            elif self._admitted_this_turn >= self._weights.get(user, 1):
+                self._end_turn()
+
+    def _remove_waiter(self, user: str | None, waiter: asyncio.Future) -> None:
+        waiters = self._waiting.get(user)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self._waiting[user]
+            self._turns.remove(user)
+            self._admitted_this_turn = 0
+
+    @asynccontextmanager
+    async def slot(self, user: str | None) -> AsyncIterator[None]:
+        """Waits until the user's cell may run, and holds its slot until the block exits."""
+        # Waiting cells are admitted as soon as there's room, so if there's room, nobody that
+        # could run is waiting
+        if self._has_capacity(user):
+            self._admit(user)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            if user not in self._waiting:
+                self._waiting[user] = deque()
+                self._turns.append(user)
+            self._waiting[user].append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(user)  # admitted, but cancelled before it could start
+                else:
+                    self._remove_waiter(user, waiter)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(user)
@@ -1,7 +1,12 @@
+import os
 from functools import lru_cache
+from typing import Literal
 
 from pydantic import BaseSettings
 
+# Same as jupyter_client.kernelspec.NATIVE_KERNEL_NAME, without importing jupyter_client
+NATIVE_KERNEL_NAME = "python3"
+
 
 class Settings(BaseSettings):
     domain: str = "http://localhost:8000"
@@ -27,11 +32,148 @@ class Settings(BaseSettings):
     auth0_domain: str
     jwks_url: str
     jwks_cache_time_sec: int = 300
+    jwt_cache_max_entries: int = 10_000
 
     oauth_audience: str = "https://example.com/jupychat"
 
+    # Connection pool, timeouts and retries for requests to Auth0
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry_sec: float = 30
+    http_timeout_sec: float = 10
+    http_connect_timeout_sec: float = 5
+    http_retries: int = 2
+    http_retry_backoff_sec: float = 0.2
+
     jupyter_connection_dir: str = "/tmp/jupychat_connection_files"
 
+    # Each kernel runs in its own directory under this one, which files can be uploaded into
+    kernel_working_dir: str = "/tmp/jupychat_kernels"
+    max_upload_bytes: int | None = 500_000_000
+
+    # Where running kernels are registered. With "sqlite", all worker processes on this host share
+    # one registry, so any of them can run cells on a kernel another one started.
+    kernel_registry: Literal["memory", "sqlite"] = "memory"
+    kernel_registry_file: str | None = None
+
+    @property
+    def kernel_registry_path(self) -> str:
+        return self.kernel_registry_file or os.path.join(
+            self.jupyter_connection_dir, "kernels.sqlite"
+        )
+
+    # Pre-warmed kernels, kept started and connected per kernel spec name
+    kernel_pool_size: int = 0
+    kernel_pool_sizes: dict[str, int] = {}
+    kernel_pool_max_concurrent_starts: int = 2
+    kernel_ready_timeout_sec: float = 60
+
+    # Kernels idle for longer than this are shut down, and at most `max_kernels` run at once
+    kernel_idle_timeout_sec: float | None = 3600
+    kernel_cull_interval_sec: float = 60
+    max_kernels: int | None = None
+
+    # Per-cell output caps, stdout and stderr keep their start and end when they're over
+    max_stdout_bytes: int | None = 100_000
+    max_stderr_bytes: int | None = 100_000
+    max_displays: int | None = 50
+    max_display_bytes: int | None = 20 * 1024 * 1024
+    # Representations kept of each display and execute result: the first output_max_mime_types
+    # of them by output_mime_priority (types not listed come last). Larger ones than
+    # output_max_representation_bytes are shortened, HTML tables to their first and last rows,
+    # or dropped
+    output_mime_priority: list[str] = [
+        "image/png",
+        "image/jpeg",
+        "image/gif",
+        "image/svg+xml",
+        "text/markdown",
+        "text/plain",
+        "text/html",
+        "text/latex",
+        "application/json",
+    ]
+    output_max_mime_types: int | None = 2
+    output_max_representation_bytes: int | None = 50_000
+    output_html_table_head_rows: int = 5
+    output_html_table_tail_rows: int = 5
+    # Threads formatting outputs and decoding images, so large outputs don't block the server
+    output_format_workers: int = 4
+    # Render run-cell and job responses straight to JSON, with orjson if it's installed,
+    # instead of through FastAPI's validation and encoding of the route's result
+    fast_json_responses: bool = False
+    # Responses at least this large are compressed with zstd (if zstandard is installed) or gzip,
+    # as the client accepts, e.g. 1024. Off (None) by default, since a proxy in front of the
+    # server may already compress
+    compression_min_bytes: int | None = None
+
+    # How often to check that the kernels this process started are alive. The cells of a kernel
+    # that died, e.g. from running out of memory, fail right away. With kernel_auto_restart, dead
+    # kernels are restarted in place, waiting kernel_restart_backoff_sec (doubling each time)
+    # between up to kernel_max_restarts restarts in a row, and the next cell's response says the
+    # kernel's state was lost. Without it, or after that many restarts, the kernel is gone
+    kernel_heartbeat_interval_sec: float | None = 5
+    kernel_auto_restart: bool = False
+    kernel_restart_backoff_sec: float = 1
+    kernel_max_restarts: int = 3
+
+    # Cells waiting behind a running cell on the same kernel, more are rejected with a 429
+    max_queued_cells_per_kernel: int | None = 8
+
+    # Per-user limits, users being the `sub` claim of their token. A user at max_kernels_per_user
+    # gets their least recently used idle kernel shut down to make room. Cells beyond the
+    # execution limits wait, and waiting users take turns, getting user_weights cells (default 1)
+    # per turn
+    max_kernels_per_user: int | None = None
+    max_concurrent_executions: int | None = None
+    max_concurrent_executions_per_user: int | None = None
+    user_weights: dict[str, int] = {}
+
+    # Cells accepted by a single /run-cells request
+    max_cells_per_batch: int = 20
+
+    # On shutdown, submitted cells and jobs get up to shutdown_drain_timeout_sec to finish while
+    # new kernels and cells are turned away, then kernels get shutdown_timeout_sec to shut down
+    # before they're killed
+    shutdown_drain_timeout_sec: float = 15
+    shutdown_timeout_sec: float = 10
+
+    # Results of /run-cell requests sent with an idempotency key, replayed to retries
+    idempotency_ttl_sec: float = 900
+    idempotency_max_entries: int = 1000
+
+    # Background jobs, interrupted after their timeout and kept for a while once finished
+    job_default_timeout_sec: float = 600
+    job_max_timeout_sec: float = 3600
+    job_result_ttl_sec: float = 900
+    job_max_finished: int = 1000
+    job_max_wait_sec: float = 60
+
+    # Total size of the images kept for /images, least recently used ones are evicted first
+    image_store_max_bytes: int | None = 256 * 1024 * 1024
+    image_store_ttl_sec: float | None = None
+    # Keep images on disk in this directory instead of in memory
+    image_spool_dir: str | None = None
+
+    # Leave kernels running when the server stops and reconnect to them when it starts again,
+    # giving up on kernels that don't answer within the timeout
+    reattach_kernels: bool = False
+    kernel_reattach_timeout_sec: float = 5
+
+    @property
+    def kernel_index_dir(self) -> str:
+        return os.path.join(self.jupyter_connection_dir, "jupychat-kernels")
+
+    # Serve Prometheus metrics at /metrics. Off by default, the plugin's domain is public. With
+    # a metrics_token, scrapers must send it as a bearer token
+    metrics_enabled: bool = False
+    metrics_token: str | None = None
+
+    @property
+    def kernel_pool_targets(self) -> dict[str, int]:
+        """Pool size per kernel spec, `kernel_pool_size` applies to the native kernel spec."""
+        return {NATIVE_KERNEL_NAME: self.kernel_pool_size, **self.kernel_pool_sizes}
+
     class Config:
         env_file = ".env"
 
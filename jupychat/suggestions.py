@@ -3,3 +3,8 @@
 RUN_CELL_PARSE_FAIL = """
 The run cell endpoint expects JSON like `{ "code": "import pandas as pd\nprint('hello world')", "kernel_id": "378343d1-9e16-414b-b3ca-ad8ff58a864d" }`.
 """.strip()
+
+STREAM_IDEMPOTENCY_UNSUPPORTED = """
+Streamed cells can't be retried safely with an idempotency key.
+Use /run-cell or /jobs with the `Idempotency-Key` header instead.
+""".strip()
@@ -0,0 +1,5 @@
+import os
+
+# The settings require these, point them somewhere harmless before anything imports them
+os.environ.setdefault("auth0_domain", "https://example.invalid")
+os.environ.setdefault("jwks_url", "https://example.invalid/.well-known/jwks.json")
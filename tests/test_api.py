@@ -0,0 +1,103 @@
+import unittest
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.fake_kernel import FakeMultiKernelManager
+from jupychat.app_utils import jupychat_error_handler
+from jupychat.auth import verify_jwt
+from jupychat.exceptions import JupyChatError
+from jupychat.idempotency import IdempotencyCache, get_idempotency_cache
+from jupychat.kernels import JupyChatKernelClient, get_nb_gpt_kernel_client
+from jupychat.routes import api
+from tests.test_kernels import build_client
+
+
+def build_api_app(kernel_client: JupyChatKernelClient) -> FastAPI:
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api")
+    app.add_exception_handler(JupyChatError, jupychat_error_handler)
+    idempotency_cache = IdempotencyCache()
+    app.dependency_overrides[verify_jwt] = lambda: {"sub": "alice"}
+    app.dependency_overrides[get_nb_gpt_kernel_client] = lambda: kernel_client
+    app.dependency_overrides[get_idempotency_cache] = lambda: idempotency_cache
+    return app
+
+
+class ApiTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.kernel_client = build_client(FakeMultiKernelManager())
+        transport = httpx.ASGITransport(app=build_api_app(self.kernel_client))
+        self.client = httpx.AsyncClient(transport=transport, base_url="http://test")
+        response = await self.client.post("/api/kernels", json={})
+        self.kernel_id = response.json()["kernel_id"]
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        await self.kernel_client.shutdown_all()
+
+
+class IdempotencyTest(ApiTestCase):
+    async def test_retried_job_returns_the_first_job(self):
+        body = {"kernel_id": self.kernel_id, "code": "print(1)", "idempotency_key": "abc"}
+
+        first = await self.client.post("/api/jobs", json=body)
+        retry = await self.client.post("/api/jobs", json=body)
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(retry.status_code, 202)
+        self.assertEqual(retry.json()["job_id"], first.json()["job_id"])
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+
+    async def test_job_key_in_header(self):
+        body = {"kernel_id": self.kernel_id, "code": "print(1)"}
+        headers = {"Idempotency-Key": "abc"}
+
+        first = await self.client.post("/api/jobs", json=body, headers=headers)
+        retry = await self.client.post("/api/jobs", json=body, headers=headers)
+
+        self.assertEqual(retry.json()["job_id"], first.json()["job_id"])
+
+    async def test_job_key_reused_for_different_code(self):
+        body = {"kernel_id": self.kernel_id, "code": "print(1)", "idempotency_key": "abc"}
+        await self.client.post("/api/jobs", json=body)
+
+        response = await self.client.post("/api/jobs", json={**body, "code": "print(2)"})
+
+        self.assertEqual(response.status_code, 422)
+
+    async def test_job_key_is_not_shared_with_run_cell(self):
+        body = {"kernel_id": self.kernel_id, "code": "print(1)", "idempotency_key": "abc"}
+        await self.client.post("/api/run-cell", json=body)
+
+        response = await self.client.post("/api/jobs", json=body)
+
+        self.assertEqual(response.status_code, 422)
+
+    async def test_stream_rejects_idempotency_key(self):
+        body = {"kernel_id": self.kernel_id, "code": "print(1)"}
+
+        response = await self.client.post(
+            "/api/run-cell/stream", json=body, headers={"Idempotency-Key": "abc"}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_schema_has_no_idempotency_key(self):
+        schema = build_api_app(self.kernel_client).openapi()
+        stream_body = schema["paths"]["/api/run-cell/stream"]["post"]["requestBody"]
+        ref = stream_body["content"]["application/json"]["schema"]["$ref"].split("/")[-1]
+
+        self.assertNotIn("idempotency_key", schema["components"]["schemas"][ref]["properties"])
+
+
+class JobsTest(ApiTestCase):
+    async def test_jobs_run_on_the_overridden_kernel_client(self):
+        body = {"kernel_id": self.kernel_id, "code": "print(1)"}
+
+        submitted = await self.client.post("/api/jobs", json=body)
+        job = await self.client.get(f"/api/jobs/{submitted.json()['job_id']}", params={"wait": 5})
+
+        self.assertEqual(submitted.status_code, 202)
+        self.assertEqual(job.json()["status"], "done")
+        self.assertEqual(job.json()["result"]["stdout"], "print(1)")
@@ -0,0 +1,160 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt import PyJWKClientError
+from jwt.algorithms import RSAAlgorithm
+
+from jupychat import auth
+from jupychat.auth import JWKSCache, VerifiedTokenCache, verify_jwt
+from jupychat.settings import get_settings
+
+
+def generate_key() -> rsa.RSAPrivateKey:
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def jwks(**keys: rsa.RSAPrivateKey) -> dict:
+    return {
+        "keys": [
+            {**RSAAlgorithm.to_jwk(key.public_key(), as_dict=True), "kid": kid, "use": "sig"}
+            for kid, key in keys.items()
+        ]
+    }
+
+
+class FakeJWKSCache(JWKSCache):
+    """Serves `data` instead of fetching it, and counts the fetches. A fetch waits for
+    `fetch_gate` if it's set."""
+
+    def __init__(self, data: dict, refresh_interval: float = 3600):
+        super().__init__("https://example.invalid/jwks.json", refresh_interval)
+        self.data = data
+        self.fetches = 0
+        self.fetch_gate: asyncio.Event | None = None
+        self.loop = asyncio.get_running_loop()
+
+    def _fetch_data(self) -> dict:
+        self.fetches += 1
+        if self.fetch_gate is not None:
+            asyncio.run_coroutine_threadsafe(self.fetch_gate.wait(), self.loop).result()
+        return self.data
+
+
+class JWKSCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.old_key, self.new_key = generate_key(), generate_key()
+        self.cache = FakeJWKSCache(jwks(old=self.old_key), refresh_interval=60)
+
+    async def test_first_lookup_fetches_and_later_ones_use_memory(self):
+        await self.cache.get_signing_key("old")
+        await self.cache.get_signing_key("old")
+
+        self.assertEqual(self.cache.fetches, 1)
+
+    async def test_stale_keys_are_served_while_a_refresh_runs(self):
+        await self.cache.get_signing_key("old")
+        self.cache._fetched_at -= 120
+        self.cache.fetch_gate = asyncio.Event()
+
+        key = await asyncio.wait_for(self.cache.get_signing_key("old"), timeout=1)
+
+        self.assertEqual(key.key_id, "old")
+        self.assertFalse(self.cache._refreshing.done())
+        self.cache.fetch_gate.set()
+        await self.cache._refreshing
+        self.assertEqual(self.cache.fetches, 2)
+
+    async def test_unknown_key_id_waits_for_a_refresh(self):
+        await self.cache.get_signing_key("old")
+        self.cache._fetched_at -= JWKSCache.min_refetch_interval
+        self.cache.data = jwks(old=self.old_key, new=self.new_key)
+
+        key = await self.cache.get_signing_key("new")
+
+        self.assertEqual(key.key_id, "new")
+        self.assertEqual(self.cache.fetches, 2)
+
+    async def test_unknown_key_ids_are_not_refetched_right_away(self):
+        await self.cache.get_signing_key("old")
+
+        for _ in range(3):
+            with self.assertRaises(PyJWKClientError):
+                await self.cache.get_signing_key("made-up")
+        self.assertEqual(self.cache.fetches, 1)
+
+    async def test_concurrent_lookups_share_a_fetch(self):
+        self.cache.fetch_gate = asyncio.Event()
+        lookups = [asyncio.create_task(self.cache.get_signing_key("old")) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        self.cache.fetch_gate.set()
+
+        await asyncio.gather(*lookups)
+
+        self.assertEqual(self.cache.fetches, 1)
+
+
+class VerifiedTokenCacheTest(unittest.TestCase):
+    def test_expired_tokens_are_not_returned(self):
+        cache = VerifiedTokenCache()
+        cache.put("live", {"sub": "alice", "exp": time.time() + 60})
+        cache.put("expired", {"sub": "alice", "exp": time.time() - 1})
+
+        self.assertEqual(cache.get("live")["sub"], "alice")
+        self.assertIsNone(cache.get("expired"))
+
+    def test_tokens_without_an_expiry_are_not_cached(self):
+        cache = VerifiedTokenCache()
+        cache.put("token", {"sub": "alice"})
+
+        self.assertIsNone(cache.get("token"))
+
+    def test_least_recently_used_tokens_are_dropped(self):
+        cache = VerifiedTokenCache(max_entries=2)
+        payload = {"sub": "alice", "exp": time.time() + 60}
+        cache.put("a", payload)
+        cache.put("b", payload)
+        cache.get("a")
+
+        cache.put("c", payload)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+
+class VerifyJWTTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.key = generate_key()
+        self.jwks_cache = FakeJWKSCache(jwks(k1=self.key))
+        patches = [
+            mock.patch.object(auth, "jwks_cache", self.jwks_cache),
+            mock.patch.object(auth, "verified_tokens", VerifiedTokenCache()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def token(self, exp: float) -> str:
+        claims = {"sub": "alice", "aud": get_settings().oauth_audience, "exp": exp}
+        return jwt.encode(claims, self.key, algorithm="RS256", headers={"kid": "k1"})
+
+    async def test_verified_token_is_cached_until_it_expires(self):
+        token = self.token(time.time() + 60)
+
+        self.assertEqual((await verify_jwt(token))["sub"], "alice")
+        with mock.patch.object(self.jwks_cache, "get_signing_key") as get_signing_key:
+            self.assertEqual((await verify_jwt(token))["sub"], "alice")
+        get_signing_key.assert_not_called()
+
+    async def test_expired_token_is_rejected_even_if_it_was_cached(self):
+        # Expiry times are whole seconds
+        exp = int(time.time()) + 2
+        token = self.token(exp)
+        await verify_jwt(token)
+        await asyncio.sleep(exp - time.time() + 0.05)
+
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            await verify_jwt(token)
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_kernel import FakeMultiKernelManager
+from jupychat.exceptions import FileTooLargeError, InvalidFilePathError, KernelDiedError
+from jupychat.files import resolve_upload_path, write_file
+from jupychat.models import CreateKernelRequest
+from tests.test_kernels import build_client
+
+
+async def body(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+class ResolveUploadPathTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="jupychat-test-files-")
+        self.working_dir = os.path.join(self.root, "kernel")
+        self.outside = os.path.join(self.root, "outside")
+        os.mkdir(self.working_dir)
+        os.mkdir(self.outside)
+
+    def test_relative_paths_stay_inside(self):
+        self.assertEqual(
+            resolve_upload_path(self.working_dir, "data/../input.csv"),
+            os.path.join(os.path.realpath(self.working_dir), "input.csv"),
+        )
+
+    def test_paths_out_of_the_working_dir_are_rejected(self):
+        for path in ["", ".", "..", "../outside/x", "data/../../x", "/etc/passwd", "a\0b"]:
+            with self.subTest(path=path), self.assertRaises(InvalidFilePathError):
+                resolve_upload_path(self.working_dir, path)
+
+    def test_symlinks_out_of_the_working_dir_are_rejected(self):
+        os.symlink(self.outside, os.path.join(self.working_dir, "dir-link"))
+        os.symlink(os.path.join(self.outside, "x"), os.path.join(self.working_dir, "file-link"))
+
+        for path in ["dir-link/x", "file-link"]:
+            with self.subTest(path=path), self.assertRaises(InvalidFilePathError):
+                resolve_upload_path(self.working_dir, path)
+
+
+class WriteFileTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="jupychat-test-files-")
+        self.working_dir = os.path.join(self.root, "kernel")
+        self.outside = os.path.join(self.root, "outside")
+        os.mkdir(self.working_dir)
+        os.mkdir(self.outside)
+
+    async def test_writes_into_new_directories_and_replaces_files(self):
+        await write_file(self.working_dir, "data/input.csv", body(b"old"), None)
+
+        size = await write_file(self.working_dir, "data/input.csv", body(b"a,b\n", b"1,2\n"), None)
+
+        with open(os.path.join(self.working_dir, "data", "input.csv"), "rb") as f:
+            self.assertEqual(f.read(), b"a,b\n1,2\n")
+        self.assertEqual(size, 8)
+        self.assertEqual(os.listdir(os.path.join(self.working_dir, "data")), ["input.csv"])
+
+    async def test_too_large_file_leaves_nothing_behind(self):
+        with self.assertRaises(FileTooLargeError):
+            await write_file(self.working_dir, "big.bin", body(b"x" * 6, b"x" * 6), 10)
+
+        self.assertEqual(os.listdir(self.working_dir), [])
+
+    async def test_parent_that_is_a_file_is_rejected(self):
+        await write_file(self.working_dir, "data", body(b"x"), None)
+
+        with self.assertRaises(InvalidFilePathError):
+            await write_file(self.working_dir, "data/input.csv", body(b"x"), None)
+
+    async def test_symlinked_parent_swapped_in_after_the_check_is_not_followed(self):
+        os.symlink(self.outside, os.path.join(self.working_dir, "data"))
+        unchecked = os.path.join(os.path.realpath(self.working_dir), "data", "input.csv")
+
+        with mock.patch("jupychat.files.resolve_upload_path", return_value=unchecked):
+            with self.assertRaises(InvalidFilePathError):
+                await write_file(self.working_dir, "data/input.csv", body(b"x"), None)
+
+        self.assertEqual(os.listdir(self.outside), [])
+
+    async def test_symlink_at_the_destination_is_replaced_not_written_through(self):
+        target = os.path.join(self.outside, "target")
+        with open(target, "wb") as f:
+            f.write(b"untouched")
+        os.symlink(target, os.path.join(self.working_dir, "link"))
+        unchecked = os.path.join(os.path.realpath(self.working_dir), "link")
+
+        with mock.patch("jupychat.files.resolve_upload_path", return_value=unchecked):
+            await write_file(self.working_dir, "link", body(b"x"), None)
+
+        self.assertFalse(os.path.islink(os.path.join(self.working_dir, "link")))
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), b"untouched")
+
+
+class WorkingDirTest(unittest.IsolatedAsyncioTestCase):
+    async def test_kernel_is_not_idle_while_a_file_is_written(self):
+        client = build_client(FakeMultiKernelManager())
+        kernel = await client.start_kernel(CreateKernelRequest())
+
+        async with client.working_dir(kernel.kernel_id):
+            self.assertFalse(client._kernels[kernel.kernel_id].is_idle)
+        self.assertTrue(client._kernels[kernel.kernel_id].is_idle)
+        await client.shutdown_all()
+
+    async def test_working_dir_of_a_kernel_that_died_meanwhile_is_removed(self):
+        client = build_client(FakeMultiKernelManager())
+        kernel = await client.start_kernel(CreateKernelRequest())
+
+        with self.assertRaises(KernelDiedError):
+            async with client.working_dir(kernel.kernel_id) as working_dir:
+                await client._cull_kernel(client._kernels[kernel.kernel_id], KernelDiedError)
+                os.makedirs(working_dir, exist_ok=True)
+
+        self.assertFalse(os.path.exists(working_dir))
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+
+from jupychat.exceptions import IdempotencyKeyReusedError
+from jupychat.idempotency import IdempotencyCache
+
+
+class IdempotencyCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_with_a_key_run_once(self):
+        cache = IdempotencyCache()
+        calls = 0
+
+        async def run():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(cache.run("k1", "key", "code", run) for _ in range(3)))
+
+        self.assertEqual(calls, 1)
+        self.assertEqual(results, [(1, False), (1, True), (1, True)])
+
+    async def test_finished_result_is_replayed(self):
+        cache = IdempotencyCache()
+        await cache.run("k1", "key", "code", lambda: asyncio.sleep(0, "first"))
+
+        result = await cache.run("k1", "key", "code", lambda: asyncio.sleep(0, "second"))
+
+        self.assertEqual(result, ("first", True))
+
+    async def test_key_reused_for_different_code_is_rejected(self):
+        cache = IdempotencyCache()
+        await cache.run("k1", "key", "code", lambda: asyncio.sleep(0, "first"))
+
+        with self.assertRaises(IdempotencyKeyReusedError) as raised:
+            await cache.run("k1", "key", "other code", lambda: asyncio.sleep(0, "second"))
+        self.assertEqual(raised.exception.status_code, 422)
+
+    async def test_keys_are_scoped_by_user_and_kernel(self):
+        cache = IdempotencyCache()
+        await cache.run("k1", "key", "code", lambda: asyncio.sleep(0, "alice"), user="alice")
+
+        self.assertEqual(
+            await cache.run("k1", "key", "code", lambda: asyncio.sleep(0, "bob"), user="bob"),
+            ("bob", False),
+        )
+        self.assertEqual(
+            await cache.run("k2", "key", "code", lambda: asyncio.sleep(0, "k2"), user="alice"),
+            ("k2", False),
+        )
+
+    async def test_failed_request_runs_again(self):
+        cache = IdempotencyCache()
+
+        async def fail():
+            raise RuntimeError("kernel busy")
+
+        with self.assertRaises(RuntimeError):
+            await cache.run("k1", "key", "code", fail)
+
+        self.assertEqual(
+            await cache.run("k1", "key", "code", lambda: asyncio.sleep(0, "retried")),
+            ("retried", False),
+        )
+
+    async def test_caller_going_away_does_not_cancel_the_request(self):
+        cache = IdempotencyCache()
+        first = asyncio.create_task(
+            cache.run("k1", "key", "code", lambda: asyncio.sleep(0.01, "done"))
+        )
+        await asyncio.sleep(0)
+        first.cancel()
+
+        self.assertEqual(await cache.run("k1", "key", "code", lambda: None), ("done", True))
+
+    async def test_expired_results_are_purged(self):
+        cache = IdempotencyCache(ttl=0)
+        await cache.run("k1", "key", "code", lambda: asyncio.sleep(0, "first"))
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(
+            await cache.run("k1", "key", "other code", lambda: asyncio.sleep(0, "second")),
+            ("second", False),
+        )
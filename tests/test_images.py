@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+
+from jupychat.images import ImageStore
+
+
+class SpoolDirTest(unittest.TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp(prefix="jupychat-test-images-")
+
+    def test_images_spooled_before_a_restart_are_indexed_and_evicted(self):
+        store = ImageStore(max_bytes=250, spool_dir=self.spool_dir)
+        for index in range(3):
+            store.put(f"{index:032x}", bytes(100))
+        self.assertEqual(len(os.listdir(self.spool_dir)), 2)
+
+        restarted = ImageStore(max_bytes=150, spool_dir=self.spool_dir)
+
+        self.assertEqual(restarted.stats.resident_bytes, 100)
+        image = restarted.get_image(f"image-{2:032x}.png")
+        self.assertEqual(image.etag, f"{2:032x}")
+        self.assertEqual(os.listdir(self.spool_dir), [os.path.basename(image.path)])
+
+    def test_workers_sharing_a_spool_dir_serve_each_others_images(self):
+        first = ImageStore(max_bytes=100, spool_dir=self.spool_dir)
+        second = ImageStore(max_bytes=100, spool_dir=self.spool_dir)
+        image = first.put("a" * 32, bytes(100))
+
+        # Another worker serves it from the file, and using it keeps the first from deleting it
+        self.assertEqual(second.get_image("image-" + "a" * 32 + ".png").path, image.path)
+        first.put("b" * 32, bytes(100))
+        self.assertTrue(os.path.exists(image.path))
+
+        # Once the last worker to use it evicts it, the file is gone
+        second.put("c" * 32, bytes(100))
+        self.assertFalse(os.path.exists(image.path))
+        with self.assertRaises(KeyError):
+            first.get_image("image-" + "a" * 32 + ".png")
+
+
+if __name__ == "__main__":
+    unittest.main()
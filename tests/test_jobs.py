@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+
+from benchmarks.fake_kernel import FakeMultiKernelManager, FakeSidecarClient
+from jupychat.jobs import JobManager
+from jupychat.models import CreateKernelRequest, JobStatus, RunCellRequest
+from tests.test_kernels import build_client
+
+
+class BlockingSidecarClient(FakeSidecarClient):
+    """Runs `block` cells until `released` is set."""
+
+    released: asyncio.Event
+
+    async def _execute(self, code, handlers, stop_on_error) -> None:
+        if code == "block":
+            await self.released.wait()
+        await super()._execute(code, handlers, stop_on_error)
+
+
+class InterruptingMultiKernelManager(FakeMultiKernelManager):
+    async def interrupt_kernel(self, kernel_id: str) -> None:
+        BlockingSidecarClient.released.set()
+
+
+class InterruptJobTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        BlockingSidecarClient.released = asyncio.Event()
+
+    async def start(self, mkm: FakeMultiKernelManager) -> tuple[JobManager, str]:
+        self.kernel_client = build_client(mkm, sidecar_client_class=BlockingSidecarClient)
+        kernel = await self.kernel_client.start_kernel(CreateKernelRequest())
+        return JobManager(self.kernel_client, interrupt_grace=0.1), kernel.kernel_id
+
+    async def asyncTearDown(self):
+        BlockingSidecarClient.released.set()
+        await self.kernel_client.shutdown_all()
+
+    async def test_interrupting_a_queued_job_reports_it_interrupted(self):
+        job_manager, kernel_id = await self.start(InterruptingMultiKernelManager())
+        job_manager.submit(RunCellRequest(kernel_id=kernel_id, code="block"))
+        queued = job_manager.submit(RunCellRequest(kernel_id=kernel_id, code="print(1)"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(job_manager.status(queued), JobStatus.queued)
+
+        job = await job_manager.interrupt(queued.job_id)
+
+        self.assertEqual(job_manager.status(job), JobStatus.interrupted)
+        self.assertIn("before its cell started", job.error)
+
+    async def test_interrupting_a_running_job_waits_for_the_kernel(self):
+        job_manager, kernel_id = await self.start(InterruptingMultiKernelManager())
+        running = job_manager.submit(RunCellRequest(kernel_id=kernel_id, code="block"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(job_manager.status(running), JobStatus.running)
+
+        job = await job_manager.interrupt(running.job_id)
+
+        self.assertEqual(job_manager.status(job), JobStatus.interrupted)
+        self.assertIsNotNone(job.result)
+        self.assertIsNone(job.error)
+
+    async def test_kernel_not_responding_to_the_interrupt(self):
+        job_manager, kernel_id = await self.start(FakeMultiKernelManager())
+        running = job_manager.submit(RunCellRequest(kernel_id=kernel_id, code="block"))
+        await asyncio.sleep(0.01)
+
+        job = await job_manager.interrupt(running.job_id)
+
+        self.assertEqual(job_manager.status(job), JobStatus.interrupted)
+        self.assertIn("did not respond", job.error)
+
+    async def test_job_past_its_deadline_is_interrupted(self):
+        job_manager, kernel_id = await self.start(InterruptingMultiKernelManager())
+        job = job_manager.submit(RunCellRequest(kernel_id=kernel_id, code="block"), timeout=0.05)
+
+        job = await job_manager.wait(job.job_id, timeout=1)
+
+        self.assertEqual(job_manager.status(job), JobStatus.timed_out)
+        self.assertIsNotNone(job.result)
@@ -0,0 +1,137 @@
+import asyncio
+import importlib.util
+import os
+import tempfile
+import unittest
+
+from benchmarks.fake_kernel import FakeMultiKernelManager, FakeSidecarClient
+from jupychat.exceptions import (
+    KernelCulledError,
+    KernelDiedError,
+    KernelLimitError,
+    KernelQuotaError,
+)
+from jupychat.kernels import JupyChatKernelClient, build_kernel_manager
+from jupychat.models import CreateKernelRequest, RunCellRequest, RunCellsRequest
+
+
+def build_client(mkm: FakeMultiKernelManager, **kwargs) -> JupyChatKernelClient:
+    kwargs.setdefault("sidecar_client_class", FakeSidecarClient)
+    return JupyChatKernelClient(
+        mkm, working_dir_root=tempfile.mkdtemp(prefix="jupychat-test-kernels-"), **kwargs
+    )
+
+
+class KernelLimitTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_creates_stay_within_max_kernels(self):
+        mkm = FakeMultiKernelManager(start_latency=0.05)
+        client = build_client(mkm, max_kernels=3)
+
+        results = await asyncio.gather(
+            *(client.start_kernel(CreateKernelRequest()) for _ in range(10)),
+            return_exceptions=True,
+        )
+
+        started = [r for r in results if not isinstance(r, BaseException)]
+        self.assertEqual(len(started), 3)
+        self.assertTrue(all(isinstance(r, KernelLimitError) for r in results if r not in started))
+        self.assertEqual(len(mkm.kernel_ids), 3)
+        await client.shutdown_all()
+
+    async def test_concurrent_creates_by_one_user_stay_within_their_quota(self):
+        mkm = FakeMultiKernelManager(start_latency=0.05)
+        client = build_client(mkm, max_kernels_per_user=2)
+
+        results = await asyncio.gather(
+            *(client.start_kernel(CreateKernelRequest(), user="alice") for _ in range(5)),
+            return_exceptions=True,
+        )
+
+        started = [r for r in results if not isinstance(r, BaseException)]
+        self.assertEqual(len(started), 2)
+        self.assertTrue(all(isinstance(r, KernelQuotaError) for r in results if r not in started))
+        # Other users have their own quota
+        await client.start_kernel(CreateKernelRequest(), user="bob")
+        self.assertEqual(len(mkm.kernel_ids), 3)
+        await client.shutdown_all()
+
+    async def test_user_at_their_quota_loses_their_least_recently_used_idle_kernel(self):
+        client = build_client(FakeMultiKernelManager(), max_kernels_per_user=2)
+        first = await client.start_kernel(CreateKernelRequest(), user="alice")
+        second = await client.start_kernel(CreateKernelRequest(), user="alice")
+        await client.run_cell(RunCellRequest(kernel_id=first.kernel_id, code="1"), user="alice")
+
+        await client.start_kernel(CreateKernelRequest(), user="alice")
+
+        with self.assertRaises(KernelCulledError):
+            await client.run_cell(
+                RunCellRequest(kernel_id=second.kernel_id, code="1"), user="alice"
+            )
+        await client.run_cell(RunCellRequest(kernel_id=first.kernel_id, code="1"), user="alice")
+        await client.shutdown_all()
+
+
+class FailingSidecarClient(FakeSidecarClient):
+    @staticmethod
+    def script(code: str) -> list:
+        if code == "fail":
+            raise RuntimeError("connection lost")
+        return FakeSidecarClient.script(code)
+
+
+class StreamCellsTest(unittest.IsolatedAsyncioTestCase):
+    async def test_failure_ends_the_stream_with_a_status_event(self):
+        client = build_client(FakeMultiKernelManager(), sidecar_client_class=FailingSidecarClient)
+        kernel = await client.start_kernel(CreateKernelRequest())
+
+        events = await client.stream_cells(
+            RunCellsRequest(kernel_id=kernel.kernel_id, cells=["ok", "fail", "skipped"])
+        )
+        statuses = [event async for event in events if event.event == "status"]
+
+        self.assertEqual([(e.cell_index, e.success) for e in statuses], [(0, True), (1, False)])
+        self.assertIn("connection lost", statuses[1].error)
+        await client.shutdown_all()
+
+
+class FailingMultiKernelManager(FakeMultiKernelManager):
+    async def start_kernel(self, kernel_name: str | None = None, **kwargs) -> str:
+        raise RuntimeError("no such kernel spec")
+
+
+class WorkingDirTest(unittest.IsolatedAsyncioTestCase):
+    async def test_failed_start_removes_the_working_dir(self):
+        client = build_client(FailingMultiKernelManager())
+
+        with self.assertRaises(RuntimeError):
+            await client.start_kernel(CreateKernelRequest())
+
+        self.assertEqual(os.listdir(client._working_dir_root), [])
+
+
+@unittest.skipUnless(importlib.util.find_spec("ipykernel"), "needs ipykernel")
+class KernelDeathTest(unittest.IsolatedAsyncioTestCase):
+    async def test_killed_kernel_fails_its_cell(self):
+        # Longer than jupyter_client's restarter takes to replace a dead kernel, were it on
+        client = JupyChatKernelClient(
+            build_kernel_manager(tempfile.mkdtemp(prefix="jupychat-test-connections-")),
+            heartbeat_interval=4,
+            working_dir_root=tempfile.mkdtemp(prefix="jupychat-test-kernels-"),
+        )
+        client.start()
+        kernel = await client.start_kernel(CreateKernelRequest())
+        kill = "import os, signal; os.kill(os.getpid(), signal.SIGKILL)"
+        try:
+            with self.assertRaises(KernelDiedError) as died:
+                await asyncio.wait_for(
+                    client.run_cell(RunCellRequest(kernel_id=kernel.kernel_id, code=kill)), 30
+                )
+            self.assertFalse(died.exception.restarting)
+            with self.assertRaises(KernelDiedError):
+                await client.run_cell(RunCellRequest(kernel_id=kernel.kernel_id, code="1"))
+        finally:
+            await client.shutdown_all()
+
+
+if __name__ == "__main__":
+    unittest.main()
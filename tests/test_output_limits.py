@@ -0,0 +1,123 @@
+import unittest
+
+from jupychat.output_limits import BoundedTextBuffer, MimeBundlePolicy, truncate_html_tables
+
+
+class BoundedTextBufferTest(unittest.TestCase):
+    def collect(self, max_bytes: int | None, *chunks: str) -> BoundedTextBuffer:
+        buffer = BoundedTextBuffer(max_bytes)
+        for chunk in chunks:
+            buffer.append(chunk)
+        return buffer
+
+    def test_without_a_budget_keeps_everything(self):
+        buffer = self.collect(None, "hello ", "world")
+
+        self.assertEqual(buffer.getvalue(), "hello world")
+        self.assertEqual(buffer.elided_bytes, 0)
+
+    def test_within_the_budget_keeps_everything(self):
+        self.assertEqual(self.collect(11, "hello ", "world").getvalue(), "hello world")
+
+    def test_keeps_head_and_tail(self):
+        buffer = self.collect(10, "abcdefghij", "klmnop")
+
+        self.assertEqual(buffer.getvalue(), "abcde\n... [6 bytes elided] ...\nlmnop")
+        self.assertEqual(buffer.elided_bytes, 6)
+
+    def test_tail_is_the_most_recent_text_of_many_chunks(self):
+        buffer = self.collect(10, *(str(i % 10) for i in range(100)))
+
+        self.assertEqual(buffer.getvalue(), "01234\n... [90 bytes elided] ...\n56789")
+
+    def test_characters_cut_at_the_edges_are_dropped(self):
+        # "é" is two bytes, the head keeps 3 bytes and the tail 3
+        buffer = self.collect(6, "é" * 5)
+
+        self.assertEqual(buffer.getvalue(), "é\n... [4 bytes elided] ...\né")
+
+    def test_character_split_between_head_and_tail_is_kept(self):
+        # Nothing is elided, so the two halves of "é" meet again
+        self.assertEqual(self.collect(4, "aé").getvalue(), "aé")
+        self.assertEqual(self.collect(4, "a", "é", "b").getvalue(), "aéb")
+
+
+def html_table(rows: int, columns: int = 2) -> str:
+    header = "<thead><tr>" + "<th>c</th>" * columns + "</tr></thead>"
+    body = "".join(
+        "<tr>" + "".join(f"<td>{row}-{column}</td>" for column in range(columns)) + "</tr>"
+        for row in range(rows)
+    )
+    return f'<table class="dataframe">{header}<tbody>{body}</tbody></table>'
+
+
+class TruncateHtmlTablesTest(unittest.TestCase):
+    def test_keeps_first_and_last_rows(self):
+        truncated = truncate_html_tables(html_table(20, columns=3), 2, 2)
+
+        for row in [0, 1, 18, 19]:
+            self.assertIn(f"<td>{row}-0</td>", truncated)
+        for row in range(2, 18):
+            self.assertNotIn(f"<td>{row}-0</td>", truncated)
+        self.assertIn('<tr><td colspan="3">... 16 rows elided ...</td></tr>', truncated)
+        self.assertTrue(truncated.startswith('<table class="dataframe"><thead>'))
+        self.assertTrue(truncated.endswith("</tbody></table>"))
+
+    def test_short_tables_are_unchanged(self):
+        # Eliding a single row would save nothing
+        for html in [html_table(3), html_table(5), "<p>no table</p>", "<tbody><tr>"]:
+            with self.subTest(html=html):
+                self.assertEqual(truncate_html_tables(html, 2, 2), html)
+
+    def test_every_table_is_truncated(self):
+        truncated = truncate_html_tables(html_table(10) + "<p>between</p>" + html_table(30), 1, 1)
+
+        self.assertIn("... 8 rows elided ...", truncated)
+        self.assertIn("<p>between</p>", truncated)
+        self.assertIn("... 28 rows elided ...", truncated)
+
+
+class MimeBundlePolicyTest(unittest.TestCase):
+    def test_keeps_the_most_useful_representations(self):
+        policy = MimeBundlePolicy(mime_priority=["image/png", "text/plain"], max_mime_types=2)
+        data = {"text/html": "<b>x</b>", "text/plain": "x", "image/png": "iVBOR"}
+
+        self.assertEqual(policy.reduce(data), {"image/png": "iVBOR", "text/plain": "x"})
+
+    def test_unlisted_types_keep_their_order_after_listed_ones(self):
+        policy = MimeBundlePolicy(mime_priority=["text/plain"])
+        data = {"text/latex": "$x$", "text/html": "<b>x</b>", "text/plain": "x"}
+
+        self.assertEqual(list(policy.reduce(data)), ["text/plain", "text/latex", "text/html"])
+
+    def test_large_html_table_is_truncated(self):
+        policy = MimeBundlePolicy(
+            max_representation_bytes=2000, html_table_head_rows=2, html_table_tail_rows=2
+        )
+
+        reduced = policy.reduce({"text/html": html_table(100)})
+
+        self.assertIn("... 96 rows elided ...", reduced["text/html"])
+        self.assertLessEqual(len(reduced["text/html"]), 2000)
+
+    def test_plain_text_keeps_its_start_and_end(self):
+        policy = MimeBundlePolicy(max_representation_bytes=100)
+
+        reduced = policy.reduce({"text/plain": "a" * 50 + "b" * 100 + "c" * 50})
+
+        self.assertTrue(reduced["text/plain"].startswith("a" * 50))
+        self.assertTrue(reduced["text/plain"].endswith("c" * 50))
+
+    def test_representations_that_cant_be_shortened_make_room_for_the_next(self):
+        policy = MimeBundlePolicy(
+            mime_priority=["text/html", "application/json", "text/plain"],
+            max_mime_types=1,
+            max_representation_bytes=100,
+        )
+        data = {
+            "text/html": "<p>" + "x" * 200 + "</p>",
+            "application/json": {"values": list(range(100))},
+            "text/plain": "x",
+        }
+
+        self.assertEqual(policy.reduce(data), {"text/plain": "x"})
@@ -0,0 +1,112 @@
+import unittest
+from unittest import mock
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from jupychat import responses
+from jupychat.responses import CompressionMiddleware
+
+LARGE_TEXT = "hello world " * 200
+
+
+async def large(request):
+    return PlainTextResponse(LARGE_TEXT)
+
+
+async def small(request):
+    return PlainTextResponse("hello")
+
+
+async def image(request):
+    return Response(bytes(4096), media_type="image/png")
+
+
+async def events(request):
+    return Response(f"event: status\ndata: {LARGE_TEXT}\n\n", media_type="text/event-stream")
+
+
+async def streamed(request):
+    async def chunks():
+        yield LARGE_TEXT
+        yield LARGE_TEXT
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+def build_app() -> CompressionMiddleware:
+    routes = [
+        Route(f"/{endpoint.__name__}", endpoint)
+        for endpoint in [large, small, image, events, streamed]
+    ]
+    return CompressionMiddleware(Starlette(routes=routes), minimum_size=1024)
+
+
+class NegotiateTest(unittest.TestCase):
+    @unittest.skipUnless(responses.zstandard, "zstandard is not installed")
+    def test_prefers_zstd_then_gzip(self):
+        middleware = CompressionMiddleware(None)
+        cases = {
+            "gzip, deflate, br": "gzip",
+            "gzip, zstd": "zstd",
+            "zstd;q=0, gzip": "gzip",
+            "gzip;q=0": None,
+            "GZIP;Q=0.5": "gzip",
+            "*": "zstd",
+            "*, zstd;q=0": "gzip",
+            "identity": None,
+            "": None,
+        }
+        for accept_encoding, coding in cases.items():
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(middleware.negotiate(accept_encoding), coding)
+
+    def test_only_gzip_without_zstandard(self):
+        with mock.patch.object(responses, "zstandard", None):
+            self.assertEqual(CompressionMiddleware(None).negotiate("zstd, gzip"), "gzip")
+            self.assertIsNone(CompressionMiddleware(None).negotiate("zstd"))
+
+
+class CompressionMiddlewareTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        transport = httpx.ASGITransport(app=build_app())
+        self.client = httpx.AsyncClient(transport=transport, base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def get(self, path: str, accept_encoding: str) -> httpx.Response:
+        return await self.client.get(path, headers={"Accept-Encoding": accept_encoding})
+
+    async def test_large_response_is_compressed(self):
+        response = await self.get("/large", "gzip")
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertLess(int(response.headers["Content-Length"]), len(LARGE_TEXT))
+        self.assertEqual(response.text, LARGE_TEXT)
+
+    @unittest.skipUnless(responses.zstandard, "zstandard is not installed")
+    async def test_zstd_response(self):
+        response = await self.get("/large", "zstd")
+
+        self.assertEqual(response.headers["Content-Encoding"], "zstd")
+        decompressed = (
+            responses.zstandard.ZstdDecompressor().decompressobj().decompress(response.content)
+        )
+        self.assertEqual(decompressed.decode(), LARGE_TEXT)
+
+    async def test_responses_left_uncompressed(self):
+        cases = [
+            ("/large", "identity"),
+            ("/small", "gzip"),
+            ("/image", "gzip"),
+            ("/events", "gzip"),
+            ("/streamed", "gzip"),
+        ]
+        for path, accept_encoding in cases:
+            with self.subTest(path=path, accept_encoding=accept_encoding):
+                response = await self.get(path, accept_encoding)
+                self.assertNotIn("Content-Encoding", response.headers)
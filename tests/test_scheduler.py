@@ -0,0 +1,107 @@
+import asyncio
+import unittest
+
+from jupychat.scheduler import FairScheduler
+
+
+class FairSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def run_queued(self, scheduler: FairScheduler, users: list[str]) -> list[str]:
+        """Queues a cell per user behind a running one, in order, and returns the order they
+        ran in."""
+        order = []
+        release = asyncio.Event()
+
+        async def blocker():
+            async with scheduler.slot("blocker"):
+                await release.wait()
+
+        async def cell(user: str):
+            async with scheduler.slot(user):
+                order.append(user)
+
+        tasks = [asyncio.create_task(blocker())]
+        for user in users:
+            await asyncio.sleep(0)
+            tasks.append(asyncio.create_task(cell(user)))
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.waiting, len(users))
+
+        release.set()
+        await asyncio.gather(*tasks)
+        return order
+
+    async def test_users_take_turns(self):
+        scheduler = FairScheduler(max_concurrent=1)
+
+        order = await self.run_queued(scheduler, ["a", "a", "a", "b", "b"])
+
+        self.assertEqual(order, ["a", "b", "a", "b", "a"])
+
+    async def test_weights_give_more_cells_per_turn(self):
+        scheduler = FairScheduler(max_concurrent=1, weights={"a": 2})
+
+        order = await self.run_queued(scheduler, ["a", "a", "a", "a", "b", "b", "c"])
+
+        self.assertEqual(order, ["a", "a", "b", "c", "a", "a", "b"])
+
+    async def test_user_at_their_limit_does_not_hold_up_others(self):
+        scheduler = FairScheduler(max_per_user=1)
+        release = asyncio.Event()
+
+        async def hold(user: str):
+            async with scheduler.slot(user):
+                await release.wait()
+
+        first = asyncio.create_task(hold("a"))
+        second = asyncio.create_task(hold("a"))
+        other = asyncio.create_task(hold("b"))
+        await asyncio.sleep(0)
+
+        self.assertEqual((scheduler.running("a"), scheduler.running("b")), (1, 1))
+        self.assertEqual(scheduler.waiting, 1)
+        release.set()
+        await asyncio.gather(first, second, other)
+        self.assertEqual((scheduler.running("a"), scheduler.waiting), (0, 0))
+
+    async def test_cancelled_cells_give_up_their_place(self):
+        scheduler = FairScheduler(max_concurrent=1)
+        release = asyncio.Event()
+        ran = []
+
+        async def cell(user: str):
+            async with scheduler.slot(user):
+                ran.append(user)
+                await release.wait()
+
+        running = asyncio.create_task(cell("a"))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(cell("b"))
+        waiting = asyncio.create_task(cell("c"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+
+        self.assertEqual(scheduler.waiting, 1)
+        release.set()
+        await asyncio.gather(running, waiting)
+        self.assertEqual(ran, ["a", "c"])
+        self.assertEqual((scheduler.running("a"), scheduler.running("c")), (0, 0))
+
+    async def test_cell_cancelled_once_admitted_frees_its_slot(self):
+        scheduler = FairScheduler(max_concurrent=1)
+
+        async def cell(user: str):
+            async with scheduler.slot(user):
+                pass
+
+        async with scheduler.slot("a"):
+            admitted = asyncio.create_task(cell("b"))
+            await asyncio.sleep(0)
+        # Admitted when "a" left its slot, but cancelled before it got to run
+        admitted.cancel()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await admitted
+        self.assertEqual((scheduler.running("b"), scheduler.waiting), (0, 0))
+        async with scheduler.slot("c"):
+            self.assertEqual(scheduler.running("c"), 1)